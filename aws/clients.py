@@ -0,0 +1,167 @@
+# Shared boto3 session and clients used by all modules
+# Clients are created once per service and reused from any thread, and every API call (with its time), retry and S3 byte is counted
+# Calls are rate limited per service and throttled calls are retried (see throttling.py)
+# boto3 is imported on first use, so modules that only import this one start quickly
+import threading, time
+from aws.throttling import ThrottledClient, AdmissionQueue
+
+SETTINGS = {
+    'region': None, # None uses the default region of the environment
+    'max_pool_connections': 50,
+    'connect_timeout': 10, # seconds
+    'read_timeout': 60, # seconds
+    'endpoint_urls': {}, # service name -> endpoint url, e.g. to point S3 at a local stand-in
+    'rate_limits': {'transcribe': 10, 'comprehend': 10, 's3': 1000}, # calls per second of a service or "service.Operation"
+    'concurrency_limits': {'transcription_jobs': 100}, # admission queue name -> holders at the same time
+    'retries': 8, # retries of a throttled call, after those of botocore
+    'backoff_base': 1.0, # seconds
+    'backoff_cap': 60.0 # seconds
+}
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_throttled = {}
+_admissions = {}
+_resources = {}
+_call_counts = {}
+_retry_counts = {}
+_call_seconds = {}
+_byte_counts = {"read": 0, "written": 0}
+
+# S3 operations whose request body is uploaded
+UPLOAD_OPERATIONS = ("PutObject", "UploadPart")
+
+# Changes client settings, clients created before are dropped and rebuilt on next use
+def configure(**settings):
+    global _session
+    for name in settings:
+        if name not in SETTINGS: raise ValueError("unknown AWS client setting: " + name)
+    with _lock:
+        SETTINGS.update(settings)
+        _session = None
+        _clients.clear()
+        _throttled.clear()
+        _admissions.clear()
+        _resources.clear()
+
+# Returns the shared boto3 session
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            import boto3.session
+            _session = boto3.session.Session(region_name=SETTINGS['region'])
+        return _session
+
+# Returns the region of the shared session
+def get_region():
+    return get_session().region_name
+
+def _config():
+    from botocore.config import Config
+    return Config(max_pool_connections=SETTINGS['max_pool_connections'],
+                  connect_timeout=SETTINGS['connect_timeout'],
+                  read_timeout=SETTINGS['read_timeout'])
+
+# counts one API call and the bytes it uploads, registered on every client's before-call event
+def _count_call(model, params=None, context=None, **kwargs):
+    if context is not None: context['call_started'] = time.time()
+    key = (model.service_model.service_name, model.name)
+    written = 0
+    if model.name in UPLOAD_OPERATIONS and params:
+        body = params.get('body')
+        if isinstance(body, str): written = len(body.encode('utf-8'))
+        elif isinstance(body, (bytes, bytearray)): written = len(body)
+        elif hasattr(body, 'seek') and hasattr(body, 'tell'): # botocore wraps str and bytes bodies in a seekable stream
+            position = body.tell()
+            written = body.seek(0, 2) - position
+            body.seek(position)
+    with _lock:
+        _call_counts[key] = _call_counts.get(key, 0) + 1
+        _byte_counts["written"] += written
+
+# counts the time and retries of a call and the bytes of downloaded objects, registered on every client's after-call event
+# the time covers retries but not reading a streamed body
+def _count_response(model, parsed=None, context=None, **kwargs):
+    key = (model.service_model.service_name, model.name)
+    started = (context or {}).get('call_started')
+    parsed = parsed or {}
+    retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+    with _lock:
+        if started: _call_seconds[key] = _call_seconds.get(key, 0.0) + time.time() - started
+        if retries: _retry_counts[key] = _retry_counts.get(key, 0) + retries
+        if model.name == 'GetObject': _byte_counts["read"] += parsed.get('ContentLength') or 0
+
+def _register(client):
+    client.meta.events.register('before-call', _count_call)
+    client.meta.events.register('after-call', _count_response)
+
+# Returns the shared client of a service, boto3 clients are thread-safe
+# The client is wrapped in a ThrottledClient that applies the rate limits and retries of SETTINGS
+def get_client(service):
+    client = _clients.get(service)
+    if client is None:
+        session = get_session()
+        with _lock: # sessions are not thread-safe, so clients are created one at a time
+            if service not in _clients:
+                client = session.client(service, config=_config(), endpoint_url=SETTINGS['endpoint_urls'].get(service))
+                _register(client)
+                _clients[service] = client
+            client = _clients[service]
+    throttled = _throttled.get(service)
+    if throttled is None or throttled.client is not client: # also wraps clients replaced by stand-ins
+        with _lock:
+            throttled = _throttled.get(service)
+            if throttled is None or throttled.client is not client:
+                throttled = ThrottledClient(client, service, SETTINGS['rate_limits'], SETTINGS['retries'],
+                                            SETTINGS['backoff_base'], SETTINGS['backoff_cap'])
+                _throttled[service] = throttled
+    return throttled
+
+# Returns the shared admission queue of a limited resource (e.g. "transcription_jobs"), see SETTINGS['concurrency_limits']
+def get_admission(name):
+    with _lock:
+        if name not in _admissions:
+            _admissions[name] = AdmissionQueue(name, SETTINGS['concurrency_limits'].get(name))
+        return _admissions[name]
+
+# Returns the shared resource of a service (e.g. s3)
+def get_resource(service):
+    resource = _resources.get(service)
+    if resource is not None: return resource
+    session = get_session()
+    with _lock:
+        if service not in _resources:
+            resource = session.resource(service, config=_config(), endpoint_url=SETTINGS['endpoint_urls'].get(service))
+            _register(resource.meta.client)
+            _resources[service] = resource
+        return _resources[service]
+
+# Returns {(service, operation): number of calls} since start or the last reset
+def call_counts():
+    with _lock:
+        return dict(_call_counts)
+
+# Returns {(service, operation): seconds spent in calls} since start or the last reset
+def call_seconds():
+    with _lock:
+        return dict(_call_seconds)
+
+# Returns {(service, operation): number of retries} made by botocore since start or the last reset
+def retry_counts():
+    with _lock:
+        return dict(_retry_counts)
+
+# Returns {"read": bytes, "written": bytes} of S3 objects downloaded and uploaded since start or the last reset
+def byte_counts():
+    with _lock:
+        return dict(_byte_counts)
+
+def reset_call_counts():
+    with _lock:
+        _call_counts.clear()
+        _retry_counts.clear()
+        _call_seconds.clear()
+        _byte_counts["read"] = 0
+        _byte_counts["written"] = 0
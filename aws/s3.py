@@ -0,0 +1,12 @@
+# S3 helpers shared by all modules
+from aws.clients import get_client
+
+# Returns all files under an S3 prefix
+def listS3Files(bucket, prefix):
+    paginator = get_client('s3').get_paginator('list_objects_v2')
+    files = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'][-1] != "/": # don't append parent directory name
+                files.append(obj['Key'])
+    return files
@@ -0,0 +1,153 @@
+# Client-side rate limiting and retries of throttled AWS calls, applied to all clients of aws.clients
+# botocore retries transient errors a few times within seconds; calls that are still throttled (or hit a quota
+# such as Transcribe's concurrent jobs) are retried here with a longer exponential backoff with full jitter
+import threading, time, random, collections, logging
+from metrics.metrics import METRICS
+
+logger = logging.getLogger()
+
+# error codes of calls that are worth retrying later
+THROTTLING_CODES = ("ThrottlingException", "Throttling", "ThrottledException", "TooManyRequestsException", "RequestLimitExceeded",
+                    "LimitExceededException", "SlowDown", "RequestThrottled", "ProvisionedThroughputExceededException")
+TRANSIENT_CODES = ("InternalError", "InternalFailure", "InternalServerException", "InternalServerError", "ServiceUnavailable",
+                   "ServiceUnavailableException", "RequestTimeout", "RequestTimeoutException")
+# botocore exceptions raised when a connection fails or times out
+CONNECTION_ERRORS = ("EndpointConnectionError", "ConnectionClosedError", "ConnectTimeoutError", "ReadTimeoutError")
+
+# client attributes that are passed through without rate limiting
+PASS_THROUGH = ("exceptions", "meta", "can_paginate", "get_waiter")
+
+# Returns the error code of a failed AWS call (e.g. "ThrottlingException"), None for other exceptions
+def error_code(e):
+    response = getattr(e, "response", None)
+    if not isinstance(response, dict): return None
+    return response.get("Error", {}).get("Code")
+
+# Returns True if a failed call can be retried later
+def is_retryable(e):
+    return error_code(e) in THROTTLING_CODES + TRANSIENT_CODES or type(e).__name__ in CONNECTION_ERRORS
+
+# Returns seconds to wait before retry number attempt, exponential backoff with full jitter
+def backoff(attempt, base=1.0, cap=60.0):
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+# Class that allows rate calls per second on average, with bursts of up to burst calls
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # blocks until a call is allowed, returns the seconds waited
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+# Class that admits at most limit holders at a time, in the order they asked (e.g. Transcribe jobs under the
+# account's concurrent job quota); use as a context manager around the life of a job
+class AdmissionQueue:
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.waiting = collections.deque()
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        start = time.time()
+        ticket = object()
+        with self.condition:
+            self.waiting.append(ticket)
+            while self.waiting[0] is not ticket or (self.limit and self.active >= self.limit):
+                self.condition.wait()
+            self.waiting.popleft()
+            self.active += 1
+            self.condition.notify_all()
+        if time.time() - start > 0.001: METRICS.observe("admission", time.time() - start, start, queue=self.name)
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+# Rate limited paginator, each page waits for a token (pages are retried by botocore only)
+class ThrottledPaginator:
+    def __init__(self, paginator, limiter):
+        self.paginator = paginator
+        self.limiter = limiter
+
+    def paginate(self, **kwargs):
+        pages = iter(self.paginator.paginate(**kwargs))
+        while True:
+            self.limiter.wait()
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            yield page
+
+# Token buckets of a service: rate_limits maps "service" and optionally "service.Operation" to calls per second
+class RateLimiter:
+    def __init__(self, service, rate_limits):
+        self.service = service
+        self.buckets = {}
+        for name, rate in (rate_limits or {}).items():
+            if rate and (name == service or name.startswith(service + ".")):
+                self.buckets[name] = TokenBucket(rate)
+
+    # blocks until a call of operation (a client method name or an API operation name) is allowed
+    def wait(self, operation=None):
+        bucket = self.buckets.get(self.service + "." + operation) if operation else None
+        if bucket is None: bucket = self.buckets.get(self.service)
+        if bucket is not None: bucket.acquire()
+
+# Wraps a client (boto3 or a stand-in): method calls wait for the rate limiter and throttled calls are retried
+class ThrottledClient:
+    def __init__(self, client, service, rate_limits=None, retries=8, backoff_base=1.0, backoff_cap=60.0):
+        self.client = client
+        self.service = service
+        self.limiter = RateLimiter(service, rate_limits)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if name.startswith("_") or name in PASS_THROUGH or not callable(attribute): return attribute
+        if name == "get_paginator":
+            return lambda operation: ThrottledPaginator(attribute(operation), self.limiter)
+        return lambda *args, **kwargs: self.call(name, attribute, *args, **kwargs)
+
+    # calls method, retrying it while it is throttled
+    def call(self, name, method, *args, **kwargs):
+        operation = "".join(part.capitalize() for part in name.split("_")) # e.g. start_transcription_job -> StartTranscriptionJob
+        for attempt in range(self.retries + 1):
+            self.limiter.wait(operation)
+            try:
+                return method(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.retries or not is_retryable(e): raise
+                delay = backoff(attempt, self.backoff_base, self.backoff_cap)
+                METRICS.count("aws.throttled." + self.service + "." + operation)
+                logger.warning(self.service + "." + operation + " " + (error_code(e) or type(e).__name__) + ", retry " + \
+                               str(attempt + 1) + " in " + str(round(delay, 1)) + "s")
+                time.sleep(delay)
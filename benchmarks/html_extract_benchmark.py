@@ -0,0 +1,81 @@
+# Micro-benchmark of sentence extraction from saved Wikipedia pages: get_data (BeautifulSoup) against html_extract
+# Usage:
+#   python benchmarks/html_extract_benchmark.py --save pages/ Cell_(biology) Protein DNA   # download pages once
+#   python benchmarks/html_extract_benchmark.py pages/ [--repeat 3] [--processes 4]
+import sys, os, time, argparse
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_download.wiki_data import get_data
+from data_download.downloader import WikiDownloader, KeywordResult
+from data_download import html_extract
+
+# Downloads the pages of keywords as <keyword>.html files
+def save_pages(directory, keywords):
+    os.makedirs(directory, exist_ok=True)
+    downloader = WikiDownloader()
+    for keyword in keywords:
+        html = downloader.fetch(keyword, KeywordResult(keyword))
+        if html is None:
+            print("could not download " + keyword)
+            continue
+        with open(os.path.join(directory, keyword + ".html"), "w", encoding="utf-8") as f:
+            f.write(html)
+    downloader.close()
+
+def load_pages(directory):
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".html"):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                pages.append((name[:-len(".html")], f.read()))
+    return pages
+
+# Returns the best wall-clock time of repeat runs of fn over all pages, and the sentences of the last run
+def timed(fn, pages, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sentences = [fn(html) for keyword, html in pages]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, sentences
+
+def timed_processes(pages, repeat, processes):
+    best = None
+    with ProcessPoolExecutor(processes) as executor:
+        list(executor.map(html_extract.parse_page, [k for k, h in pages], [h for k, h in pages])) # starts the processes
+        for _ in range(repeat):
+            start = time.perf_counter()
+            sentences = list(executor.map(html_extract.parse_page, [k for k, h in pages], [h for k, h in pages]))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best, sentences
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark HTML to sentence extraction")
+    parser.add_argument("directory", help="directory of saved .html pages")
+    parser.add_argument("keywords", nargs="*", help="keywords to download with --save")
+    parser.add_argument("--save", action="store_true", help="download the pages of keywords into directory and exit")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    if args.save:
+        save_pages(args.directory, args.keywords)
+        sys.exit(0)
+
+    pages = load_pages(args.directory)
+    size = sum(len(html) for keyword, html in pages)
+    print(str(len(pages)) + " pages, " + str(round(size / 1e6, 1)) + " MB, parser: " + ("lxml" if html_extract.lxml else "streaming html.parser"))
+    html_extract.get_sentence_tokenizer() # loaded once, outside of the timings
+
+    soup_time, soup_sentences = timed(get_data, pages, args.repeat)
+    fast_time, fast_sentences = timed(html_extract.extract_sentences, pages, args.repeat)
+    pool_time, pool_sentences = timed_processes(pages, args.repeat, args.processes)
+    for name, elapsed in [("get_data (BeautifulSoup)", soup_time), ("extract_sentences", fast_time), \
+                          ("extract_sentences, " + str(args.processes) + " processes", pool_time)]:
+        print(name.ljust(40) + str(round(elapsed, 3)).rjust(8) + " s  " + str(round(soup_time / elapsed, 1)).rjust(5) + "x")
+
+    differences = [keyword for (keyword, html), a, b in zip(pages, soup_sentences, fast_sentences) if a != b]
+    print("pages with different sentences: " + (", ".join(differences) if differences else "none"))
@@ -0,0 +1,142 @@
+# End-to-end and component benchmarks against local stand-ins (see stand_ins.py), no AWS or network access needed
+# Reports wall-clock, API calls and peak Python memory (tracemalloc) for full runs and for the hot components
+# Usage: python benchmarks/run_benchmarks.py [--folders 20] [--words 2000] [--self-heal] [--json report.json]
+#        [--throttle-rate 0.1] [--job-limit 5] to inject throttling errors and a Transcribe concurrent job quota
+# NLTK data (punkt, stopwords) must be installed locally, see README.md
+import sys, os, time, json, random, argparse, logging, tracemalloc, resource
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import stand_ins
+from benchmarks.stand_ins import S3StandIn, TranscribeStandIn, ComprehendStandIn, WikiStandIn
+
+BUCKET = "benchmark-bucket"
+BUCKET_PREFIX = "benchmark/"
+# quick polling, stand-in jobs finish in seconds rather than minutes
+POLL_OPTIONS = {"min_interval": 0.05, "max_interval": 0.5, "model_min_interval": 0.1, "model_max_interval": 1}
+
+# Runs fn once and returns a result row: wall-clock seconds, peak traced memory and API calls made by fn
+def measure(name, fn, services=()):
+    before = stand_ins.call_counts(*services)
+    tracemalloc.start()
+    start = time.perf_counter()
+    error = None
+    try:
+        fn()
+    except LookupError as e: # missing NLTK data
+        error = str(e).strip().splitlines()[0]
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    after = stand_ins.call_counts(*services)
+    calls = dict((service + "." + operation, count - before.get((service, operation), 0)) for (service, operation), count in after.items() \
+                 if count != before.get((service, operation), 0))
+    return {"name": name, "seconds": elapsed, "peak_mb": peak / 2**20, "api_calls": calls, "error": error}
+
+def component_benchmarks(args, texts):
+    from data_preparation.normalize_text import NormalizeText
+    from wer.asr import AsrEval
+    from wer.word_errors import WordErrors
+    from data_download.wiki_data import get_data
+    from data_download.html_extract import extract_sentences
+    from orchestrator.run_store import RunStore
+    from orchestrator.orchestrator import Orchestrator
+    from orchestrator.leaderboard import Leaderboard
+
+    rng = random.Random(1)
+    normalizer = NormalizeText()
+    references = [normalizer.normalize(text) for text in texts]
+    hypotheses = [" ".join(w for w in ref.split() if rng.random() > 0.1) for ref in references]
+    rows = []
+    rows.append(measure("NormalizeText.normalize", lambda: [normalizer.normalize(text) for text in texts]))
+    results = []
+    rows.append(measure("AsrEval.evaluate", lambda: results.extend(AsrEval().evaluate(r, h) for r, h in zip(references, hypotheses))))
+    rows.append(measure("WordErrors.missed_words", lambda: [WordErrors.from_alignment(result.alignment).missed_words() for result in results]))
+
+    wiki = WikiStandIn(paragraphs=args.paragraphs)
+    pages = [wiki.page("Keyword_" + str(i)) for i in range(args.keywords)]
+    wiki.close()
+    rows.append(measure("get_data", lambda: [get_data(page) for page in pages]))
+    rows.append(measure("html_extract.extract_sentences", lambda: [extract_sentences(page) for page in pages]))
+
+    s3 = S3StandIn()
+    stand_ins.install(s3)
+    store = RunStore(BUCKET, BUCKET_PREFIX + "result/runs/")
+    for i in range(args.leaderboard_rows):
+        store.append(["clm-model-" + str(i % 20) if i % 3 else "ST", "folder-" + str(i // 20), "%.3f" % rng.uniform(5, 30), "", ""])
+    store.flush("benchmark")
+    orc = Orchestrator(BUCKET, BUCKET_PREFIX + "keywords/", BUCKET_PREFIX + "training_data/", BUCKET_PREFIX + "output/", BUCKET_PREFIX, \
+                       BUCKET_PREFIX + "result/")
+    rows.append(measure("Leaderboard.from_rows (" + str(args.leaderboard_rows) + " rows)", lambda: Leaderboard.from_rows(store.rows)))
+    rows.append(measure("saveLeaderboard refresh (" + str(args.leaderboard_rows) + " rows)", lambda: orc.saveLeaderboard(folders=False), [s3]))
+    rows.append(measure("saveLeaderboard with folders (" + str(args.leaderboard_rows) + " rows)", orc.saveLeaderboard, [s3]))
+    return rows
+
+def full_run(args, self_heal):
+    from orchestrator.orchestrator import Orchestrator
+    s3 = S3StandIn()
+    transcribe = TranscribeStandIn(s3, job_delay=args.job_delay, model_delay=args.model_delay, job_limit=args.job_limit)
+    comprehend = ComprehendStandIn()
+    services = [s3, transcribe, comprehend]
+    for service in services:
+        service.inject_throttling(args.throttle_rate)
+    stand_ins.install(s3, transcribe, comprehend)
+    stand_ins.make_inputs(s3, BUCKET, BUCKET_PREFIX, args.folders, args.words, args.keywords)
+    wiki = WikiStandIn(paragraphs=args.paragraphs)
+    def run():
+        orc = Orchestrator(BUCKET, BUCKET_PREFIX + "keywords/", BUCKET_PREFIX + "training_data/", BUCKET_PREFIX + "output/", BUCKET_PREFIX, \
+                           BUCKET_PREFIX + "result/")
+        orc.run(self_heal=self_heal, role_arn="arn:aws:iam::000000000000:role/benchmark", max_in_flight=args.max_in_flight, \
+                wiki_options={"base_url": wiki.base_url}, poll_options=POLL_OPTIONS)
+    name = "Orchestrator.run (" + str(args.folders) + " folders" + (", self-heal" if self_heal else "") + ")"
+    row = measure(name, run, services)
+    row["wiki_requests"] = wiki.requests
+    row["s3_bytes_read"] = s3.bytes_read
+    row["s3_bytes_written"] = s3.bytes_written
+    row["throttled_calls"] = sum(sum(service.throttled.values()) for service in services)
+    row["max_running_jobs"] = transcribe.max_running
+    wiki.close()
+    return row
+
+def print_rows(rows):
+    print("benchmark".ljust(48) + "seconds".rjust(10) + "peak MB".rjust(10) + "API calls".rjust(11))
+    for row in rows:
+        if row["error"]:
+            print(row["name"].ljust(48) + "  skipped: " + row["error"])
+            continue
+        print(row["name"].ljust(48) + ("%.3f" % row["seconds"]).rjust(10) + ("%.1f" % row["peak_mb"]).rjust(10) + str(sum(row["api_calls"].values())).rjust(11))
+        for operation, count in sorted(row["api_calls"].items()):
+            print("    " + operation.ljust(44) + str(count).rjust(31))
+        if row.get("throttled_calls"): print("    " + "throttled calls (retried)".ljust(44) + str(row["throttled_calls"]).rjust(31))
+        if "max_running_jobs" in row: print("    " + "most Transcribe jobs running at once".ljust(44) + str(row["max_running_jobs"]).rjust(31))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks with local AWS and Wikipedia stand-ins")
+    parser.add_argument("--folders", type=int, default=20, help="input folders of a full run")
+    parser.add_argument("--words", type=int, default=2000, help="words per ground truth")
+    parser.add_argument("--keywords", type=int, default=30)
+    parser.add_argument("--paragraphs", type=int, default=20, help="paragraphs per Wikipedia page")
+    parser.add_argument("--leaderboard-rows", type=int, default=100000)
+    parser.add_argument("--job-delay", type=float, default=1.0, help="seconds until a Transcribe job completes")
+    parser.add_argument("--model-delay", type=float, default=2.0, help="seconds until a CLM is trained")
+    parser.add_argument("--max-in-flight", type=int, default=10)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of stand-in calls failing with ThrottlingException")
+    parser.add_argument("--job-limit", type=int, help="Transcribe stand-in quota of concurrent jobs, also set as the admission limit")
+    parser.add_argument("--self-heal", action="store_true", help="also benchmark a run that downloads pages and trains a CLM")
+    parser.add_argument("--skip-components", action="store_true")
+    parser.add_argument("--json", metavar="FILE", help="also write the results as JSON")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR if args.throttle_rate or args.job_limit else logging.WARNING)
+    from aws import clients
+    # quick retries, stand-in calls are not throttled for long
+    clients.configure(backoff_base=0.01, backoff_cap=0.2, concurrency_limits={'transcription_jobs': args.job_limit})
+
+    rng = random.Random(0)
+    texts = [stand_ins.synthetic_text(args.words, stand_ins.domain_words(50), rng) for _ in range(args.folders)]
+    rows = [] if args.skip_components else component_benchmarks(args, texts)
+    rows.append(full_run(args, self_heal=False))
+    if args.self_heal: rows.append(full_run(args, self_heal=True))
+    print_rows(rows)
+    print("max RSS: %.1f MB" % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=1)
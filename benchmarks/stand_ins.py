@@ -0,0 +1,458 @@
+# In-memory stand-ins for S3, Transcribe and Comprehend, a local Wikipedia HTTP server and synthetic data,
+# so whole runs can be measured without AWS or network access
+# Stand-ins replace the shared clients of aws.clients with install(), and count their API calls themselves
+# They can inject throttling errors (inject_throttling) to exercise the retries of aws.throttling
+import io, json, time, random, hashlib, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from aws import clients
+
+COMMON_WORDS = ("the of and to in is was for on that with as by at from it an be this which are or his has have "
+                "had not were but they one their its first new also after been other more two who her into when "
+                "there time can all during some would most only over such these many than then about under").split()
+SYLLABLES = "ba co de fi gu ka le mi no pu ra se ti vo xa ze lo ny cy th ph ol an ex ur in".split()
+
+# Returns n made-up domain words, the same ones for the same seed
+def domain_words(n, seed=0):
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 5))))
+    return sorted(words)
+
+# Returns a text of n words mixing common words with domain words
+def synthetic_text(n, vocabulary, rng, sentence_length=12):
+    words = []
+    for i in range(n):
+        words.append(rng.choice(vocabulary) if rng.random() < 0.3 else rng.choice(COMMON_WORDS))
+        if i % sentence_length == sentence_length - 1: words[-1] += "."
+    return " ".join(words)
+
+class NoSuchKey(Exception):
+    pass
+
+class ConflictException(Exception):
+    pass
+
+class BadRequestException(Exception):
+    pass
+
+# error with an AWS error code, like botocore's ClientError
+class ClientError(Exception):
+    def __init__(self, code, operation):
+        Exception.__init__(self, "An error occurred (" + code + ") when calling the " + operation + " operation")
+        self.response = {"Error": {"Code": code, "Message": code}}
+        self.operation_name = operation
+
+class LimitExceededException(ClientError):
+    def __init__(self, operation):
+        ClientError.__init__(self, "LimitExceededException", operation)
+
+# exception classes, found as client.exceptions.<name> like on boto3 clients
+class Exceptions:
+    NoSuchKey = NoSuchKey
+    ConflictException = ConflictException
+    BadRequestException = BadRequestException
+    LimitExceededException = LimitExceededException
+
+# Base of the stand-ins: counts API calls per operation, throttled ones included
+class StandIn:
+    service = None
+    exceptions = Exceptions
+
+    def __init__(self):
+        self.calls = {}
+        self.throttled = {}
+        self.throttle_rate = 0.0
+        self.throttle_code = "ThrottlingException"
+        self.throttle_operations = None
+        self.throttle_rng = random.Random(0)
+        self.lock = threading.Lock()
+
+    # makes a share rate of the calls (of operations, or of all operations) fail with error code
+    def inject_throttling(self, rate, code="ThrottlingException", operations=None, seed=0):
+        with self.lock:
+            self.throttle_rate = rate
+            self.throttle_code = code
+            self.throttle_operations = operations
+            self.throttle_rng = random.Random(seed)
+
+    def count(self, operation):
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            throttled = (self.throttle_operations is None or operation in self.throttle_operations) and \
+                        self.throttle_rng.random() < self.throttle_rate
+            if throttled: self.throttled[operation] = self.throttled.get(operation, 0) + 1
+        if throttled: raise ClientError(self.throttle_code, operation)
+
+# Streaming body of get_object
+class Body(io.BytesIO):
+    def iter_lines(self):
+        for line in self.read().splitlines():
+            yield line
+
+# In-memory S3
+class S3StandIn(StandIn):
+    service = "s3"
+    PAGE_SIZE = 1000
+
+    def __init__(self):
+        StandIn.__init__(self)
+        self.objects = {} # (bucket, key) -> bytes
+        self.uploads = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def put(self, bucket, key, body):
+        if isinstance(body, str): body = body.encode('utf-8')
+        elif hasattr(body, "read"): body = body.read()
+        with self.lock:
+            self.objects[(bucket, key)] = bytes(body)
+            self.bytes_written += len(body)
+
+    def get(self, bucket, key):
+        with self.lock:
+            if (bucket, key) not in self.objects: raise NoSuchKey(key)
+            return self.objects[(bucket, key)]
+
+    def put_object(self, Body, Bucket, Key, **kwargs):
+        self.count("PutObject")
+        self.put(Bucket, Key, Body)
+        return {"ETag": '"' + hashlib.md5(self.get(Bucket, Key)).hexdigest() + '"'}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self.count("GetObject")
+        body = self.get(Bucket, Key)
+        with self.lock:
+            self.bytes_read += len(body)
+        return {"Body": Body(body), "ContentLength": len(body)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self.count("HeadObject")
+        body = self.get(Bucket, Key)
+        return {"ETag": '"' + hashlib.md5(body).hexdigest() + '"', "ContentLength": len(body)}
+
+    def delete_objects(self, Bucket, Delete):
+        self.count("DeleteObjects")
+        with self.lock:
+            for obj in Delete["Objects"]: self.objects.pop((Bucket, obj["Key"]), None)
+        return {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.count("CreateMultipartUpload")
+        with self.lock:
+            upload_id = str(len(self.uploads))
+            self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.count("UploadPart")
+        with self.lock:
+            self.uploads[UploadId][PartNumber] = bytes(Body)
+        return {"ETag": '"' + str(PartNumber) + '"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.count("CompleteMultipartUpload")
+        with self.lock:
+            parts = self.uploads.pop(UploadId)
+        self.put(Bucket, Key, b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"]))
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.count("AbortMultipartUpload")
+        with self.lock:
+            self.uploads.pop(UploadId, None)
+        return {}
+
+    def get_paginator(self, name):
+        return ListPaginator(self)
+
+# Paginator of list_objects_v2, with Delimiter and StartAfter support
+class ListPaginator:
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def paginate(self, Bucket, Prefix="", Delimiter=None, StartAfter="", **kwargs):
+        with self.s3.lock:
+            keys = sorted(key for bucket, key in self.s3.objects if bucket == Bucket and key.startswith(Prefix) and key > StartAfter)
+            sizes = dict((key, len(self.s3.objects[(Bucket, key)])) for key in keys)
+        entries = []
+        prefixes = set()
+        for key in keys:
+            rest = key[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                common = Prefix + rest.split(Delimiter)[0] + Delimiter
+                if common not in prefixes:
+                    prefixes.add(common)
+                    entries.append(("prefix", common))
+            else:
+                entries.append(("key", key))
+        for start in range(0, max(len(entries), 1), self.s3.PAGE_SIZE):
+            while True:
+                try:
+                    self.s3.count("ListObjectsV2")
+                    break
+                except ClientError: # pages of boto3 paginators are retried by botocore
+                    pass
+            page = entries[start:start + self.s3.PAGE_SIZE]
+            yield {
+                "Contents": [{"Key": key, "Size": sizes[key], "ETag": '"' + str(sizes[key]) + '"'} for kind, key in page if kind == "key"],
+                "CommonPrefixes": [{"Prefix": key} for kind, key in page if kind == "prefix"]
+            }
+
+# Transcribe stand-in: jobs complete job_delay seconds after they start and write an output JSON to the S3 stand-in
+# Synthetic media files hold the spoken text, which is "recognized" with a word error rate (lower for CLM jobs)
+# With job_limit, starting more jobs than that at the same time fails with LimitExceededException like the account quota
+class TranscribeStandIn(StandIn):
+    service = "transcribe"
+
+    def __init__(self, s3, job_delay=1.0, model_delay=2.0, st_error_rate=0.1, clm_error_rate=0.05, job_limit=None, fail_rate=0.0):
+        StandIn.__init__(self)
+        self.fail_rate = fail_rate
+        self.job_limit = job_limit
+        self.max_running = 0
+        self.s3 = s3
+        self.job_delay = job_delay
+        self.model_delay = model_delay
+        self.st_error_rate = st_error_rate
+        self.clm_error_rate = clm_error_rate
+        self.jobs = {}
+        self.models = {}
+
+    def start_transcription_job(self, TranscriptionJobName, LanguageCode, Media, OutputBucketName, OutputKey, ModelSettings=None, **kwargs):
+        self.count("StartTranscriptionJob")
+        with self.lock:
+            if TranscriptionJobName in self.jobs: raise ConflictException(TranscriptionJobName)
+            running = sum(1 for job in self.jobs.values() if job["status"] == "IN_PROGRESS" and time.time() < job["started"] + self.job_delay)
+            if self.job_limit and running >= self.job_limit: raise LimitExceededException("StartTranscriptionJob")
+            self.max_running = max(self.max_running, running + 1)
+            self.jobs[TranscriptionJobName] = {"status": "IN_PROGRESS", "started": time.time(), "media": Media["MediaFileUri"],
+                "bucket": OutputBucketName, "key": OutputKey, "clm": (ModelSettings or {}).get("LanguageModelName")}
+        return {"TranscriptionJob": {"TranscriptionJobName": TranscriptionJobName, "TranscriptionJobStatus": "IN_PROGRESS"}}
+
+    # completes a job once its delay has passed
+    def __advance(self, name):
+        job = self.jobs[name]
+        if job["status"] != "IN_PROGRESS" or time.time() < job["started"] + self.job_delay: return job["status"]
+        rng = random.Random(name)
+        if rng.random() < self.fail_rate:
+            job["status"] = "FAILED"
+            job["reason"] = "The media file could not be decoded."
+            return job["status"]
+        bucket, key = job["media"][len("s3://"):].split("/", 1)
+        words = self.s3.get(bucket, key).decode('utf-8').split()
+        error_rate = self.st_error_rate
+        if job["clm"]:
+            model = self.models.get(job["clm"], {})
+            # NarrowBand models do worse on the (wide band) synthetic media, tuning data helps a little
+            error_rate = self.clm_error_rate * (1.5 if model.get("base") == "NarrowBand" else 1.0) * (0.8 if model.get("tuned") else 1.0)
+        recognized = []
+        for word in words:
+            if rng.random() >= error_rate: recognized.append(word)
+            elif rng.random() < 0.5: recognized.append(word[::-1]) # substitution, a deletion otherwise
+        items = [{"start_time": str(i * 0.4), "end_time": str(i * 0.4 + 0.35), "type": "pronunciation",
+                  "alternatives": [{"confidence": "0.9", "content": word}]} for i, word in enumerate(recognized)]
+        output = {"jobName": name, "status": "COMPLETED", "results": {"transcripts": [{"transcript": " ".join(recognized)}], "items": items}}
+        self.s3.put(job["bucket"], job["key"], json.dumps(output))
+        job["status"] = "COMPLETED"
+        return job["status"]
+
+    def get_transcription_job(self, TranscriptionJobName):
+        self.count("GetTranscriptionJob")
+        with self.lock:
+            if TranscriptionJobName not in self.jobs: raise BadRequestException(TranscriptionJobName)
+            job = {"TranscriptionJobName": TranscriptionJobName, "TranscriptionJobStatus": self.__advance(TranscriptionJobName)}
+            if "reason" in self.jobs[TranscriptionJobName]: job["FailureReason"] = self.jobs[TranscriptionJobName]["reason"]
+            return {"TranscriptionJob": job}
+
+    def list_transcription_jobs(self, JobNameContains="", MaxResults=100, NextToken=None, **kwargs):
+        self.count("ListTranscriptionJobs")
+        with self.lock:
+            names = sorted(name for name in self.jobs if JobNameContains in name)
+            start = int(NextToken or 0)
+            summaries = [{"TranscriptionJobName": name, "TranscriptionJobStatus": self.__advance(name)} for name in names[start:start + MaxResults]]
+        response = {"TranscriptionJobSummaries": summaries}
+        if start + MaxResults < len(names): response["NextToken"] = str(start + MaxResults)
+        return response
+
+    def delete_transcription_job(self, TranscriptionJobName):
+        self.count("DeleteTranscriptionJob")
+        with self.lock:
+            self.jobs.pop(TranscriptionJobName, None)
+
+    def create_language_model(self, LanguageCode, BaseModelName, ModelName, InputDataConfig, **kwargs):
+        self.count("CreateLanguageModel")
+        with self.lock:
+            if ModelName in self.models: raise ConflictException(ModelName)
+            self.models[ModelName] = {"started": time.time(), "base": BaseModelName, "data": InputDataConfig["S3Uri"],
+                                      "tuned": "TuningDataS3Uri" in InputDataConfig}
+        return {"ModelName": ModelName, "ModelStatus": "IN_PROGRESS"}
+
+    def __model_status(self, name):
+        return "COMPLETED" if time.time() >= self.models[name]["started"] + self.model_delay else "IN_PROGRESS"
+
+    def describe_language_model(self, ModelName):
+        self.count("DescribeLanguageModel")
+        with self.lock:
+            if ModelName not in self.models: raise BadRequestException(ModelName)
+            return {"LanguageModel": {"ModelName": ModelName, "ModelStatus": self.__model_status(ModelName)}}
+
+    def list_language_models(self, NameContains="", MaxResults=100, NextToken=None, **kwargs):
+        self.count("ListLanguageModels")
+        with self.lock:
+            names = sorted(name for name in self.models if NameContains in name)
+            start = int(NextToken or 0)
+            models = [{"ModelName": name, "ModelStatus": self.__model_status(name)} for name in names[start:start + MaxResults]]
+        response = {"Models": models}
+        if start + MaxResults < len(names): response["NextToken"] = str(start + MaxResults)
+        return response
+
+    def delete_language_model(self, ModelName):
+        self.count("DeleteLanguageModel")
+        with self.lock:
+            self.models.pop(ModelName, None)
+
+# Comprehend stand-in: tags words of four or more letters as nouns, other words as determiners
+class ComprehendStandIn(StandIn):
+    service = "comprehend"
+
+    def __tokens(self, text):
+        tokens = []
+        offset = 0
+        for word in text.split():
+            begin = text.index(word, offset)
+            offset = begin + len(word)
+            token = word.strip(",.")
+            if token:
+                tag = "NOUN" if len(token) >= 4 else "DET"
+                tokens.append({"Text": token, "BeginOffset": begin, "EndOffset": begin + len(token), "PartOfSpeech": {"Tag": tag, "Score": 0.9}})
+        return tokens
+
+    def detect_syntax(self, Text, LanguageCode):
+        self.count("DetectSyntax")
+        return {"SyntaxTokens": self.__tokens(Text)}
+
+    def batch_detect_syntax(self, TextList, LanguageCode):
+        self.count("BatchDetectSyntax")
+        return {"ResultList": [{"Index": i, "SyntaxTokens": self.__tokens(text)} for i, text in enumerate(TextList)], "ErrorList": []}
+
+# Local Wikipedia stand-in: serves a synthetic page for any /wiki/<keyword>, with ETags for conditional GETs
+# fail(keyword, statuses) makes the next requests of a keyword answer with those statuses first (0 drops the connection),
+# max_active is the highest number of requests served at the same time
+class WikiStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, paragraphs=20, words_per_paragraph=120, latency=0.0, vocabulary=None):
+        ThreadingHTTPServer.__init__(self, ("127.0.0.1", 0), WikiHandler)
+        self.paragraphs = paragraphs
+        self.words_per_paragraph = words_per_paragraph
+        self.latency = latency
+        self.vocabulary = vocabulary or domain_words(500)
+        self.requests = 0
+        self.failures = {} # keyword -> statuses of its next requests
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.05, ), name="wiki-stand-in", daemon=True) # quick shutdown
+        self.thread.start()
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:" + str(self.server_address[1]) + "/wiki/"
+
+    # returns the synthetic page of a keyword, the same one on every request
+    def page(self, keyword):
+        rng = random.Random(keyword)
+        vocabulary = self.vocabulary + [keyword.replace("_", " ")] * 20
+        body = "".join("<p>" + synthetic_text(self.words_per_paragraph, vocabulary, rng) + "[" + str(i + 1) + "]</p>\n<div class=\"nav\">menu</div>\n"
+                       for i in range(self.paragraphs))
+        return "<html><head><title>" + keyword + "</title></head><body>\n" + body + "</body></html>"
+
+    # makes the next requests of keyword answer with statuses, one per request, before its page is served again
+    def fail(self, keyword, statuses):
+        with self.lock:
+            self.failures[keyword] = list(statuses)
+
+    # returns the status the next request of keyword fails with, None to serve the page
+    def next_failure(self, keyword):
+        with self.lock:
+            statuses = self.failures.get(keyword)
+            return statuses.pop(0) if statuses else None
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+class WikiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like Wikipedia
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            self.respond()
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def respond(self):
+        if self.server.latency: time.sleep(self.server.latency)
+        from urllib.parse import unquote
+        keyword = unquote(self.path.rsplit("/", 1)[-1])
+        failure = self.server.next_failure(keyword)
+        if failure == 0: # connection dropped without an answer
+            self.close_connection = True
+            return
+        if failure:
+            self.send_response(failure)
+            if failure == 429: self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = self.server.page(keyword).encode('utf-8')
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+# Replaces the shared AWS clients with stand-ins
+def install(*stand_ins):
+    for stand_in in stand_ins:
+        clients._clients[stand_in.service] = stand_in
+
+# Returns {(service, operation): calls} of stand-ins
+def call_counts(*stand_ins):
+    counts = {}
+    for stand_in in stand_ins:
+        with stand_in.lock:
+            for operation, count in stand_in.calls.items(): counts[(stand_in.service, operation)] = count
+    return counts
+
+# Writes synthetic input folders (media holding the spoken text, and its ground truth) and a keywords file
+# returns the ground truth texts
+def make_inputs(s3, bucket, bucket_prefix, folders=10, words=1000, keywords=20, seed=0):
+    rng = random.Random(seed)
+    vocabulary = domain_words(max(keywords, 50), seed)
+    texts = []
+    for i in range(folders):
+        text = synthetic_text(words, vocabulary, rng)
+        folder = bucket_prefix + "input/folder-" + str(i).zfill(4) + "/"
+        s3.put(bucket, folder + "audio.mp3", text)
+        s3.put(bucket, folder + "ground_truth.txt", text)
+        texts.append(text)
+    s3.put(bucket, bucket_prefix + "keywords/keywords.txt", ", ".join(vocabulary[:keywords]))
+    return texts
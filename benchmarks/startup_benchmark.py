@@ -0,0 +1,43 @@
+# Startup-time benchmark: how long a run takes to get going, and which heavy dependencies are imported on the way
+# Usage: python benchmarks/startup_benchmark.py [--repeat 5]
+import sys, os, time, argparse, subprocess, statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("boto3", "botocore", "numpy", "pandas", "nltk", "bs4", "lxml")
+IMPORT_CHECK = "import sys, orchestrator.orchestrator; print(','.join(m for m in %r if m in sys.modules))" % (HEAVY_MODULES,)
+
+# Returns the median wall-clock seconds of running a command in a fresh interpreter
+def timed(command, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+# Returns the modules with the largest cumulative import time (microseconds) when importing the orchestrator
+def slowest_imports(count=10):
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import orchestrator.orchestrator"], cwd=ROOT, \
+                            stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, universal_newlines=True, check=True).stderr
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line: continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative_us), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark startup time")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    baseline = timed([sys.executable, "-c", "pass"], args.repeat)
+    print("python interpreter".ljust(40) + str(round(baseline, 3)).rjust(8) + " s")
+    print("import orchestrator".ljust(40) + str(round(timed([sys.executable, "-c", "import orchestrator.orchestrator"], args.repeat), 3)).rjust(8) + " s")
+    print("python main.py --help".ljust(40) + str(round(timed([sys.executable, "main.py", "--help"], args.repeat), 3)).rjust(8) + " s")
+
+    loaded = subprocess.run([sys.executable, "-c", IMPORT_CHECK], cwd=ROOT, stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout.strip()
+    print("heavy modules loaded at import: " + (loaded or "none"))
+    print("slowest imports (cumulative):")
+    for cumulative_us, name in slowest_imports():
+        print("  " + name.ljust(38) + str(round(cumulative_us / 1e6, 3)).rjust(8) + " s")
@@ -8,7 +8,111 @@ BUCKET_PATH = {
 }
 
 CLM = {
-    'self_heal': False
+    'self_heal': False,
+    # with self-heal, one CLM is trained per combination of these variants, all at the same time; each is evaluated
+    # as soon as it is trained and the best one is marked in the leaderboard
+    'sweep': {
+        'base_models': ["WideBand"], # "WideBand" and/or "NarrowBand" (audio sampled below 16 kHz)
+        'corpora': ["all"], # pages of "all" keywords files, of the "keywords" you supplied, or of the "learned" keywords
+        'tuning_data': [False] # True uses text files under tuning_data/ in your bucket-prefix as tuning data
+    }
+}
+
+RUN = {
+    # maximum number of transcription jobs running at the same time (1 runs them one after another)
+    'max_in_flight': 10
+}
+
+INPUTS = {
+    # input files are listed with up to 1000 keys per call, split into parallel listings at keys of the manifest
+    # of the last scan (result/input_manifest.json)
+    'max_workers': 16
+}
+
+WIKI = {
+    # Wikipedia pages are downloaded concurrently, base_url can point to a local stand-in for testing
+    'base_url': "https://en.wikipedia.org/wiki/",
+    'max_workers': 16,
+    'per_host_limit': 8,
+    'timeout': 10, # seconds
+    'retries': 3,
+    'refresh_after': 7*24*3600, # seconds before a downloaded keyword is checked again for changes
+    'shard_size': 32*1024*1024, # bytes, pages are packed into training_data/ files of about this size
+    'parser': "fast", # "fast" (lxml, or a streaming parser without it) or "soup" (BeautifulSoup)
+    'parse_processes': 2 # pages are parsed on this many processes (0 parses on threads of this process)
+}
+
+CORPUS = {
+    # downloaded pages are deduplicated into training_corpus/, which is used to train the CLM
+    'enabled': True,
+    'max_bytes': 500*1024*1024, # corpus size budget, sentences are sampled by keyword relevance beyond it (None for no limit)
+    'near_duplicate_threshold': 0.8, # estimated word-shingle Jaccard similarity above which a sentence is a near duplicate
+    'min_words': 4, # shorter sentences are dropped
+    'max_words': 120, # longer sentences are dropped
+    'min_alpha_ratio': 0.7, # sentences with fewer letters among their characters are dropped
+    'max_index_entries': 250000, # latest sentences checked for near duplicates, about 1.6 KB of memory each (None for all)
+    'shard_size': 32*1024*1024 # bytes, the corpus is written as training_corpus/ files of about this size
+}
+
+EVALUATION = {
+    # with staged, models are first transcribed on a sample of the input folders (stratified by media duration);
+    # after each stage, models whose WER is significantly higher than that of ST or of the best model are dropped
+    'staged': False,
+    'stages': [0.2, 0.5, 1.0], # share of the input folders evaluated by the end of each stage
+    'min_folders': 5, # folders with results needed before a model can be dropped
+    'alpha': 0.05, # chance of dropping a model that is not worse (split over the stages)
+    'margin': 0.0 # only drop models worse by more than this WER
+}
+
+CACHE = {
+    # reuses transcriptions of identical media (same S3 ETag and size) with the same model, e.g. in copied folders
+    'enabled': True,
+    'ttl': 90*24*3600, # seconds, None keeps entries until evicted
+    'max_entries': 100000
+}
+
+KEYWORDS = {
+    # engine that finds keywords (nouns) in missed words: "comprehend" (Amazon Comprehend)
+    # or "local" (NLTK tagger, runs without network access)
+    'engine': "comprehend",
+    'comprehend': {
+        'batch_size': 25, # documents per batch_detect_syntax call (at most 25)
+        'max_workers': 4 # batch calls at the same time
+    },
+    'local': {
+        'batch_size': 1000 # words tagged at a time
+    }
+}
+
+NORMALIZE = {
+    # text clean up rules applied to ground truth and transcriptions before calculating WER
+    'filler_words': ["um", "umm", "uh", "mmm", "ah"], # removed as whole words, ignoring case
+    'punctuation': ',.;":', # removed
+    'dashes': "-—" # replaced by a space
+}
+
+REPORT = {
+    # a report of each run (time spent per stage and per job, AWS calls, retries, S3 bytes, cache hits)
+    # is saved as result/reports/<run-id>.json next to leaderboard.txt
+    'enabled': True,
+    'profile': False, # profiles the CPU-bound steps (WER, corpus building) with cProfile and adds their top functions
+    'prometheus_textfile': None, # optional local path, e.g. for the node exporter textfile collector
+    'leaderboard_interval': 60 # seconds between refreshes of the leaderboard while jobs are running
+}
+
+AWS = {
+    'region': None, # None uses the default region of your AWS configuration
+    'max_pool_connections': 50, # should be at least RUN['max_in_flight']
+    'connect_timeout': 10, # seconds
+    'read_timeout': 60, # seconds
+    'endpoint_urls': {}, # optional service name -> endpoint url, e.g. {'s3': "http://localhost:9000"}
+    # client-side limits, size them to the quotas of your account (Service Quotas console)
+    'rate_limits': {'transcribe': 10, 'comprehend': 10, 's3': 1000}, # calls per second of a service, or of one
+                                                                     # operation, e.g. 'transcribe.ListTranscriptionJobs'
+    'concurrency_limits': {'transcription_jobs': 100}, # Transcribe jobs running at the same time
+    'retries': 8, # retries of a throttled call (ThrottlingException, LimitExceededException, SlowDown, ...)
+    'backoff_base': 1.0, # seconds, retries wait a random time up to backoff_base * 2^retry ...
+    'backoff_cap': 60.0 # ... and at most this long
 }
 
 ACCESS = {
@@ -0,0 +1,250 @@
+# Concurrent Wikipedia downloads over pooled keep-alive HTTP connections
+import http.client, threading, queue, time, random, gzip, logging
+from urllib.parse import urlsplit, urljoin, quote
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from metrics.metrics import METRICS
+
+logger = logging.getLogger()
+
+WIKI_BASE_URL = "https://en.wikipedia.org/wiki/"
+USER_AGENT = "amazon-transcribe-single-click-clm (https://github.com/aws-samples/amazon-transcribe-single-click-clm)"
+
+# status codes worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Outcome of downloading, parsing and storing the page of one keyword
+# status is one of "ok", "unchanged", "not_modified", "not_found", "empty", "failed"
+class KeywordResult:
+    def __init__(self, keyword):
+        self.keyword = keyword
+        self.url = None
+        self.status = None
+        self.http_status = None
+        self.attempts = 0
+        self.bytes = 0
+        self.sentences = 0
+        self.error = None
+        self.elapsed = 0.0
+        self.headers = {}
+
+    def __repr__(self):
+        return "KeywordResult(" + self.keyword + ", " + str(self.status) + ")"
+
+# Keep-alive connections to a single host, at most size of them in use at a time
+class HostPool:
+    def __init__(self, scheme, netloc, size, timeout):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.timeout = timeout
+        self.semaphore = threading.BoundedSemaphore(size)
+        self.idle = queue.LifoQueue()
+
+    def __connection(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            if self.scheme == "https":
+                return http.client.HTTPSConnection(self.netloc, timeout=self.timeout)
+            return http.client.HTTPConnection(self.netloc, timeout=self.timeout)
+
+    # sends a GET request and returns (status, headers, body), the connection goes back to the pool if kept alive
+    def get(self, path, headers):
+        with self.semaphore:
+            conn = self.__connection()
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+            except Exception:
+                conn.close() # connection may be stale or half-read, never reuse it
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self.idle.put(conn)
+            return response.status, dict((k.lower(), v) for k, v in response.getheaders()), body
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+# Host pools keyed by scheme and host
+class ConnectionPool:
+    def __init__(self, per_host_limit=8, timeout=10):
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def host(self, scheme, netloc):
+        with self.lock:
+            if (scheme, netloc) not in self.hosts:
+                self.hosts[(scheme, netloc)] = HostPool(scheme, netloc, self.per_host_limit, self.timeout)
+            return self.hosts[(scheme, netloc)]
+
+    def close(self):
+        with self.lock:
+            for pool in self.hosts.values(): pool.close()
+            self.hosts = {}
+
+# Class that downloads keyword pages concurrently and pipelines them through parse and write stages
+# base_url can point to a local HTTP stand-in for testing
+class WikiDownloader:
+    MAX_REDIRECTS = 5
+
+    def __init__(self, base_url=WIKI_BASE_URL, max_workers=16, per_host_limit=8, timeout=10, retries=3,
+                 backoff_base=0.5, backoff_cap=20, parse_workers=2, write_workers=4, max_pending=64, parse_processes=0):
+        self.base_url = base_url
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.parse_workers = parse_workers
+        self.write_workers = write_workers
+        self.max_pending = max_pending
+        self.parse_processes = parse_processes
+        self.pool = ConnectionPool(per_host_limit, timeout)
+
+    # URL of the page of a keyword
+    def url(self, keyword):
+        return self.base_url + quote(keyword, safe="_:()',-")
+
+    # seconds to wait before retry number attempt, exponential backoff with full jitter
+    def backoff(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_cap)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    # single GET that follows redirects, returns (status, headers, body)
+    def get(self, url, headers=None):
+        headers = dict(headers or {})
+        headers.setdefault("User-Agent", USER_AGENT)
+        headers.setdefault("Accept-Encoding", "gzip")
+        for _ in range(self.MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            path = parts.path + ("?" + parts.query if parts.query else "")
+            status, response_headers, body = self.pool.host(parts.scheme, parts.netloc).get(path, headers)
+            if status in (301, 302, 303, 307, 308) and "location" in response_headers:
+                url = urljoin(url, response_headers["location"])
+                continue
+            if response_headers.get("content-encoding") == "gzip":
+                body = gzip.decompress(body)
+            return status, response_headers, body
+        raise http.client.HTTPException("too many redirects for " + url)
+
+    # downloads the page of a keyword with retries, fills in result and returns the html (None if not available)
+    def fetch(self, keyword, result, headers=None):
+        result.url = self.url(keyword)
+        for attempt in range(self.retries + 1):
+            result.attempts += 1
+            retry_after = None
+            try:
+                status, response_headers, body = self.get(result.url, headers)
+                result.http_status = status
+                if status == 200:
+                    result.bytes = len(body)
+                    METRICS.count("wikipedia.bytes_read", len(body))
+                    result.headers = response_headers
+                    return body.decode("utf8")
+                if status == 304: # answer to a conditional request, the stored copy is current
+                    result.status = "not_modified"
+                    result.headers = response_headers
+                    return None
+                if status not in RETRY_STATUSES:
+                    result.status = "not_found" if status == 404 else "failed"
+                    result.error = "HTTP " + str(status)
+                    return None
+                result.error = "HTTP " + str(status)
+                retry_after = response_headers.get("retry-after")
+            except (OSError, http.client.HTTPException) as e:
+                result.error = type(e).__name__ + ": " + str(e)
+            if attempt < self.retries:
+                METRICS.count("wikipedia.retries")
+                time.sleep(self.backoff(attempt, retry_after))
+        result.status = "failed"
+        return None
+
+    # downloads all keywords; each page goes through parse(keyword, html) and the
+    # parsed data through write(keyword, data) on their own worker pools while other pages are still downloading
+    # write may return a status (e.g. "unchanged") to use instead of "ok"
+    # with parse_processes, parse runs on a process pool so parsing doesn't hold the GIL of the download threads;
+    # parse must then be a module-level function (see html_extract.parse_page)
+    # headers(keyword), if given, returns extra request headers such as conditional GET headers
+    # returns a KeywordResult per keyword, in keyword order
+    def download(self, keywords, parse, write, headers=None):
+        results = [KeywordResult(keyword) for keyword in keywords]
+        pending = threading.BoundedSemaphore(self.max_pending)
+        fetchers = ThreadPoolExecutor(self.max_workers, thread_name_prefix="wiki-fetch")
+        processes = ProcessPoolExecutor(self.parse_processes) if self.parse_processes else None
+        # with a process pool, each parser thread waits for one page parsed by a process
+        parsers = ThreadPoolExecutor(max(self.parse_workers, self.parse_processes), thread_name_prefix="wiki-parse")
+        writers = ThreadPoolExecutor(self.write_workers, thread_name_prefix="wiki-write")
+
+        def write_stage(result, data):
+            try:
+                result.status = write(result.keyword, data) or "ok"
+            except Exception as e:
+                result.status = "failed"
+                result.error = type(e).__name__ + ": " + str(e)
+            finally:
+                pending.release()
+
+        def parse_stage(result, html):
+            try:
+                if processes:
+                    data = processes.submit(parse, result.keyword, html).result()
+                else:
+                    data = parse(result.keyword, html)
+            except Exception as e:
+                result.status = "failed"
+                result.error = type(e).__name__ + ": " + str(e)
+                pending.release()
+                return
+            result.sentences = len(data)
+            if len(data) == 0:
+                result.status = "empty"
+                pending.release()
+                return
+            writers.submit(write_stage, result, data)
+
+        def fetch_stage(result):
+            start = time.time()
+            try:
+                html = self.fetch(result.keyword, result, headers(result.keyword) if headers else None)
+            except Exception as e: # e.g. a page that is not valid utf8
+                html = None
+                result.status = "failed"
+                result.error = type(e).__name__ + ": " + str(e)
+            result.elapsed = time.time() - start
+            if html is None:
+                pending.release()
+                return
+            parsers.submit(parse_stage, result, html)
+
+        try:
+            for result in results:
+                pending.acquire() # bounds the pages held in memory between stages
+                fetchers.submit(fetch_stage, result)
+        finally:
+            # each stage only submits to later stages, so shutting down in order drains the pipeline
+            fetchers.shutdown(wait=True)
+            parsers.shutdown(wait=True)
+            if processes: processes.shutdown(wait=True)
+            writers.shutdown(wait=True)
+        return results
+
+    def close(self):
+        self.pool.close()
+
+# Returns a short summary of download results, e.g. "ok: 10, not_found: 2"
+def summarize(results):
+    counts = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    return ", ".join(status + ": " + str(count) for status, count in sorted(counts.items(), key=lambda x: str(x[0])))
@@ -0,0 +1,102 @@
+# Fast extraction of sentences from Wikipedia pages, gives the same sentences as get_data in wiki_data.py on Wikipedia pages
+# (on malformed markup an unclosed <p> ends at the next block, as in browsers, while BeautifulSoup's html.parser keeps it open)
+# Paragraphs are found with lxml when it is installed, otherwise with a streaming html.parser pass
+# that keeps only paragraph text instead of building a tree
+import re, threading
+from html.parser import HTMLParser
+from data_preparation.nltk_resources import ensure, punkt_resource
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+BRACKETS = re.compile(r"[\(\[].*?[\)\]]") # remove () and [] with their content, e.g. citations [1]
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+# Returns the English punkt sentence tokenizer, loaded once per process
+def get_sentence_tokenizer():
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            ensure(punkt_resource())
+            try:
+                from nltk.tokenize import PunktTokenizer # NLTK 3.9 and later
+                _tokenizer = PunktTokenizer("english")
+            except ImportError:
+                import nltk.data
+                _tokenizer = nltk.data.load("tokenizers/punkt/english.pickle")
+        return _tokenizer
+
+# elements whose text is not page text (inline TemplateStyles, scripts), skipped like BeautifulSoup's get_text does
+SKIPPED = ("style", "script", "template")
+# start tags that close an open <p>, as in HTML (an unclosed paragraph ends where the next block starts)
+BLOCKS = frozenset(["address", "article", "aside", "blockquote", "details", "dialog", "div", "dl", "fieldset", "figcaption", "figure",
+    "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hgroup", "hr", "main", "menu", "nav", "ol", "p", "pre",
+    "section", "table", "ul"])
+
+# Parser that collects the text of <p> elements as the page is fed, nested inline elements included
+class ParagraphParser(HTMLParser):
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.open = False
+        self.skipped = 0 # depth of style, script and template elements
+        self.parts = []
+        self.paragraphs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED:
+            self.skipped += 1
+        elif tag in BLOCKS and not self.skipped:
+            self.end_paragraph()
+            if tag == "p": self.open = True
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCKS and not self.skipped: self.end_paragraph()
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED:
+            self.skipped = max(0, self.skipped - 1)
+        elif tag == "p" and not self.skipped:
+            self.end_paragraph()
+
+    def handle_data(self, data):
+        if self.open and not self.skipped: self.parts.append(data)
+
+    def end_paragraph(self):
+        if self.open: self.paragraphs.append("".join(self.parts))
+        self.open = False
+        self.parts = []
+
+    def close(self):
+        HTMLParser.close(self)
+        self.end_paragraph() # unclosed paragraph at the end of the page
+
+# Returns the text of all paragraphs of a page
+def paragraphs(html):
+    if lxml is not None:
+        if not html.strip(): return []
+        tree = lxml.html.fromstring(html)
+        for element in list(tree.iter(*SKIPPED)):
+            element.drop_tree() # keeps the text that follows the element
+        return [p.text_content() for p in tree.iter("p")]
+    parser = ParagraphParser()
+    parser.feed(html)
+    parser.close()
+    return parser.paragraphs
+
+# Returns the sentences of the paragraphs of a page, without bracketed content
+def extract_sentences(html):
+    tokenizer = get_sentence_tokenizer()
+    sentences = []
+    for paragraph in paragraphs(html):
+        for sentence in tokenizer.tokenize(paragraph):
+            sentence = BRACKETS.sub("", sentence).strip()
+            if sentence: sentences.append(sentence)
+    return sentences
+
+# parse function for WikiDownloader.download, defined at module level so it can run on a process pool
+def parse_page(keyword, html):
+    return extract_sentences(html)
@@ -0,0 +1,78 @@
+# Per-keyword manifest of downloaded training data, used to refresh only new or changed pages
+import json, time, hashlib, threading
+from aws.clients import get_client
+
+# Returns the manifest key for a training data prefix, e.g. ".../training_data_manifest.json"
+# It sits next to the prefix rather than under it so it is not used as CLM training data
+def manifest_key(data_prefix):
+    return data_prefix.rstrip("/") + "_manifest.json"
+
+# Returns the content hash stored in the manifest
+def content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+# Class that records, per keyword, the source URL, ETag/Last-Modified, content hash and fetch time
+class KeywordManifest:
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+        self.lock = threading.Lock()
+
+    # loads a manifest from S3, an empty manifest if it doesn't exist yet
+    @classmethod
+    def load(cls, bucket, key):
+        s3_client = get_client('s3')
+        try:
+            result = s3_client.get_object(Bucket=bucket, Key=key)
+        except s3_client.exceptions.NoSuchKey:
+            return cls()
+        return cls(json.loads(result["Body"].read().decode('utf-8')).get("keywords", {}))
+
+    def save(self, bucket, key):
+        with self.lock:
+            body = json.dumps({"keywords": self.entries}, indent=1, sort_keys=True)
+        s3_client = get_client('s3')
+        s3_client.put_object(Body=body, Bucket=bucket, Key=key)
+
+    def get(self, keyword):
+        with self.lock:
+            return self.entries.get(keyword)
+
+    # True if a keyword was never fetched or was last checked more than max_age seconds ago
+    def needs_refresh(self, keyword, max_age, now=None):
+        entry = self.get(keyword)
+        if entry is None: return True
+        now = now if now is not None else time.time()
+        return now - entry.get("fetched_at", 0) >= max_age
+
+    # request headers that let the server answer 304 Not Modified for an unchanged page
+    def conditional_headers(self, keyword):
+        entry = self.get(keyword)
+        headers = {}
+        if entry and entry.get("status") == "ok":
+            if entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    # True if content is identical to what is already stored for a keyword
+    def unchanged(self, keyword, sha256):
+        entry = self.get(keyword)
+        return entry is not None and entry.get("sha256") == sha256
+
+    # records the outcome of a download (a KeywordResult), sha256 and key are set when content was stored
+    def record(self, result, sha256=None, key=None):
+        with self.lock:
+            entry = dict(self.entries.get(result.keyword, {}))
+            entry["url"] = result.url
+            if result.status != "failed": # failed downloads are retried on the next refresh
+                entry["fetched_at"] = time.time()
+            if result.status == "not_modified":
+                pass # ETag, hash and key of the stored content are still valid
+            elif result.status in ("ok", "unchanged"):
+                entry["status"] = "ok"
+                entry["etag"] = result.headers.get("etag")
+                entry["last_modified"] = result.headers.get("last-modified")
+                if sha256: entry["sha256"] = sha256
+                if key: entry["key"] = key
+            else:
+                entry["status"] = result.status
+            self.entries[result.keyword] = entry
@@ -0,0 +1,174 @@
+# Training text packed into large shard files, with a sidecar index of where each keyword's text is
+import json, threading, logging
+from aws.clients import get_client
+from aws.s3 import listS3Files
+
+logger = logging.getLogger()
+
+SHARD_PREFIX = "shard-"
+SHARD_SIZE = 32*1024*1024
+PART_SIZE = 8*1024*1024 # S3 needs at least 5 MB for every part of a multipart upload but the last
+
+# Returns the shard index key for a training data prefix, e.g. ".../training_data_shards.json"
+# It sits next to the prefix rather than under it so it is not used as CLM training data
+def shard_index_key(data_prefix):
+    return data_prefix.rstrip("/") + "_shards.json"
+
+# Class that streams bytes into one S3 object, uploading a part as soon as part_size bytes are buffered
+# Objects that fit in a single part are written with one put_object instead
+class MultipartWriter:
+    def __init__(self, bucket, key, part_size=PART_SIZE):
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.size = 0
+        self.upload_id = None
+        self.parts = []
+
+    def write(self, data):
+        self.buffer += data
+        self.size += len(data)
+        if len(self.buffer) >= self.part_size: self.__upload_part()
+
+    def __upload_part(self):
+        s3_client = get_client('s3')
+        if self.upload_id is None:
+            self.upload_id = s3_client.create_multipart_upload(Bucket=self.bucket, Key=self.key)["UploadId"]
+        number = len(self.parts) + 1
+        response = s3_client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=bytes(self.buffer))
+        self.parts.append({"PartNumber": number, "ETag": response["ETag"]})
+        self.buffer = bytearray()
+
+    # finishes the object, returns its size
+    def close(self):
+        s3_client = get_client('s3')
+        if self.upload_id is None:
+            s3_client.put_object(Body=bytes(self.buffer), Bucket=self.bucket, Key=self.key)
+            return self.size
+        if self.buffer: self.__upload_part()
+        s3_client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={"Parts": self.parts})
+        return self.size
+
+    # drops an unfinished upload
+    def abort(self):
+        if self.upload_id is not None:
+            get_client('s3').abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+# Writes lines into shards of about shard_size bytes named prefix + "shard-00000.txt", ...
+# and deletes shards left under prefix by an earlier, larger write; returns the shard keys
+def write_shards(bucket, prefix, lines, shard_size=SHARD_SIZE, part_size=PART_SIZE):
+    keys = []
+    writer = None
+    for line in lines:
+        if writer is None or writer.size >= shard_size:
+            if writer: writer.close()
+            keys.append(prefix + SHARD_PREFIX + str(len(keys)).zfill(5) + ".txt")
+            writer = MultipartWriter(bucket, keys[-1], part_size)
+        writer.write((line + "\n").encode('utf-8'))
+    if writer: writer.close()
+    stale = [key for key in listS3Files(bucket, prefix) if key not in keys]
+    delete_keys(bucket, stale)
+    return keys
+
+def delete_keys(bucket, keys):
+    s3_client = get_client('s3')
+    for i in range(0, len(keys), 1000):
+        s3_client.delete_objects(Bucket=bucket, Delete={"Objects": [{"Key": key} for key in keys[i:i+1000]]})
+
+# Class that keeps per-keyword training text in shards of about shard_size bytes under data_prefix
+# The sidecar index maps keyword -> [shard key, byte offset, byte length]. An update writes new and changed keywords
+# to new shards and rewrites only the shards that held changed keywords (and small shards, so they fill up over time)
+# Per-keyword files written by earlier versions are moved into shards on the first update
+class ShardStore:
+    def __init__(self, bucket, data_prefix, shard_size=SHARD_SIZE, part_size=PART_SIZE):
+        self.bucket = bucket
+        self.data_prefix = data_prefix
+        self.shard_size = shard_size
+        self.part_size = part_size
+        self.index_key = shard_index_key(data_prefix)
+        self.keywords = {} # keyword -> [shard key, offset, length]
+        self.shards = {} # shard key -> size
+        self.next_shard = 0
+        self.updates = {} # keyword -> location, of keywords written since the last commit
+        self.new_shards = {} # shard key -> size, of shards written since the last commit
+        self.writer = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        s3_client = get_client('s3')
+        try:
+            index = json.loads(s3_client.get_object(Bucket=self.bucket, Key=self.index_key)["Body"].read().decode('utf-8'))
+            self.keywords = index["keywords"]
+            self.shards = index["shards"]
+            self.next_shard = index["next_shard"]
+        except s3_client.exceptions.NoSuchKey:
+            pass
+        return self
+
+    def save(self):
+        index = {"keywords": self.keywords, "shards": self.shards, "next_shard": self.next_shard}
+        get_client('s3').put_object(Body=json.dumps(index, separators=(",", ":")), Bucket=self.bucket, Key=self.index_key)
+
+    # adds or replaces the text of a keyword, it is visible in the index after commit(); thread-safe
+    def write(self, keyword, content):
+        data = (content + "\n").encode('utf-8')
+        with self.lock:
+            if self.writer is None or self.writer.size >= self.shard_size:
+                self.__close_shard()
+                key = self.data_prefix + SHARD_PREFIX + str(self.next_shard).zfill(5) + ".txt"
+                self.next_shard += 1
+                self.writer = MultipartWriter(self.bucket, key, self.part_size)
+            self.updates[keyword] = [self.writer.key, self.writer.size, len(data)]
+            self.writer.write(data)
+
+    def __close_shard(self):
+        if self.writer is None: return
+        self.new_shards[self.writer.key] = self.writer.close()
+        self.writer = None
+
+    # finishes an update: moves the unchanged keywords of affected shards and legacy files into new shards,
+    # then saves the index and deletes the replaced objects
+    def commit(self):
+        listed = [key for key in listS3Files(self.bucket, self.data_prefix) if key.endswith(".txt")]
+        written = set(location[0] for location in self.updates.values())
+        legacy = [key for key in listed if not key[len(self.data_prefix):].startswith(SHARD_PREFIX)]
+        orphans = [key for key in listed if key not in self.shards and key not in written and key not in legacy]
+        affected = set(self.keywords[keyword][0] for keyword in self.updates if keyword in self.keywords)
+        affected.update(key for key, size in self.shards.items() if size < self.shard_size // 2)
+        if len(self.updates) == 0 and len(legacy) == 0 and len(affected) <= 1:
+            delete_keys(self.bucket, orphans)
+            return # nothing changed, a single small shard is left as it is
+        s3_client = get_client('s3')
+        for shard in sorted(affected):
+            body = s3_client.get_object(Bucket=self.bucket, Key=shard)["Body"].read()
+            for keyword, (key, offset, length) in list(self.keywords.items()):
+                if key == shard and keyword not in self.updates:
+                    self.write(keyword, body[offset:offset+length-1].decode('utf-8'))
+        for key in legacy:
+            keyword = key[len(self.data_prefix):-len(".txt")]
+            if keyword not in self.updates and "/" not in keyword:
+                self.write(keyword, s3_client.get_object(Bucket=self.bucket, Key=key)["Body"].read().decode('utf-8'))
+        with self.lock:
+            self.__close_shard()
+        self.keywords.update(self.updates)
+        for shard in affected: self.shards.pop(shard, None)
+        self.shards.update(self.new_shards)
+        self.save()
+        delete_keys(self.bucket, sorted(affected) + legacy + orphans)
+        logger.info("training data: " + str(len(self.updates)) + " keywords written to " + str(len(self.new_shards)) + \
+                    " shards, " + str(len(self.shards)) + " shards in total")
+        self.updates = {}
+        self.new_shards = {}
+
+    # yields (keyword, text) of all keywords (or of the given keywords only), reading each shard once
+    def iter_texts(self, keywords=None):
+        s3_client = get_client('s3')
+        by_shard = {}
+        for keyword, (key, offset, length) in self.keywords.items():
+            if keywords is not None and keyword not in keywords: continue
+            by_shard.setdefault(key, []).append((offset, length, keyword))
+        for shard in sorted(by_shard):
+            body = s3_client.get_object(Bucket=self.bucket, Key=shard)["Body"].read()
+            for offset, length, keyword in sorted(by_shard[shard]):
+                yield keyword, body[offset:offset+length-1].decode('utf-8')
@@ -1,49 +1,26 @@
-import nltk
-nltk.download('punkt')
-nltk.download('stopwords')
+import re, logging
+from aws.clients import get_client
+from aws.s3 import listS3Files
+from data_download.downloader import WikiDownloader, KeywordResult, summarize
+from data_download.manifest import KeywordManifest, manifest_key, content_hash
+from data_download.shards import ShardStore, SHARD_SIZE
+from data_download.html_extract import parse_page
+from data_preparation.nltk_resources import ensure, punkt_resource
 
-from nltk import tokenize
-import re
-import urllib.request
-from bs4 import BeautifulSoup
-import urllib.request
-from bs4 import BeautifulSoup
-import boto3
+logger = logging.getLogger()
 
-# Gets last modified date for a S3 object
-def getLastModified(bucket, key):
-    s3_client = boto3.client(service_name='s3')
-    result = s3_client.get_object(Bucket=bucket, Key=key) 
-    return result['LastModified']
-
-# Gets last modified date for a S3 folder
-def getLastModifiedPrefix(bucket, prefix):
-    s3 = boto3.resource('s3')
-    my_bucket = s3.Bucket(bucket)
-    for object_summary in my_bucket.objects.filter(Prefix=prefix):
-        return getLastModified(bucket, object_summary.key)
-    return None # if no objects in that prefix
+# shared downloader for single page downloads
+DOWNLOADER = WikiDownloader()
 
 # Writes text to S3 as a file
 def writeTextToS3(bucket, key, content):
-    s3_client = boto3.client('s3')
+    s3_client = get_client('s3')
     s3_client.put_object(Body=content, Bucket=bucket, Key=key)
     
-# Returns all files under an S3 prefix
-def listS3Files(bucket, prefix):
-    s3 = boto3.resource('s3')
-    my_bucket = s3.Bucket(bucket)
-    files = []
-    for object_summary in my_bucket.objects.filter(Prefix=prefix):
-        if object_summary.key[-1] != "/": # don't append parent directory name
-            files.append(object_summary.key)
-    return files
-
 # Reads a file line by line from S3
 def read_keywords_from_S3_file(bucket, key):
     keywords = []
-    # connect to S3 using boto3 client
-    s3_client = boto3.client(service_name='s3')
+    s3_client = get_client('s3')
     # get S3 object
     result = s3_client.get_object(Bucket=bucket, Key=key) 
     #Read a text file line by line using splitlines object
@@ -57,17 +34,17 @@ def read_keywords_from_S3_file(bucket, key):
 
 # Helper function to get html text from wikipedia
 def extract_html(keyword):
-    try:
-        fp = urllib.request.urlopen("https://en.wikipedia.org/wiki/"+keyword)
-        html = fp.read().decode("utf8")
-        fp.close()
-        return html
-    except:
-        print("Page for "+keyword+" does not exist")
-        return None
+    result = KeywordResult(keyword)
+    html = DOWNLOADER.fetch(keyword, result)
+    if html is None:
+        logger.warning("Page for "+keyword+" could not be downloaded: "+str(result.error))
+    return html
 
 # Helper function to extract data from html text
 def get_data(html):
+    from bs4 import BeautifulSoup
+    from nltk import tokenize
+    ensure(punkt_resource())
     extracted_data = []
     soup = BeautifulSoup(html, 'html.parser')
     for data in soup.find_all('p'):
@@ -79,37 +56,71 @@ def get_data(html):
                 extracted_data.append(txt2)
     return extracted_data
 
-# check if new keywords are added to the keywords file or if keywords were never downloaded
-def new_keywords(bucket, keywords_file, prefix):
-    kf_ts = getLastModified(bucket, keywords_file)
-    prefix_ts = getLastModifiedPrefix(bucket, prefix)
-    if prefix_ts == None: return True
-    if kf_ts > prefix_ts:
-        val = True
-    else:
-        val = False
-    return val
+# parse function for WikiDownloader.download with BeautifulSoup
+def parse_soup(keyword, html):
+    return get_data(html)
 
 # Class to handle wikipedia data downloads
+# Keywords are refreshed incrementally: a keyword checked less than refresh_after seconds ago is skipped,
+# older ones are re-requested with a conditional GET and their S3 file is only rewritten if the text changed
+# Pages are packed into shards of about shard_size bytes under data_prefix (see ShardStore)
+# parser is "fast" (html_extract, lxml or streaming) or "soup" (get_data, BeautifulSoup), both give the same sentences on Wikipedia pages
+# other options are passed to WikiDownloader (base_url, max_workers, per_host_limit, timeout, retries, parse_processes, ...)
 class WikiData:
-    # Download data from wikipedia to local text files
+    def __init__(self, refresh_after=7*24*3600, shard_size=SHARD_SIZE, parser="fast", **options):
+        self.refresh_after = refresh_after
+        self.shard_size = shard_size
+        self.parser = parser
+        self.options = options
+
+    # Download data from wikipedia to S3 text shards, with a sidecar index of the keywords in each shard
+    # returns the KeywordResult of every keyword that was requested
     def download_data(self, bucket, data_prefix, keywords_prefix):
         k_files = listS3Files(bucket, keywords_prefix)
+        m_key = manifest_key(data_prefix)
+        manifest = KeywordManifest.load(bucket, m_key)
 
+        # all keywords across keywords files (including learned_keywords.txt), without duplicates
+        self.keywords_list = []
+        self.keywords_by_file = {} # keywords file name -> its keywords, e.g. to build a corpus of some files only
+        seen = set()
         for keywords_file in k_files:
-            if not new_keywords(bucket, keywords_file, data_prefix): continue # no need to download new training data
+            self.keywords_by_file[keywords_file.split("/")[-1]] = []
+            for keyword in read_keywords_from_S3_file(bucket, keywords_file):
+                keyword = keyword.replace(" ","_")
+                self.keywords_by_file[keywords_file.split("/")[-1]].append(keyword)
+                if keyword not in seen: self.keywords_list.append(keyword)
+                seen.add(keyword)
+        keywords = [keyword for keyword in self.keywords_list if manifest.needs_refresh(keyword, self.refresh_after)]
+        logger.info(str(len(keywords)) + " out of " + str(len(self.keywords_list)) + " keywords need a refresh")
+        shards = ShardStore(bucket, data_prefix, self.shard_size).load()
+        if len(keywords) == 0:
+            shards.commit() # still moves per-keyword files of earlier versions into shards
+            return []
+
+        stored = {}
+        def write(keyword, data):
+            content = "\n".join(data)
+            sha256 = content_hash(content)
+            stored[keyword] = sha256
+            if manifest.unchanged(keyword, sha256): return "unchanged"
+            shards.write(keyword, content)
 
-            self.keywords_list = read_keywords_from_S3_file(bucket, keywords_file)
-            count = 0
-            for keyword in self.keywords_list:
-              keyword = keyword.replace(" ","_")
-              html = extract_html(keyword)
-              if html:
-                  count += 1
-                  data = "\n".join(get_data(html))
-                  writeTextToS3(bucket=bucket, key=data_prefix+keyword+".txt", content=data)
+        downloader = WikiDownloader(**self.options)
+        results = downloader.download(keywords,
+            parse=parse_page if self.parser == "fast" else parse_soup,
+            write=write,
+            headers=manifest.conditional_headers)
+        downloader.close()
+        shards.commit()
 
-            print("Was able to download text for "+ str(count) + " out of "+str(len(self.keywords_list))+" keywords")
+        for result in results:
+            manifest.record(result, stored.get(result.keyword))
+            if result.status not in ("ok", "unchanged", "not_modified"):
+                logger.warning(result.keyword + ": " + str(result.status) + (" (" + result.error + ")" if result.error else ""))
+        manifest.save(bucket, m_key)
+        logger.info(summarize(results) + " out of " + str(len(results)) + " keywords")
+        return results
         
 if __name__ == "__main__":
     bucket = "my-bucket"
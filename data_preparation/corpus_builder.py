@@ -0,0 +1,152 @@
+# Builds the CLM training corpus from the downloaded pages:
+# removes exact and near-duplicate sentences, drops low-value ones and keeps the corpus within a byte budget
+import re, zlib, heapq, random, hashlib, logging
+import numpy as np
+from data_download.shards import ShardStore, write_shards, SHARD_SIZE
+
+logger = logging.getLogger()
+
+WORD = re.compile(r"[^\W_]+")
+# MinHash permutations are (a*x + b) mod a Mersenne prime, with 32-bit shingle hashes the products fit in uint64
+PRIME = np.uint64((1 << 31) - 1)
+
+# Class that finds near-duplicate sentences with MinHash signatures of word shingles and LSH banding
+# A sentence is a near duplicate if it shares a band with a kept sentence whose estimated Jaccard similarity is at least threshold
+# Memory is bounded: entries are removed when their sentence leaves the corpus, and beyond max_entries the oldest are
+# forgotten (near duplicates are mostly found on the same or nearby pages); an entry takes about 1.6 KB with 64 permutations
+class MinHashIndex:
+    def __init__(self, num_perm=64, bands=16, shingle_size=3, threshold=0.8, seed=1, max_entries=None):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, int(PRIME), size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, int(PRIME), size=num_perm).astype(np.uint64)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.buckets = [{} for _ in range(bands)] # band -> {band bytes: entry key or set of entry keys}
+        self.entries = {} # entry key -> signature as uint32 bytes (hash values are below PRIME), oldest first
+
+    def signature(self, words):
+        n = self.shingle_size
+        shingles = [" ".join(words[i:i+n]) for i in range(max(1, len(words) - n + 1))]
+        x = np.array([zlib.crc32(s.encode('utf-8')) for s in shingles], dtype=np.uint64)
+        return ((self.a[:, None] * x[None, :] + self.b[:, None]) % PRIME).min(axis=1).astype(np.uint32)
+
+    def band_keys(self, signature):
+        return [signature[i*self.rows:(i+1)*self.rows].tobytes() for i in range(self.bands)]
+
+    # returns True if words are a near duplicate of a sentence in the index, otherwise adds them under key
+    def check_and_add(self, words, key):
+        signature = self.signature(words)
+        bands = self.band_keys(signature)
+        checked = set()
+        for band, bucket in zip(bands, self.buckets):
+            candidates = bucket.get(band)
+            if candidates is None: continue
+            for candidate in (candidates if isinstance(candidates, set) else (candidates, )):
+                if candidate in checked: continue
+                checked.add(candidate)
+                if np.mean(np.frombuffer(self.entries[candidate], dtype=np.uint32) == signature) >= self.threshold: return True
+        self.entries[key] = signature.tobytes()
+        # most band values are unique, so a bucket holds a single key until a second one shares it
+        for band, bucket in zip(bands, self.buckets):
+            candidates = bucket.get(band)
+            if candidates is None: bucket[band] = key
+            elif isinstance(candidates, set): candidates.add(key)
+            else: bucket[band] = set((candidates, key))
+        if self.max_entries is not None and len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
+        return False
+
+    # removes the sentence added under key, if it is still in the index
+    def remove(self, key):
+        signature = self.entries.pop(key, None)
+        if signature is None: return
+        for band, bucket in zip(self.band_keys(np.frombuffer(signature, dtype=np.uint32)), self.buckets):
+            candidates = bucket.get(band)
+            if isinstance(candidates, set):
+                candidates.discard(key)
+                if len(candidates) == 1: bucket[band] = candidates.pop()
+            elif candidates == key:
+                del bucket[band]
+
+# Class that builds a deduplicated training corpus in a single streaming pass over the pages of all keywords
+# Sentences are sampled to max_bytes with weighted reservoir sampling: a sentence weighs 1, plus keyword_boost
+# if it mentions the keyword of its page, plus 1 for every other keyword it mentions
+# Near duplicates are looked up among the sentences in the sample, at most max_index_entries of the latest ones (see MinHashIndex)
+class CorpusBuilder:
+    def __init__(self, max_bytes=None, min_words=4, max_words=120, min_alpha_ratio=0.7, near_duplicate_threshold=0.8, \
+                 keyword_boost=2, num_perm=64, bands=16, seed=1, shard_size=SHARD_SIZE, max_index_entries=250000):
+        self.max_bytes = max_bytes
+        self.min_words = min_words
+        self.max_words = max_words
+        self.min_alpha_ratio = min_alpha_ratio
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.keyword_boost = keyword_boost
+        self.num_perm = num_perm
+        self.bands = bands
+        self.seed = seed
+        self.shard_size = shard_size
+        self.max_index_entries = max_index_entries
+
+    # True for sentences unlikely to help a language model: too short or long, or mostly numbers and symbols
+    def low_value(self, sentence, words):
+        if len(words) < self.min_words or len(words) > self.max_words: return True
+        letters = sum(c.isalpha() for c in sentence)
+        return letters < self.min_alpha_ratio * len(sentence.replace(" ", ""))
+
+    def weight(self, words, own_keyword, keywords):
+        text = " " + " ".join(words) + " "
+        weight = 1
+        if own_keyword and " " + own_keyword + " " in text: weight += self.keyword_boost
+        weight += len(keywords.intersection(words).difference(own_keyword.split()))
+        return weight
+
+    # reads the pages of all keywords stored under data_prefix (or only those of keywords) and writes the corpus in shards
+    # to corpus_prefix, returns statistics
+    def build(self, bucket, data_prefix, corpus_prefix, keywords=None):
+        store = ShardStore(bucket, data_prefix).load()
+        selected = set(keywords) if keywords is not None else set(store.keywords)
+        keywords = set(word for keyword in store.keywords if keyword in selected for word in WORD.findall(keyword.replace("_", " ").lower()))
+        stats = dict.fromkeys(["sentences", "exact_duplicates", "near_duplicates", "low_value", "sampled_out", "kept", "bytes"], 0)
+        seen = set()
+        index = MinHashIndex(self.num_perm, self.bands, threshold=self.near_duplicate_threshold, seed=self.seed, \
+                             max_entries=self.max_index_entries)
+        rng = random.Random(self.seed)
+        reservoir = [] # min-heap of (sampling key, sequence number, sentence)
+        size = 0
+        seq = 0
+        for keyword, text in store.iter_texts(selected):
+            own_keyword = " ".join(WORD.findall(keyword.replace("_", " ").lower()))
+            for sentence in text.splitlines():
+                sentence = sentence.strip()
+                if not sentence: continue
+                stats["sentences"] += 1
+                words = WORD.findall(sentence.lower())
+                digest = hashlib.blake2b(" ".join(words).encode('utf-8'), digest_size=8).digest()
+                if digest in seen:
+                    stats["exact_duplicates"] += 1
+                    continue
+                seen.add(digest)
+                if self.low_value(sentence, words):
+                    stats["low_value"] += 1
+                    continue
+                if index.check_and_add(words, seq):
+                    stats["near_duplicates"] += 1
+                    continue
+                sample_key = rng.random() ** (1.0 / self.weight(words, own_keyword, keywords))
+                heapq.heappush(reservoir, (sample_key, seq, sentence))
+                seq += 1
+                size += len(sentence.encode('utf-8')) + 1
+                while self.max_bytes is not None and size > self.max_bytes:
+                    dropped = heapq.heappop(reservoir)
+                    index.remove(dropped[1]) # a sentence that left the corpus no longer suppresses its near duplicates
+                    size -= len(dropped[2].encode('utf-8')) + 1
+                    stats["sampled_out"] += 1
+        sentences = [sentence for sample_key, s, sentence in sorted(reservoir, key=lambda entry: entry[1])]
+        stats["kept"] = len(sentences)
+        stats["bytes"] = size
+        write_shards(bucket, corpus_prefix, sentences, self.shard_size)
+        logger.info("training corpus: " + ", ".join(k + " " + str(v) for k, v in stats.items()))
+        return stats
@@ -0,0 +1,42 @@
+# NLTK resources are looked up in the local NLTK data directories (see NLTK_DATA) and only downloaded when missing,
+# the first time they are needed rather than at import
+import threading
+
+# resource name -> path under an NLTK data directory
+PATHS = {
+    "punkt": "tokenizers/punkt",
+    "punkt_tab": "tokenizers/punkt_tab",
+    "stopwords": "corpora/stopwords",
+    "averaged_perceptron_tagger": "taggers/averaged_perceptron_tagger",
+    "averaged_perceptron_tagger_eng": "taggers/averaged_perceptron_tagger_eng"
+}
+
+_found = set()
+_lock = threading.Lock()
+
+# Makes sure NLTK resources are available locally, downloading the missing ones
+# raises LookupError if one is missing and can't be downloaded (e.g. without network access)
+def ensure(*names):
+    with _lock:
+        for name in names:
+            if name in _found: continue
+            import nltk
+            try:
+                nltk.data.find(PATHS[name])
+            except LookupError:
+                if not nltk.download(name, quiet=True):
+                    raise LookupError("NLTK resource " + name + " is missing and could not be downloaded, "
+                                      "install it with: python -m nltk.downloader " + name)
+            _found.add(name)
+
+# Name of the punkt sentence tokenizer resource of the installed NLTK version
+def punkt_resource():
+    try:
+        from nltk.tokenize import PunktTokenizer # NLTK 3.9 and later load punkt_tab
+        return "punkt_tab"
+    except ImportError:
+        return "punkt"
+
+# Name of the perceptron tagger resource of the installed NLTK version
+def tagger_resource():
+    return "averaged_perceptron_tagger_eng" if punkt_resource() == "punkt_tab" else "averaged_perceptron_tagger"
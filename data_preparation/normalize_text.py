@@ -1,45 +1,91 @@
 # Text clean up
 
-import re
+import re, warnings
+from concurrent.futures import ProcessPoolExecutor
 
-# Helper function to remove paranthesis and content with it
+# Default rules, can be changed per domain (see NORMALIZE in config.py)
+FILLER_WORDS = ["um", "umm", "uh", "mmm", "ah"] # matched as whole words, ignoring case
+PUNCTUATION = ',.;":' # removed
+DASHES = "-—" # replaced by a space, example cow-calf changed to cow calf
+
+# Class to cleanup text
+# Brackets with their content and filler words are removed in a single regex scan,
+# punctuation and dashes in a single translate pass, then extra spaces are collapsed
+class NormalizeText():
+    # texts with more characters than this in total are normalized on a process pool by normalize_many
+    PARALLEL_MIN_CHARS = 1000000
+
+    def __init__(self, filler_words=None, punctuation=None, dashes=None):
+        filler_words = FILLER_WORDS if filler_words is None else filler_words
+        punctuation = PUNCTUATION if punctuation is None else punctuation
+        dashes = DASHES if dashes is None else dashes
+        patterns = [r"[\(\[].*?[\)\]]"] # remove () and [] with their content
+        if filler_words:
+            # longest first so that "umm" is not matched as "um"
+            fillers = sorted(set(word.lower() for word in filler_words), key=len, reverse=True)
+            patterns.append(r"\b(?:" + "|".join(re.escape(word) for word in fillers) + r")\b")
+        self.pattern = re.compile("|".join(patterns), re.IGNORECASE)
+        table = dict.fromkeys(map(ord, punctuation))
+        table.update(dict.fromkeys(map(ord, dashes), " "))
+        self.table = table
+        self.spaces = re.compile(" +")
+
+    def normalize(self, content):
+        out = self.pattern.sub("", content)
+        out = out.translate(self.table)
+        return self.spaces.sub(" ", out).strip()
+
+    # normalizes many texts, on a process pool when there is enough text to be worth it
+    # returns the normalized texts in the same order
+    def normalize_many(self, texts, workers=None):
+        texts = list(texts)
+        if workers == 1 or sum(len(text) for text in texts) < self.PARALLEL_MIN_CHARS:
+            return [self.normalize(text) for text in texts]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(self.normalize, texts, chunksize=max(1, len(texts) // 64)))
+
+    # normalizes a very large text line by line (e.g. a file object or S3 body.iter_lines()),
+    # yielding normalized non-empty lines; brackets never span lines, so the words are the same as normalizing the whole text
+    def normalize_stream(self, lines):
+        for line in lines:
+            if isinstance(line, bytes): line = line.decode('utf-8')
+            line = self.normalize(line)
+            if line: yield line
+
+# Helper function to normalize text before calculating WER, using the default rules
+def normalize_text(inputStr):
+    return NormalizeText().normalize(inputStr)
+
+# Former helpers of normalize_text, kept with their old behavior for existing callers; use NormalizeText instead
+def deprecated(name):
+    warnings.warn(name + " is deprecated and will be removed, use NormalizeText().normalize instead", DeprecationWarning, stacklevel=3)
+
+# Helper function to remove paranthesis and content with it (deprecated)
 def remove_paranthesis(inputStr):
-    #return re.sub(r"\([^()]*\)", "", inputStr) #only remove ()
-    return re.sub("[\(\[].*?[\)\]]", "", inputStr) #remove () and []
+    deprecated("remove_paranthesis")
+    return re.sub(r"[\(\[].*?[\)\]]", "", inputStr) #remove () and []
 
-# Helper function to remove extra spaces in text
+# Helper function to remove extra spaces in text (deprecated)
 def remove_extra_spaces(inputStr):
-    # remove additional space from string 
-    inputStr = inputStr.strip()
-    return re.sub(' +', ' ', inputStr)
+    deprecated("remove_extra_spaces")
+    return re.sub(' +', ' ', inputStr.strip())
 
-# Helper function to remove ums, uhs, others, as well as punctuations
+# Helper function to remove ums, uhs, others, as well as punctuations (deprecated)
+# substrings are removed, e.g. "ah" in "ahead", unlike NormalizeText which only removes whole filler words
 def remove_umuh_comma_dot(inputStr):
+    deprecated("remove_umuh_comma_dot")
     wordList = ["Um", " um", "Uh", "uh", "Umm", "umm", "Mmm", "mmm", "Ah", "ah", ",", ".", ";", '"', ":"]
     for word in wordList:
         inputStr = inputStr.replace(word, '')
-    return remove_extra_spaces(inputStr)
+    return re.sub(' +', ' ', inputStr.strip())
 
-# Helper function to remove hyphen and longer dash
+# Helper function to remove hyphen and longer dash (deprecated)
 # example cow-calf changed to cow calf
 def expand_dash(inputStr):
-    inputStr = inputStr.replace("-", ' ')
-    inputStr = inputStr.replace("—", ' ')
-    return inputStr
-
-# Helper function to normalize text before calculating WER
-def normalize_text(inputStr):
-    out = remove_paranthesis(inputStr)
-    out = remove_umuh_comma_dot(out)
-    out = expand_dash(out)
-    return remove_extra_spaces(out)
-
-# Class to cleanup text
-class NormalizeText():
-    def normalize(self, content):
-        return normalize_text(content)
+    deprecated("expand_dash")
+    return inputStr.replace("-", ' ').replace("—", ' ')
 
 if __name__ == "__main__":
     nt = NormalizeText()
     text = nt.normalize("Hello testing uh the text() input")
-    print(text)
\ No newline at end of file
+    print(text)
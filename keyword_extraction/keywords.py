@@ -0,0 +1,150 @@
+# Extracts keywords (nouns and proper nouns) from missed words with part-of-speech tagging
+import json, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+from aws.clients import get_client
+from metrics.metrics import METRICS
+
+logger = logging.getLogger()
+
+KEYWORD_TAGS = ("NOUN", "PROPN")
+# Comprehend accepts 25 documents per batch call and 5000 bytes (UTF-8) per document
+BATCH_SIZE = 25
+MAX_DOCUMENT_BYTES = 4800
+SEPARATOR = ", "
+
+# Packs words into comma separated documents of at most max_bytes
+# returns a list of (text, spans) where spans are (word, begin, end) character offsets in text
+def chunk_words(words, max_bytes=MAX_DOCUMENT_BYTES):
+    documents = []
+    text, spans, size = "", [], 0
+    for word in words:
+        word_bytes = len(word.encode('utf-8'))
+        if word_bytes > max_bytes:
+            logger.warning("skipping word longer than " + str(max_bytes) + " bytes: " + word[:50] + "...")
+            continue
+        if spans and size + len(SEPARATOR) + word_bytes > max_bytes:
+            documents.append((text, spans))
+            text, spans, size = "", [], 0
+        if spans:
+            text += SEPARATOR
+            size += len(SEPARATOR)
+        spans.append((word, len(text), len(text) + len(word)))
+        text += word
+        size += word_bytes
+    if spans: documents.append((text, spans))
+    return documents
+
+# Assigns the syntax tokens of a document to the words it was built from, returns {word: [[token, tag], ...]}
+def tags_by_word(spans, tokens):
+    tags = dict((word, []) for word, begin, end in spans)
+    i = 0
+    for token in sorted(tokens, key=lambda t: t["BeginOffset"]):
+        while i < len(spans) and spans[i][2] <= token["BeginOffset"]: i += 1
+        if i == len(spans): break
+        if spans[i][1] <= token["BeginOffset"]: # separators are not part of any word
+            tags[spans[i][0]].append([token["Text"], token["PartOfSpeech"]["Tag"]])
+    return tags
+
+# Class that keeps the part-of-speech tags of words in S3, so words tagged in earlier runs are not tagged again
+class POSCache:
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+        self.tags = {} # word -> [[token, tag], ...]
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        s3_client = get_client('s3')
+        try:
+            body = s3_client.get_object(Bucket=self.bucket, Key=self.key)["Body"].read()
+            self.tags = json.loads(body.decode('utf-8'))
+        except s3_client.exceptions.NoSuchKey:
+            self.tags = {}
+        return self
+
+    # writes the cache back to S3 if words were added
+    def save(self):
+        with self.lock:
+            if not self.dirty: return
+            body = json.dumps(self.tags, separators=(",", ":"))
+            self.dirty = False
+        get_client('s3').put_object(Body=body, Bucket=self.bucket, Key=self.key)
+
+    def get(self, word):
+        return self.tags.get(word)
+
+    def update(self, tags):
+        with self.lock:
+            self.tags.update(tags)
+            self.dirty = self.dirty or len(tags) > 0
+
+# Class that tags words with Amazon Comprehend: words are packed into documents,
+# sent batch_size documents per batch_detect_syntax call, with up to max_workers calls at a time
+class ComprehendTagger:
+    # tags cost an API call, so they are cached in S3
+    remote = True
+
+    def __init__(self, language='en', batch_size=BATCH_SIZE, max_workers=4, max_document_bytes=MAX_DOCUMENT_BYTES):
+        self.language = language
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_document_bytes = max_document_bytes
+
+    # returns {word: [[token, tag], ...]}; words of documents Comprehend could not process are left out
+    def tag(self, words):
+        documents = chunk_words(words, self.max_document_bytes)
+        batches = [documents[i:i+self.batch_size] for i in range(0, len(documents), self.batch_size)]
+        tags = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch_tags in executor.map(self.__tag_batch, batches):
+                tags.update(batch_tags)
+        return tags
+
+    def __tag_batch(self, documents):
+        comprehend = get_client('comprehend')
+        response = comprehend.batch_detect_syntax(TextList=[text for text, spans in documents], LanguageCode=self.language)
+        tags = {}
+        for result in response["ResultList"]:
+            tags.update(tags_by_word(documents[result["Index"]][1], result["SyntaxTokens"]))
+        for error in response["ErrorList"]:
+            logger.warning("syntax detection failed for " + str(len(documents[error["Index"]][1])) + " words: " + error["ErrorMessage"])
+        return tags
+
+# Returns the tagger of an engine: "comprehend" (Amazon Comprehend) or "local" (NLTK, no network access needed)
+# options holds the settings of each engine by name, only those of the selected engine are used
+def make_tagger(engine="comprehend", **options):
+    if engine == "comprehend":
+        return ComprehendTagger(**options.get(engine, {}))
+    if engine == "local":
+        from keyword_extraction.local_tagger import LocalTagger
+        return LocalTagger(**options.get(engine, {}))
+    raise ValueError("unknown keyword extraction engine: " + str(engine))
+
+# Class that returns the keywords among words, tagging only the words missing from the cache
+class KeywordExtractor:
+    def __init__(self, tagger, cache=None):
+        self.tagger = tagger
+        self.cache = cache
+
+    # returns the set of nouns and proper nouns found in words
+    def extract(self, words):
+        words = sorted(set(word.strip() for word in words if word.strip()))
+        tags = {}
+        if self.cache:
+            for word in words:
+                if self.cache.get(word) is not None: tags[word] = self.cache.get(word)
+        unknown = [word for word in words if word not in tags]
+        if unknown:
+            new_tags = self.tagger.tag(unknown)
+            if self.cache: self.cache.update(new_tags)
+            tags.update(new_tags)
+        logger.info("tagged " + str(len(unknown)) + " new words, " + str(len(words) - len(unknown)) + " from cache")
+        if self.cache:
+            METRICS.count("pos_cache.hits", len(words) - len(unknown))
+            METRICS.count("pos_cache.misses", len(unknown))
+        keywords = set()
+        for word in words:
+            for token, tag in tags.get(word, []):
+                if tag in KEYWORD_TAGS: keywords.add(token)
+        return keywords
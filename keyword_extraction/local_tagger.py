@@ -0,0 +1,41 @@
+# Local part-of-speech tagging with the NLTK perceptron tagger, works without network access
+import threading
+from nltk.tokenize import TreebankWordTokenizer
+from data_preparation.nltk_resources import ensure, tagger_resource
+
+# Penn Treebank tags mapped to the Comprehend tags used for keywords, other tags are kept as they are
+TAG_MAP = {"NN": "NOUN", "NNS": "NOUN", "NNP": "PROPN", "NNPS": "PROPN"}
+
+_tagger = None
+_tagger_lock = threading.Lock()
+
+# Returns the perceptron tagger, its model is loaded once (and downloaded if it is missing locally)
+def get_tagger():
+    global _tagger
+    with _tagger_lock:
+        if _tagger is None:
+            from nltk.tag.perceptron import PerceptronTagger
+            ensure(tagger_resource())
+            _tagger = PerceptronTagger()
+        return _tagger
+
+# Class that tags words locally, batch_size words at a time, each word is tagged as its own sentence
+# like the comma separated words sent to Comprehend
+class LocalTagger:
+    # tags of a local tagger are cheap to recompute, so they are not cached in S3
+    remote = False
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.tokenizer = TreebankWordTokenizer()
+
+    # returns {word: [[token, tag], ...]} with the same tags as ComprehendTagger for nouns and proper nouns
+    def tag(self, words):
+        tagger = get_tagger()
+        tags = {}
+        for i in range(0, len(words), self.batch_size):
+            batch = words[i:i+self.batch_size]
+            sentences = [self.tokenizer.tokenize(word) for word in batch]
+            for word, tagged in zip(batch, tagger.tag_sents(sentences)):
+                tags[word] = [[token, TAG_MAP.get(tag, tag)] for token, tag in tagged]
+        return tags
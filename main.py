@@ -1,6 +1,7 @@
-import sys, boto3, logging
+import sys, logging, argparse
 
 from orchestrator.orchestrator import Orchestrator
+from aws import clients
 
 logger = logging.getLogger()
 console_handler = logging.StreamHandler(sys.stdout)
@@ -12,12 +13,27 @@ logger.addHandler(console_handler)
 from config import (
     BUCKET_PATH,
     CLM,
-    ACCESS
+    RUN,
+    INPUTS,
+    WIKI,
+    CORPUS,
+    EVALUATION,
+    NORMALIZE,
+    KEYWORDS,
+    CACHE,
+    REPORT,
+    ACCESS,
+    AWS
 )
 
 # main method reads config file, sets a few other parameters, 
 # and calls the Orchestrator object
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Single-click CLM framework for Amazon Transcribe")
+    parser.add_argument("--compact-runs", action="store_true", help="merge stored run results into a single file and exit")
+    parser.add_argument("--resume", metavar="RUN_ID", help="continue an interrupted run, reusing its transcription jobs and results")
+    args = parser.parse_args()
+
     # read input from config file
     bucket = BUCKET_PATH["bucket"]
     
@@ -37,13 +53,24 @@ if __name__ == "__main__":
     
     self_heal = CLM["self_heal"]
 
-    # result_prefix is an internal folder under which this framework stores its results such as runs.csv, leaderbaord.txt
+    # result_prefix is an internal folder under which this framework stores its results such as runs/ (one JSONL part per run), leaderbaord.txt
     result_prefix = bucket_prefix + "result/"
     role_arn = ACCESS["role_arn"]
+    max_in_flight = RUN["max_in_flight"]
     
+    clients.configure(**AWS)
     orc = Orchestrator(bucket, keywords_prefix, data_prefix, out_prefix, bucket_prefix, result_prefix)
 
+    if args.compact_runs:
+        logger.info("compacted run results into " + str(orc.runs.compact()))
+        sys.exit(0)
+
     logger.info("calling orchestrator")
-    orc.run(self_heal=self_heal, role_arn=role_arn)
+    orc.run(self_heal=self_heal, role_arn=role_arn, max_in_flight=max_in_flight, wiki_options=WIKI, \
+            normalize_options=NORMALIZE, resume_run_id=args.resume, cache_options=CACHE, \
+            input_options=INPUTS, keyword_options=KEYWORDS, corpus_options=CORPUS, report_options=REPORT, \
+            sweep_options=CLM.get("sweep"), evaluation_options=EVALUATION)
     logger.info("run completed")
+    for (service, operation), count in sorted(clients.call_counts().items()):
+        logger.info("AWS calls " + service + "." + operation + ": " + str(count))
         
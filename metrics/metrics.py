@@ -0,0 +1,167 @@
+# Run instrumentation: timing spans per stage and job, counters, and an optional profiler for CPU-bound steps
+# One Metrics object (METRICS) is shared by all modules, reset at the start of every run
+import time, os, re, threading, contextlib
+
+# Class that collects timing spans and counters from any thread
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiling = False
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.spans = [] # {"name", "start", "seconds", **attributes}
+            self.counters = {}
+            self.profiles = {} # name -> pstats.Stats
+
+    # records a span that was timed elsewhere
+    def observe(self, name, seconds, start=None, **attributes):
+        span = {"name": name, "start": round((start if start is not None else time.time() - seconds) - self.started, 3), "seconds": seconds}
+        span.update(attributes)
+        with self.lock:
+            self.spans.append(span)
+
+    # times a block, e.g. with METRICS.span("wer", folder=folder, model=model): ...
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, start, **attributes)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # profiles a block with cProfile when profiling is enabled, statistics are merged per name
+    # only one profiler can be active in a process, blocks profiled at the same time on other threads are skipped
+    @contextlib.contextmanager
+    def profile(self, name):
+        if not self.profiling:
+            yield
+            return
+        import cProfile, pstats
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError: # another profiler is active
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self.lock:
+                if name in self.profiles: self.profiles[name].add(profiler)
+                else: self.profiles[name] = pstats.Stats(profiler)
+
+    # returns totals per span name: {"count", "seconds", "max"}
+    def stages(self):
+        stages = {}
+        with self.lock:
+            spans = list(self.spans)
+        for span in spans:
+            stage = stages.setdefault(span["name"], {"count": 0, "seconds": 0.0, "max": 0.0})
+            stage["count"] += 1
+            stage["seconds"] += span["seconds"]
+            stage["max"] = max(stage["max"], span["seconds"])
+        return stages
+
+    # returns the top functions by cumulative time of each profiled block
+    def profile_summary(self, top=20):
+        summary = {}
+        with self.lock:
+            profiles = dict(self.profiles)
+        for name, stats in profiles.items():
+            rows = []
+            for (filename, line, function), (cc, calls, tottime, cumtime, callers) in stats.stats.items():
+                rows.append({"function": os.path.basename(filename) + ":" + str(line) + "(" + function + ")", "calls": calls,
+                             "tottime": round(tottime, 4), "cumtime": round(cumtime, 4)})
+            summary[name] = sorted(rows, key=lambda row: -row["cumtime"])[:top]
+        return summary
+
+    # returns the machine-readable report of a run: totals per stage, seconds of each stage of every (folder, model) job,
+    # the other spans in start order, and counters
+    def report(self, run_id, extra=None):
+        with self.lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+        jobs = {}
+        timeline = []
+        for span in sorted(spans, key=lambda span: span["start"]):
+            if "folder" in span and "model" in span:
+                job = jobs.setdefault((span["folder"], span["model"]), {"folder": span["folder"], "model": span["model"]})
+                job[span["name"]] = round(job.get(span["name"], 0) + span["seconds"], 3)
+            else:
+                timeline.append(dict(span, seconds=round(span["seconds"], 3)))
+        report = {
+            "run": run_id,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started)),
+            "seconds": round(time.time() - self.started, 3),
+            "stages": dict((name, dict(stage, seconds=round(stage["seconds"], 3), max=round(stage["max"], 3))) \
+                           for name, stage in self.stages().items()),
+            "jobs": list(jobs.values()),
+            "spans": timeline,
+            "counters": counters
+        }
+        if extra: report.update(extra)
+        if self.profiles: report["profiles"] = self.profile_summary()
+        return report
+
+METRICS = Metrics()
+
+# Returns a snapshot of the AWS calls, their seconds, retries and S3 bytes counted by aws.clients
+def aws_usage():
+    from aws import clients
+    return {"calls": clients.call_counts(), "seconds": clients.call_seconds(), "retries": clients.retry_counts(), "bytes": clients.byte_counts()}
+
+# Returns the AWS usage since a snapshot of aws_usage, as entries of a run report
+def aws_usage_since(before):
+    now = aws_usage()
+    def delta(kind):
+        return dict((service + "." + operation, count - before[kind].get((service, operation), 0)) \
+                    for (service, operation), count in sorted(now[kind].items()) if count != before[kind].get((service, operation), 0))
+    seconds = dict((call, round(value, 3)) for call, value in delta("seconds").items())
+    return {"aws_calls": delta("calls"), "aws_seconds": seconds, "aws_retries": delta("retries"),
+            "s3_bytes": dict((kind, now["bytes"][kind] - before["bytes"][kind]) for kind in ("read", "written"))}
+
+def prometheus_name(name):
+    return re.sub("[^a-zA-Z0-9_]", "_", name)
+
+def prometheus_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+# Returns a run report in the Prometheus text format
+def to_prometheus(report, prefix="transcribe_clm"):
+    lines = ["# TYPE " + prefix + "_run_seconds gauge", prefix + "_run_seconds " + str(report["seconds"])]
+    lines.append("# TYPE " + prefix + "_stage_seconds gauge")
+    for stage, totals in sorted(report["stages"].items()):
+        lines.append(prefix + '_stage_seconds{stage="' + prometheus_label(stage) + '"} ' + str(round(totals["seconds"], 3)))
+    lines.append("# TYPE " + prefix + "_stage_count gauge")
+    for stage, totals in sorted(report["stages"].items()):
+        lines.append(prefix + '_stage_count{stage="' + prometheus_label(stage) + '"} ' + str(totals["count"]))
+    for name, value in sorted(report["counters"].items()):
+        metric = prefix + "_" + prometheus_name(name)
+        lines.append("# TYPE " + metric + " gauge")
+        lines.append(metric + " " + str(value))
+    for key, metric in (("aws_calls", "_aws_calls"), ("aws_seconds", "_aws_seconds"), ("aws_retries", "_aws_retries")):
+        if key not in report: continue
+        lines.append("# TYPE " + prefix + metric + " gauge")
+        for call, count in sorted(report[key].items()):
+            service, operation = call.split(".", 1)
+            lines.append(prefix + metric + '{service="' + prometheus_label(service) + '",operation="' + prometheus_label(operation) + '"} ' + str(count))
+    if "s3_bytes" in report:
+        lines.append("# TYPE " + prefix + "_s3_bytes gauge")
+        for direction, count in sorted(report["s3_bytes"].items()):
+            lines.append(prefix + '_s3_bytes{direction="' + direction + '"} ' + str(count))
+    return "\n".join(lines) + "\n"
+
+# Writes a run report as a Prometheus textfile (e.g. for the node exporter textfile collector), replacing it atomically
+def write_prometheus_textfile(path, report):
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        f.write(to_prometheus(report))
+    os.replace(temp, path)
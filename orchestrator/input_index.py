@@ -0,0 +1,138 @@
+# Index of the input folders: pairs each ground truth file with its media files
+import json, logging, posixpath
+from concurrent.futures import ThreadPoolExecutor
+from aws.clients import get_client
+
+logger = logging.getLogger()
+
+GROUND_TRUTH_EXTENSIONS = (".txt",)
+# media formats supported by Amazon Transcribe
+MEDIA_EXTENSIONS = (".amr", ".flac", ".m4a", ".mp3", ".mp4", ".ogg", ".webm", ".wav")
+# used to estimate the duration of media from its size (about 128 kbit/s compressed audio)
+BYTES_PER_SECOND = 16000
+
+# one listing range per this many objects known from the last scan (a list_objects_v2 page holds up to 1000 keys)
+OBJECTS_PER_RANGE = 1000
+
+# Yields list_objects_v2 pages under a prefix one at a time, so large listings are processed as they arrive
+# start_after lists only the keys that sort after it
+def iter_pages(bucket, prefix, start_after=None):
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    if start_after: kwargs["StartAfter"] = start_after
+    for page in get_client('s3').get_paginator('list_objects_v2').paginate(**kwargs):
+        yield page
+
+# Returns {key: [size, etag]} of all keys under a prefix that sort after start_after and up to last (None for no limit),
+# directory markers included
+def list_range(bucket, prefix, start_after=None, last=None):
+    objects = {}
+    for page in iter_pages(bucket, prefix, start_after=start_after):
+        for obj in page.get("Contents", []):
+            if last is not None and obj["Key"] > last: return objects
+            objects[obj["Key"]] = [obj["Size"], obj["ETag"]]
+    return objects
+
+# Returns an estimate of the duration of a media file in seconds, only used as a hint for polling
+def estimated_duration(size):
+    return size / BYTES_PER_SECOND
+
+# Pairs the ground truth of a folder with its media files, returns (inputs, problems)
+# inputs are {"folder", "media", "gt_file", "size"}, one per media file; when a ground truth has several media files
+# each gets its own folder id "folder/media file name" so their results are kept apart
+def pair_folder(folder, objects):
+    ground_truth = sorted(key for key in objects if key.lower().endswith(GROUND_TRUTH_EXTENSIONS))
+    media = sorted(key for key in objects if key.lower().endswith(MEDIA_EXTENSIONS))
+    problems = []
+    other = sorted(set(objects) - set(ground_truth) - set(media))
+    if other: problems.append("ignoring files that are neither media nor ground truth: " + ", ".join(other))
+    if len(ground_truth) != 1:
+        problems.append("found " + str(len(ground_truth)) + " ground truth (.txt) files, expected 1")
+        return [], problems
+    if len(media) == 0:
+        problems.append("found no media files")
+        return [], problems
+    inputs = []
+    for key in media:
+        folder_id = folder if len(media) == 1 else folder + "/" + posixpath.basename(key)
+        inputs.append({"folder": folder_id, "media": key, "gt_file": ground_truth[0], "size": objects[key][0]})
+    return inputs, problems
+
+# Returns the folders that were added, removed or changed (files added, removed, resized or with a new ETag)
+def diff_folders(old, new):
+    return {
+        "added": sorted(set(new) - set(old)),
+        "removed": sorted(set(old) - set(new)),
+        "changed": sorted(folder for folder in set(old) & set(new) if old[folder] != new[folder])
+    }
+
+# Class that lists all files under an input prefix and keeps a manifest of their files (key, size, ETag) and pairings in S3
+# Files are listed with flat listings of up to 1000 keys per call, rather than one listing per folder; the key range
+# is split at keys of the manifest so large inputs are listed in parallel
+# Only folders that differ from the manifest are paired again, and the manifest is only rewritten when something changed
+class InputIndex:
+    def __init__(self, bucket, prefix, manifest_key, max_workers=16):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.manifest_key = manifest_key
+        self.max_workers = max_workers
+        self.manifest = {"folders": {}, "inputs": {}}
+        self.folders = {}
+        self.diff = None
+
+    # loads the manifest of the previous scan, an empty one if there is none yet
+    def load(self):
+        s3_client = get_client('s3')
+        try:
+            body = s3_client.get_object(Bucket=self.bucket, Key=self.manifest_key)["Body"].read()
+            self.manifest = json.loads(body.decode('utf-8'))
+        except s3_client.exceptions.NoSuchKey:
+            pass
+        return self
+
+    # returns the keys where the listing is split: every OBJECTS_PER_RANGE-th key of the manifest, at most max_workers ranges
+    def split_keys(self):
+        keys = sorted(key for objects in self.manifest["folders"].values() for key in objects)
+        ranges = min(self.max_workers, len(keys) // OBJECTS_PER_RANGE + 1)
+        return [keys[i * len(keys) // ranges] for i in range(1, ranges)]
+
+    # lists all input folders
+    def scan(self):
+        bounds = self.split_keys()
+        ranges = list(zip([None] + bounds, bounds + [None])) # (start after, last key) of each range
+        with ThreadPoolExecutor(max_workers=max(1, len(ranges))) as executor:
+            listings = list(executor.map(lambda bounds: list_range(self.bucket, self.prefix, *bounds), ranges))
+        self.folders = {}
+        for objects in listings:
+            for key, entry in objects.items():
+                rest = key[len(self.prefix):]
+                if rest == "": continue # the input folder itself
+                if "/" not in rest:
+                    logger.warning("ignoring " + key + ", input files must be in a sub-folder")
+                    continue
+                files = self.folders.setdefault(rest.split("/", 1)[0], {})
+                if key[-1] != "/": files[key] = entry # not a directory
+        self.diff = diff_folders(self.manifest["folders"], self.folders)
+        logger.info("input folders: " + str(len(self.folders)) + " (" + ", ".join(k + " " + str(len(v)) for k, v in self.diff.items()) + ")")
+        for folder in self.diff["changed"]:
+            logger.warning("input folder " + folder + " changed since the last run, its earlier results are kept")
+        return self
+
+    # returns inputs of all folders in listing order, pairing only new and changed folders
+    def inputs(self):
+        inputs = []
+        paired = {}
+        for folder, objects in self.folders.items():
+            if folder in self.manifest["inputs"] and folder not in self.diff["changed"]:
+                paired[folder] = self.manifest["inputs"][folder]
+            else:
+                paired[folder], problems = pair_folder(folder, objects)
+                for problem in problems: logger.warning("input folder " + folder + ": " + problem)
+            inputs.extend(paired[folder])
+        if any(self.diff.values()) or paired != self.manifest["inputs"]:
+            self.manifest = {"folders": self.folders, "inputs": paired}
+            self.save()
+        return inputs
+
+    def save(self):
+        body = json.dumps(self.manifest, separators=(",", ":"))
+        get_client('s3').put_object(Body=body, Bucket=self.bucket, Key=self.manifest_key)
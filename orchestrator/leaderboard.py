@@ -0,0 +1,159 @@
+# Model leaderboard kept up to date as jobs are recorded: running count, sum and sum of squares of the WERs of each
+# model and of each (model, folder)
+# Adding a job is O(1), or O(models) for an ST job, which changes the deltas vs ST of the models on its folder; rendering the
+# leaderboard is O(models) and the per-folder breakdown O(models x folders), whatever the number of past runs
+import math
+from orchestrator.staged_evaluation import t_quantile
+
+# Running count, sum and sum of squares of values
+class Aggregate:
+    __slots__ = ("count", "total", "squares")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.squares = 0.0
+
+    # adds a value, or removes one added before with weight -1
+    def add(self, value, weight=1):
+        self.count += weight
+        self.total += weight * value
+        self.squares += weight * value * value
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    # sample standard deviation
+    def sd(self):
+        if self.count < 2: return None
+        return math.sqrt(max(0.0, (self.squares - self.total * self.total / self.count) / (self.count - 1)))
+
+    # two-sided confidence interval of the mean, (low, high)
+    def interval(self, confidence=0.95):
+        if self.count < 2: return None
+        half = t_quantile(1 - (1 - confidence) / 2, self.count - 1) * self.sd() / math.sqrt(self.count)
+        return (self.mean() - half, self.mean() + half)
+
+# Class that aggregates the WERs of all runs per model, per (model, folder), and per folder against ST
+# deltas of a model are its mean WER on a folder minus that of ST, over the folders both ran on (negative is better)
+class Leaderboard:
+    def __init__(self, confidence=0.95):
+        self.confidence = confidence
+        self.models = {} # model -> Aggregate of all its jobs
+        self.cells = {} # model -> {folder: Aggregate}
+        self.deltas = {} # model -> Aggregate of its per-folder deltas vs ST
+
+    # builds a leaderboard from the rows of a RunStore in a single pass (the loop of add without the deltas,
+    # which are computed once at the end)
+    @classmethod
+    def from_rows(cls, rows, confidence=0.95):
+        leaderboard = cls(confidence)
+        cells = leaderboard.cells
+        last_model = None
+        for row in rows:
+            wer = row["wer"]
+            folder = row["folder"]
+            if wer is None or folder is None: continue
+            wer = float(wer)
+            if wer < 0.0: continue
+            model = row["model"]
+            if model != last_model: # rows of a model mostly come in runs
+                by_folder = cells.get(model)
+                if by_folder is None:
+                    by_folder = cells[model] = {}
+                    leaderboard.models[model] = Aggregate()
+                aggregate = leaderboard.models[model]
+                last_model = model
+            cell = by_folder.get(folder)
+            if cell is None: cell = by_folder[folder] = Aggregate()
+            cell.count += 1
+            cell.total += wer
+            cell.squares += wer * wer
+            aggregate.count += 1
+            aggregate.total += wer
+            aggregate.squares += wer * wer
+        st = dict((folder, cell.total / cell.count) for folder, cell in cells.get("ST", {}).items())
+        for model, by_folder in cells.items():
+            if model == "ST": continue
+            delta = Aggregate()
+            for folder, cell in by_folder.items():
+                if folder in st:
+                    value = cell.total / cell.count - st[folder]
+                    delta.count += 1
+                    delta.total += value
+                    delta.squares += value * value
+            if delta.count: leaderboard.deltas[model] = delta
+        return leaderboard
+
+    # adds the WER of a job, rows without a WER (registered models, failed evaluations) are skipped
+    def add(self, model, folder, wer):
+        if wer is None or folder is None or float(wer) < 0.0: return
+        wer = float(wer)
+        self.models.setdefault(model, Aggregate()).add(wer)
+        cell = self.cells.setdefault(model, {}).setdefault(folder, Aggregate())
+        models = [model] if model != "ST" else [name for name, cells in self.cells.items() if name != "ST" and folder in cells]
+        # the deltas of the cells that change are taken out and put back with the new cell mean
+        self.update_deltas(models, folder, -1)
+        cell.add(wer)
+        self.update_deltas(models, folder, 1)
+
+    def update_deltas(self, models, folder, weight):
+        st = self.cells.get("ST", {}).get(folder)
+        if st is None or st.count == 0: return
+        for model in models:
+            cell = self.cells[model].get(folder)
+            if cell is None or cell.count == 0: continue
+            self.deltas.setdefault(model, Aggregate()).add(cell.mean() - st.mean(), weight)
+
+    # returns {folder: mean WER} of a model
+    def folder_wers(self, model):
+        return dict((folder, cell.mean()) for folder, cell in self.cells.get(model, {}).items())
+
+    # returns the models ordered by mean WER
+    def ranking(self):
+        return sorted(self.models, key=lambda model: (self.models[model].mean(), model))
+
+    # returns the leaderboard as a JSON-serializable dict; winners are models marked as the best of their sweep
+    # the WER of each model on each folder is left out, see folders_dict
+    def to_dict(self, winners=()):
+        entries = []
+        for rank, model in enumerate(self.ranking()):
+            aggregate = self.models[model]
+            interval = aggregate.interval(self.confidence)
+            entry = {"rank": rank + 1, "model": model, "wer": rounded(aggregate.mean()), "jobs": aggregate.count,
+                     "sd": rounded(aggregate.sd()), "interval": [rounded(value) for value in interval] if interval else None}
+            delta = self.deltas.get(model)
+            if model != "ST" and delta is not None and delta.count > 0:
+                interval = delta.interval(self.confidence)
+                entry["vs_st"] = {"delta": rounded(delta.mean()), "folders": delta.count,
+                                  "interval": [rounded(value) for value in interval] if interval else None}
+            if model in winners: entry["best_of_sweep"] = True
+            entries.append(entry)
+        return {"confidence": self.confidence, "models": entries}
+
+    # returns the per-folder breakdown as a JSON-serializable dict: {model: {folder: {"wer", "jobs"}}}
+    def folders_dict(self):
+        return dict((model, dict((folder, {"wer": rounded(cell.mean()), "jobs": cell.count}) for folder, cell in sorted(self.cells[model].items()))) \
+                    for model in self.ranking())
+
+    # returns the leaderboard as text, one "model-name: WER" line per model followed by its confidence interval
+    # and delta vs ST
+    def to_text(self, winners=()):
+        output = "model-name: WER\n\n"
+        percent = str(int(round(self.confidence * 100))) + "% CI "
+        for model in self.ranking():
+            aggregate = self.models[model]
+            output += ("Standard Transcribe (ST)" if model == "ST" else model) + ": " + str(aggregate.mean())
+            details = []
+            interval = aggregate.interval(self.confidence)
+            if interval: details.append(percent + str(round(interval[0], 2)) + " to " + str(round(interval[1], 2)))
+            details.append(str(aggregate.count) + (" job" if aggregate.count == 1 else " jobs"))
+            delta = self.deltas.get(model)
+            if model != "ST" and delta is not None and delta.count > 0:
+                details.append("vs ST " + ("%+.2f" % delta.mean()) + " over " + str(delta.count) + \
+                               (" folder" if delta.count == 1 else " folders"))
+            output += " (" + ", ".join(details) + ")" + (" (best of its sweep)" if model in winners else "") + "\n\n"
+        return output
+
+def rounded(value, digits=4):
+    return round(value, digits) if value is not None else None
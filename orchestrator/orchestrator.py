@@ -1,33 +1,46 @@
 # orchestrates the workflow
+# modules with heavy dependencies (Wikipedia download, corpus building, WER) are imported when first needed
 
-from data_download.wiki_data import WikiData
 from transcribe.transcribe import Transcribe
+from transcribe.result_cache import TranscriptionCache
 from data_preparation.normalize_text import NormalizeText
-from wer.asr import AsrEval
-import pandas as pd
-import io, operator
-from io import StringIO
+from wer.word_errors import WordErrors
+import json
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-import boto3, uuid, logging, sys, re
+import uuid, logging, sys, re, time
+from aws.clients import get_client
+from aws.s3 import listS3Files
+from metrics.metrics import METRICS, aws_usage, aws_usage_since, write_prometheus_textfile
+from orchestrator.run_store import RunStore
+from orchestrator.input_index import InputIndex, estimated_duration
+from orchestrator.staged_evaluation import StagedEvaluation
+from orchestrator.leaderboard import Leaderboard
+from keyword_extraction.keywords import KeywordExtractor, POSCache, make_tagger
 
 logger = logging.getLogger()
 
+LEARNED_KEYWORDS = "learned_keywords.txt"
+# CLM variants trained with self-heal: one per combination of base model, corpus and use of tuning data
+# corpora are "all" (pages of all keywords files), "keywords" (all but learned_keywords.txt) or "learned" (learned_keywords.txt)
+SWEEP_DEFAULTS = {"base_models": ["WideBand"], "corpora": ["all"], "tuning_data": [False]}
+CORPORA = ("all", "keywords", "learned")
+
+# Returns the keywords whose pages make up a corpus (None for all), given the keywords of each keywords file
+def corpus_keywords(corpus, keywords_by_file):
+    if corpus == "all": return None
+    return [keyword for name, keywords in keywords_by_file.items() if (name == LEARNED_KEYWORDS) == (corpus == "learned") \
+            for keyword in keywords]
+
 # Parses keywords from missedwords of Transcribe and CLM
-# Uses Amazon Comprehend
-def parseKeywords(text):
-    nouns = set()
-    comprehend = boto3.client(service_name='comprehend', region_name=boto3.Session().region_name)
-    syntax = comprehend.detect_syntax(Text=text, LanguageCode='en')
-    for synt in syntax['SyntaxTokens']:
-        pos = synt['PartOfSpeech']['Tag']
-        if (pos == 'NOUN') | (pos == 'PROPN'):
-            nouns.add(synt['Text'])
-    return ", ".join(nouns)
+# Uses the tagger of make_tagger (Amazon Comprehend or NLTK), words found in pos_cache are not tagged again
+def parseKeywords(words, tagger, pos_cache=None):
+    extractor = KeywordExtractor(tagger, pos_cache)
+    return ", ".join(sorted(extractor.extract(words)))
 
 # Returns text from a S3 file
 def readS3TextFile(bucket, key):
-    # connect to S3 using boto3 client
-    s3_client = boto3.client(service_name='s3')
+    s3_client = get_client('s3')
     try:
         # get S3 object
         result = s3_client.get_object(Bucket=bucket, Key=key) 
@@ -38,19 +51,9 @@ def readS3TextFile(bucket, key):
 
 # Saves text as a file in S3
 def saveTextAsFileinS3(text, bucket, filename):
-    s3 = boto3.resource('s3')
-    object = s3.Object(bucket, filename)
-    result = object.put(Body=text)
+    s3_client = get_client('s3')
+    s3_client.put_object(Body=text, Bucket=bucket, Key=filename)
     
-# Returns a list of all files under an S3 prefix
-def listS3Files(bucket, prefix):
-    s3 = boto3.resource('s3')
-    my_bucket = s3.Bucket(bucket)
-    files = []
-    for object_summary in my_bucket.objects.filter(Prefix=prefix):
-        files.append(object_summary.key)
-    return files
-
 # Updates the learned_keywords file
 def update_missed_words(bucket, key, new_words):
     existing = readS3TextFile(bucket, key)
@@ -63,39 +66,6 @@ def update_missed_words(bucket, key, new_words):
     result = ', '. join(set(existing))
     saveTextAsFileinS3(result, bucket, key)
 
-from nltk.corpus import stopwords
-    
-# Cleans text
-def clean(text):
-    text = text.strip()
-    if "*" in text: return None
-    if text.endswith("."): return None
-    if text.endswith(","): return None
-    if len(text)<3: return None
-    return text.lower()
-    
-# Takes a reference object (from asr-evaluation) as input and returns a list of missed words
-BTOKEN, ETOKEN = "\\x1b[31m", "\\x1b[0m"
-def find_missed_words(ref):
-    decoded_string = ref #ref.decode('utf-8')
-    count = 0
-    start = 0
-    words = set()
-    while True:
-        count += 1
-        begin = decoded_string.find(BTOKEN, start)
-        if begin==-1: break
-        end = decoded_string.find(ETOKEN, begin)
-        word = decoded_string[begin+len(BTOKEN): end]
-        cleaned = clean(word)
-        if cleaned: words.add(cleaned.strip())
-        start = end
-        if start==-1: break
-        if count>100: break
-    filtered_words = [word for word in words if word not in stopwords.words('english')]
-    #filtered_words = ", ".join(filtered_words)
-    return filtered_words
-
 # removes non-alphanumeric characters
 def replaceNonAlpha(wordSet):
     newSet = set()
@@ -108,6 +78,9 @@ def replaceNonAlpha(wordSet):
 # runs standard transcription and CLM transcription on all input files,
 # normalizes the transcription output, calculates WERs and stores the result in S3
 class Orchestrator:
+    # ground truth files of at least this many bytes are normalized line by line while they are read
+    STREAM_MIN_BYTES = 16*1024*1024
+
     def __init__(self, bucket, keywords_prefix, data_prefix, out_prefix, bucket_prefix, result_prefix):
         self.bucket = bucket
         self.keywords_prefix = keywords_prefix
@@ -115,153 +88,453 @@ class Orchestrator:
         self.out_prefix = out_prefix
         self.bucket_prefix = bucket_prefix
         self.result_prefix = result_prefix
-        self.RUNS_FILE = "runs.csv"
-        self.RUNS_DF = self.readRuns(bucket)
+        self.RUNS_FILE = "runs.csv" # legacy results file, migrated into the run store on first load
+        self.runs = self.readRuns(bucket)
+        self.leaderboard = Leaderboard.from_rows(self.runs.rows)
+        self.sweeps = self.readSweeps()
+
+    # all results as a pandas DataFrame
+    @property
+    def RUNS_DF(self):
+        return self.runs.to_dataframe()
         
-    # saves model leadership to S3
-    def saveLeaderboard(self):
-        df = self.RUNS_DF
-        df['wer'] = df.wer.astype(float)
-        df = df[df["wer"]>=0.0]
-        g = df.groupby('model')
-        result = {}
-        output = "model-name: WER\n\n"
-        for name, row in g:
-            result[name] = row["wer"].mean()
-        for key in dict(sorted(result.items(), key=operator.itemgetter(1))):
-            if key == "ST":
-                output += "Standard Transcribe (ST)" + ": "
-            else:
-                output += key + ": "
-            output += str(result[key]) + "\n\n"
-        saveTextAsFileinS3(output, self.bucket, self.result_prefix+"leaderboard.txt")
+    # saves model leadership to S3, as text and as JSON (result/leaderboard.json), from the running aggregates
+    # with folders, also saves the WER of each model on each folder (result/leaderboard_folders.json), which is
+    # O(models x folders) and only done at the end of a run
+    def saveLeaderboard(self, folders=True):
+        winners = set(sweep["winner"] for sweep in self.sweeps.values() if sweep.get("winner"))
+        saveTextAsFileinS3(self.leaderboard.to_text(winners), self.bucket, self.result_prefix+"leaderboard.txt")
+        saveTextAsFileinS3(json.dumps(self.leaderboard.to_dict(winners), indent=1), self.bucket, self.result_prefix+"leaderboard.json")
+        if folders:
+            saveTextAsFileinS3(json.dumps(self.leaderboard.folders_dict(), separators=(",", ":")), self.bucket, \
+                               self.result_prefix+"leaderboard_folders.json")
         
     # method to return CLM model names from past runs
     def getCLMNames(self):
-        dftemp = self.RUNS_DF[self.RUNS_DF["model"] != "ST"]
-        return dftemp["model"].unique()
+        return [name for name in self.runs.model_names() if name != "ST"]
     
+    # method to return the words missed by standard Transcribe on a folder in past runs
     def get_ST_words(self, folder_name):
-        dftemp = self.RUNS_DF[((self.RUNS_DF["model"]=="ST") & (self.RUNS_DF["folder"]==folder_name))]
-        return list(dftemp["missed_words"])
+        words = []
+        for missed in [row["missed_words"] for row in self.runs.get("ST", folder_name)]:
+            if isinstance(missed, str): words.extend(word.strip() for word in missed.split(",") if word.strip())
+        return words
+
+    # method to return the word errors of standard Transcribe on a folder,
+    # counted in this run if ST ran on it, otherwise rebuilt from the missed words of past runs
+    def get_ST_errors(self, folder_name):
+        if (folder_name, "ST") in self.word_errors: return self.word_errors[(folder_name, "ST")]
+        return WordErrors.from_missed_words(self.get_ST_words(folder_name))
+
+    # method to load the word errors saved by an earlier session of a run
+    def loadWordErrors(self, master_uuid):
+        text = readS3TextFile(self.bucket, self.result_prefix + "word_errors/" + master_uuid + ".json")
+        if text is None: return
+        for job in json.loads(text)["jobs"]:
+            self.word_errors[(job["folder"], job["model"])] = WordErrors.from_dict(job["errors"])
+
+    # method to save the word errors of all jobs of a run to S3 as one compact JSON artifact
+    def saveWordErrors(self, master_uuid):
+        if len(self.word_errors) == 0: return
+        artifact = {"run": master_uuid, "jobs": []}
+        for (folder, model), errors in self.word_errors.items():
+            artifact["jobs"].append({"folder": folder, "model": model, "errors": errors.to_dict()})
+        saveTextAsFileinS3(json.dumps(artifact, separators=(",", ":")), self.bucket, self.result_prefix + "word_errors/" + master_uuid + ".json")
         
-    # method to read runs.csv file if it exists
+    # method to load past results, stored as parts under result/runs/ (runs.csv is migrated if there are none)
     def readRuns(self, bucket):
-        csvString = readS3TextFile(bucket, self.result_prefix + self.RUNS_FILE)
-        if csvString != None:
-            csvStringIO = StringIO(csvString)
-            df = pd.read_csv(csvStringIO, sep=",")
-            df['folder'] = df.folder.astype(str) # to take care of numerical folder namnes
-        else:
-            df = pd.DataFrame(columns=["model", "folder", "wer", "missed_words", "fixed_words"]) 
-        return df
+        return RunStore(bucket, self.result_prefix + "runs/", self.result_prefix + self.RUNS_FILE).load()
     
+    # method to load the CLM sweeps of past runs: run id -> {"variants", "winner"}
+    def readSweeps(self):
+        text = readS3TextFile(self.bucket, self.result_prefix + "sweeps.json")
+        return json.loads(text) if text else {}
+
+    # method to list the CLM variants to train, see SWEEP_DEFAULTS
+    # a single variant keeps the model name of earlier versions, clm-model-<run id>
+    def planSweep(self, master_uuid, sweep_options=None):
+        options = dict(SWEEP_DEFAULTS, **(sweep_options or {}))
+        variants = []
+        for base_model in options["base_models"]:
+            for corpus in options["corpora"]:
+                if corpus not in CORPORA: raise ValueError("unknown corpus: " + str(corpus))
+                for tuning in options["tuning_data"]:
+                    variants.append({"base_model": base_model, "corpus": corpus, "tuning": bool(tuning)})
+        for variant in variants:
+            suffix = "-" + ("nb" if variant["base_model"] == "NarrowBand" else "wb") + "-" + variant["corpus"] + ("-tuned" if variant["tuning"] else "")
+            variant["name"] = "clm-model-" + master_uuid + (suffix if len(variants) > 1 else "")
+        return variants
+
+    # method that builds the training data of the variants and starts training all of them at once
+    # returns {future of the final status: variant}, variants without training data are left out
+    def startSweep(self, transcribe, variants, role_arn, corpus_options, keywords_by_file):
+        corpus_options = dict(corpus_options or {})
+        build = corpus_options.pop("enabled", False)
+        uris = {}
+        for corpus in sorted(set(variant["corpus"] for variant in variants)):
+            if not build:
+                # without the corpus builder the CLM is trained on all downloaded pages
+                if corpus != "all": logger.warning("the " + corpus + " corpus needs CORPUS['enabled'], using all downloaded pages")
+                uris[corpus] = "s3://" + self.bucket + "/" + self.data_prefix
+                continue
+            # build a deduplicated corpus within the size budget from the downloaded pages
+            corpus_prefix = self.bucket_prefix + ("training_corpus/" if corpus == "all" else "training_corpus_" + corpus + "/")
+            from data_preparation.corpus_builder import CorpusBuilder
+            with METRICS.span("corpus_build", corpus=corpus), METRICS.profile("corpus_build"):
+                stats = CorpusBuilder(**corpus_options).build(self.bucket, self.data_prefix, corpus_prefix, \
+                                                              corpus_keywords(corpus, keywords_by_file))
+            if stats["kept"] == 0:
+                logger.warning("the " + corpus + " corpus is empty, its CLM variants are skipped")
+                continue
+            uris[corpus] = "s3://" + self.bucket + "/" + corpus_prefix
+        tuning_uri = None
+        if any(variant["tuning"] for variant in variants):
+            tuning_prefix = self.bucket_prefix + "tuning_data/"
+            if listS3Files(self.bucket, tuning_prefix): tuning_uri = "s3://" + self.bucket + "/" + tuning_prefix
+            else: logger.warning("no tuning data under " + tuning_prefix + ", CLM variants with tuning data are skipped")
+        training = {}
+        for variant in variants:
+            if variant["corpus"] not in uris or (variant["tuning"] and not tuning_uri):
+                variant["status"] = "SKIPPED"
+                continue
+            variant["started"] = time.time()
+            future = transcribe.start_clm_training(variant["name"], uris[variant["corpus"]], role_arn, variant["base_model"], \
+                                                   tuning_uri if variant["tuning"] else None)
+            training[future] = variant
+        return training
+
+    # method called when a CLM variant finished training, registers a trained model and returns its transcription jobs
+    def modelTrained(self, variant, future, inputs):
+        try:
+            variant["status"] = future.result()
+        except Exception as e:
+            logger.warning("status of " + variant["name"] + " unknown: " + str(e))
+            variant["status"] = "FAILED"
+        METRICS.observe("clm_training", time.time() - variant["started"], variant["started"], model=variant["name"])
+        if variant["status"] != "COMPLETED":
+            logger.warning("CLM " + variant["name"] + " training " + variant["status"].lower())
+            return []
+        logger.info("CLM " + variant["name"] + " training completed")
+        if variant["name"] not in self.runs.model_names():
+            self.runs.append([variant["name"], None, None, None, None])
+        return self.planJobs(inputs, [variant["name"]], with_st=False)
+
+    # method that picks the trained variant with the lowest mean WER over the folders all trained variants were evaluated on,
+    # and saves the variants and winner of a sweep to result/sweeps.json
+    # dropped variants (model -> reason, see StagedEvaluation) can't win
+    def saveSweep(self, master_uuid, variants, dropped=None):
+        dropped = dropped or {}
+        wers = {}
+        for variant in variants:
+            if variant.get("status") != "COMPLETED" or variant["name"] in dropped: continue
+            wers[variant["name"]] = self.modelWers(variant["name"])
+        evaluated = [folders for folders in wers.values() if folders]
+        common = set.intersection(*[set(folders) for folders in evaluated]) if evaluated else set()
+        sweep = {"variants": [], "folders": len(common), "winner": None}
+        for variant in variants:
+            entry = dict((key, variant.get(key)) for key in ("name", "base_model", "corpus", "tuning", "status"))
+            if variant["name"] in dropped: entry["dropped"] = dropped[variant["name"]]
+            folders = wers.get(variant["name"]) or self.modelWers(variant["name"])
+            values = [folders[folder] for folder in common if folder in folders] # dropped variants miss some folders
+            if values: entry["wer"] = sum(values) / len(values)
+            sweep["variants"].append(entry)
+        scored = [entry for entry in sweep["variants"] if "wer" in entry and "dropped" not in entry]
+        if scored:
+            sweep["winner"] = min(scored, key=lambda entry: entry["wer"])["name"]
+            logger.info("best CLM variant: " + sweep["winner"] + " (WER " + str(round(min(entry["wer"] for entry in scored), 2)) + \
+                        " over " + str(len(common)) + " folders)")
+        self.sweeps = self.readSweeps()
+        self.sweeps[master_uuid] = sweep
+        saveTextAsFileinS3(json.dumps(self.sweeps, indent=1), self.bucket, self.result_prefix + "sweeps.json")
+        return sweep
+
+    # method to return {folder: WER} of a model over all runs (the mean WER of a folder it ran on more than once)
+    def modelWers(self, model):
+        return self.leaderboard.folder_wers(model)
+
     # method to check if a given model (ST or CLM) was run against an input folder
     def ranBefore(self, model_name, input_folder):
-        dftemp = self.RUNS_DF[((self.RUNS_DF["model"]==model_name) & (self.RUNS_DF["folder"]==input_folder))]
-        if len(dftemp)==0: return False
-        return True
+        return self.runs.ran_before(model_name, input_folder)
         
+    # method to list input folders and pair their ground truth and media files (see InputIndex)
+    def readInputs(self, input_options=None):
+        index = InputIndex(self.bucket, self.bucket_prefix+"input/", self.result_prefix+"input_manifest.json", **(input_options or {}))
+        return index.load().scan().inputs()
+
+    # method to list the (folder, model) jobs that were not run before, in the same order as a serial run
+    def planJobs(self, inputs, clm_modelnames, with_st=True):
+        jobs = []
+        for entry in inputs:
+            job = {"folder": entry["folder"], "media": "s3://" + self.bucket + "/" + entry["media"], "gt_file": entry["gt_file"], \
+                   "media_duration": estimated_duration(entry["size"])}
+            for model in (["ST"] if with_st else []) + clm_modelnames:
+                if not self.ranBefore(model, entry["folder"]):
+                    jobs.append(dict(job, model=model))
+        return jobs
+
+    # method that runs one transcription job (ST or CLM) and returns the transcription text
+    # submitted is the time the job was queued for a worker, recorded as its "queued" span
+    def runJob(self, transcribe, job, master_uuid, role_arn, submitted=None):
+        if submitted: METRICS.observe("queued", time.time() - submitted, submitted, folder=job["folder"], model=job["model"])
+        name = re.sub('[^0-9a-zA-Z._-]', '-', job["folder"]) # folder ids of multi-media folders contain a "/"
+        with METRICS.span("transcription", folder=job["folder"], model=job["model"]):
+            if job["model"] == "ST":
+                my_uuid = master_uuid + "-ST-" + name
+                return transcribe.get_standard_transcribe_text(job["media"], self.bucket, self.out_prefix, my_uuid, \
+                            media_duration=job["media_duration"])
+            my_uuid = master_uuid + "-" + job["model"] + "-" + name
+            clmText, clmModelName = transcribe.get_clm_transcribe_text(job["media"], self.bucket, self.out_prefix, my_uuid, \
+                            clmModelName=job["model"], training_data_s3=None, role_arn=role_arn, media_duration=job["media_duration"])
+            return clmText
+
+    # method that calculates the WER, word errors and missed words of a normalized transcription
+    def evaluateJob(self, job, n_text, n_gtText):
+        with METRICS.span("evaluation", folder=job["folder"], model=job["model"]), METRICS.profile("evaluation"):
+            from wer.asr import AsrEval
+            result = AsrEval().evaluate(n_gtText, n_text)
+            wer = result.wer_str()
+            self.word_errors[(job["folder"], job["model"])] = WordErrors.from_alignment(result.alignment)
+            words = self.word_errors[(job["folder"], job["model"])].missed_words()
+        if job["model"] == "ST":
+            logger.info("wer_st = " + wer)
+            logger.info("Standard Transcribe missed words: ")
+        else:
+            logger.info("wer_clm = " + wer)
+            logger.info("CLM missed words: ")
+        logger.info(words)
+        return wer, words
+
+    # method that reads the transcriptions of finished jobs and the ground truths not read yet, and normalizes them
+    # in one batch (on a process pool when there is a lot of text); ground truths of at least STREAM_MIN_BYTES are
+    # normalized line by line while they are read. finished is a list of (future, job), normalized ground truths are
+    # added to gt_texts; returns {future: normalized transcription} of the jobs that can be evaluated
+    # a job whose transcription failed (Transcribe job FAILED, missing output, ...) or whose ground truth is unreadable
+    # is logged and left out, it is not recorded so the next run tries it again
+    def normalizeJobs(self, finished, gt_texts):
+        texts = {}
+        for future, job in finished:
+            try:
+                texts[future] = future.result()
+            except Exception as e:
+                logger.error("job of " + job["model"] + " on " + job["folder"] + " failed: " + str(e))
+        gt_raw = {} # ground truth file -> text to normalize in the batch
+        with METRICS.span("ground_truth"):
+            for future, job in finished:
+                key = job["gt_file"]
+                if future not in texts or key in gt_texts or key in gt_raw: continue
+                try:
+                    response = get_client('s3').get_object(Bucket=self.bucket, Key=key)
+                    if response.get("ContentLength", 0) < self.STREAM_MIN_BYTES:
+                        gt_raw[key] = response["Body"].read().decode('utf-8')
+                    else:
+                        gt_texts[key] = "\n".join(self.normalizer.normalize_stream(response["Body"].iter_lines()))
+                except Exception as e:
+                    logger.error("ground truth " + key + " not readable: " + str(e))
+        for future, job in finished:
+            if future in texts and job["gt_file"] not in gt_raw and job["gt_file"] not in gt_texts:
+                logger.error("job of " + job["model"] + " on " + job["folder"] + " failed: ground truth " + job["gt_file"] + " not readable")
+                del texts[future]
+        normalized = self.normalizer.normalize_many(list(gt_raw.values()) + list(texts.values()))
+        gt_texts.update(zip(gt_raw, normalized[:len(gt_raw)]))
+        return dict(zip(texts, normalized[len(gt_raw):]))
+
+    # method that evaluates a finished transcription job against its normalized ground truth, returns (wer, words)
+    # or None if the evaluation failed (logged)
+    def finishJob(self, job, n_text, gt_texts):
+        try:
+            return self.evaluateJob(job, n_text, gt_texts[job["gt_file"]])
+        except Exception as e:
+            logger.error("job of " + job["model"] + " on " + job["folder"] + " failed: " + str(e))
+            return None
+
+    # method that adds the result of an evaluated job to the run store and the leaderboard
+    def recordJob(self, job, wer, words):
+        words_str = ", ".join(words)
+        self.leaderboard.add(job["model"], job["folder"], wer)
+        if job["model"] == "ST":
+            self.runs.append(['ST', job["folder"], wer, words_str, ""])
+            return
+        fixedwords = ", ".join(self.get_ST_errors(job["folder"]).fixed_by(self.word_errors[(job["folder"], job["model"])]))
+        logger.info("Words fixed by CLM:")
+        logger.info(fixedwords)
+        self.runs.append([job["model"], job["folder"], wer, words_str, fixedwords])
+
+    # method to save the run report (stage and job timings, counters, AWS usage) next to leaderboard.txt,
+    # and optionally as a Prometheus textfile
+    def saveReport(self, master_uuid, aws_before, cache=None, prometheus_textfile=None):
+        if cache:
+            for name, value in cache.stats().items(): METRICS.count("transcription_cache." + name, value)
+        report = METRICS.report(master_uuid, aws_usage_since(aws_before))
+        saveTextAsFileinS3(json.dumps(report, indent=1), self.bucket, self.result_prefix + "reports/" + master_uuid + ".json")
+        if prometheus_textfile: write_prometheus_textfile(prometheus_textfile, report)
+        logger.info("run report: " + ", ".join(name + " " + str(stage["seconds"]) + "s" for name, stage in report["stages"].items()))
+        return report
+
     # method that runs all required steps in this transcription workflow
-    def run(self, self_heal, role_arn=None):
-        master_uuid = str(uuid.uuid4()) # unique id to connect related transcription runs
-        transcribe = Transcribe()
+    # max_in_flight is the maximum number of transcription jobs running at the same time
+    # wiki_options are passed to WikiData to configure Wikipedia downloads
+    # normalize_options are passed to NormalizeText to set the filler words and punctuation of a domain
+    # resume_run_id continues an interrupted run: its jobs and CLM are reattached by name and only missing work is submitted
+    # cache_options (enabled, ttl, max_entries) control the cache of transcription outputs by media content and model
+    # input_options are passed to InputIndex to configure the listing of input folders
+    # keyword_options (engine and its settings) are passed to make_tagger to select keyword extraction from missed words
+    # corpus_options (enabled, max_bytes, ...) are passed to CorpusBuilder, which builds the CLM training corpus
+    # sweep_options (base_models, corpora, tuning_data) select the CLM variants trained with self-heal, see SWEEP_DEFAULTS;
+    # they are trained at the same time, each is evaluated as soon as it is trained and the best one is marked in the leaderboard
+    # evaluation_options (staged, stages, min_folders, alpha, margin): with staged, models are first run on a stratified
+    # sample of the folders and models that can't win are not run on the others, see StagedEvaluation
+    # poll_options (min_interval, max_interval, ...) are passed to JobPoller, e.g. to poll local stand-ins quickly
+    # report_options (enabled, profile, prometheus_textfile) control the run report saved under result/reports/,
+    # leaderboard_interval the seconds between refreshes of the leaderboard while jobs are running
+    def run(self, self_heal, role_arn=None, max_in_flight=1, wiki_options=None, normalize_options=None, resume_run_id=None, \
+            cache_options=None, input_options=None, keyword_options=None, corpus_options=None, poll_options=None, report_options=None, \
+            sweep_options=None, evaluation_options=None):
+        master_uuid = resume_run_id or str(uuid.uuid4()) # unique id to connect related transcription runs
+        logger.info(("resuming" if resume_run_id else "starting") + " run " + master_uuid)
+        report_options = dict(report_options or {})
+        METRICS.reset()
+        METRICS.profiling = report_options.get("profile", False)
+        aws_before = aws_usage()
+        cache_options = dict(cache_options or {})
+        cache = None
+        if cache_options.pop("enabled", False):
+            cache = TranscriptionCache(self.bucket, self.out_prefix + "transcription_cache.json", **cache_options).load()
+        transcribe = Transcribe(name_filter=master_uuid, resume=resume_run_id is not None, cache=cache, poll_options=poll_options)
+        self.normalizer = NormalizeText(**(normalize_options or {}))
+        self.word_errors = {} # (folder, model) -> WordErrors of jobs evaluated in this run
+        if resume_run_id: self.loadWordErrors(master_uuid)
         
+        variants = []
+        training = {} # future -> CLM variant still training, its jobs are submitted once it is trained
         if self_heal:
             # read keywords file and download wiki files
-            wd = WikiData()
-            wd.download_data(self.bucket, self.data_prefix, self.keywords_prefix)
+            from data_download.wiki_data import WikiData
+            wd = WikiData(**(wiki_options or {}))
+            with METRICS.span("wiki_download"):
+                wd.download_data(self.bucket, self.data_prefix, self.keywords_prefix)
             logger.info("downloaded wikipedia data")
             
-            # train a new CLM
-            logger.info("start of new CLM model training")
-            training_data_uri = "s3://" + self.bucket + "/" + self.data_prefix
-            clmModelName = transcribe.train_clm(training_data_uri, role_arn, master_uuid)
-            self.RUNS_DF.loc[len(self.RUNS_DF.index)] = [clmModelName, None, None, None, None]
-            logger.info("new CLM model training completed")
+            # start training new CLMs, other jobs run in the meantime
+            variants = self.planSweep(master_uuid, sweep_options)
+            logger.info("start of training " + str(len(variants)) + " new CLM model(s)")
+            training = self.startSweep(transcribe, variants, role_arn, corpus_options, wd.keywords_by_file)
             
-        # makes a dictionary of input ground truth and audio files
-        inputs = {}
-        input_files = listS3Files(self.bucket, self.bucket_prefix+"input/")
-        for myfile in input_files:
-            if myfile[-1] != "/": # not a directory
-                directory = myfile.split("/")[-2]
-                #print(myfile, directory)
-                if directory not in inputs: inputs[directory] = []
-                inputs[directory].append(myfile)
+        # makes a list of input ground truth and audio files
+        with METRICS.span("read_inputs"):
+            inputs = self.readInputs(input_options)
         logger.info("read inputs ..")
         
         missed_words = set()
-        clm_modelnames = self.getCLMNames()
-        for key in inputs.keys():
-            if inputs[key][0].endswith(".txt"):
-                s3media = inputs[key][1]
-                gt_file = inputs[key][0]
-            else: 
-                s3media = inputs[key][0]
-                gt_file = inputs[key][1]
-            s3media = "s3://" + self.bucket + "/" + s3media
-            
-            # load and normalize ground truth
-            gtText = readS3TextFile(self.bucket, gt_file)
-            normalize = NormalizeText()
-            n_gtText = normalize.normalize(gtText)
-                
-            # run standard transription if it is not run before on this folder
-            if not self.ranBefore("ST", str(key)):
-                my_uuid = master_uuid + "-ST-" + str(key)
-                # run standard transcription
-                stText = transcribe.get_standard_transcribe_text(s3media, self.bucket, self.out_prefix, my_uuid)
+        for errors in self.word_errors.values(): missed_words.update(errors.missed_words()) # from an earlier session of this run
+        evaluation_options = dict(evaluation_options or {})
+        staged = StagedEvaluation(inputs, **evaluation_options) if evaluation_options.pop("staged", False) else None
+        variant_names = set(variant["name"] for variant in variants)
+        clm_modelnames = [name for name in self.getCLMNames() if name not in variant_names]
+        if staged: planned = self.planJobs(staged.inputs(), staged.models(clm_modelnames))
+        else: planned = self.planJobs(inputs, clm_modelnames)
+        logger.info("submitting " + str(len(planned)) + " transcription jobs")
         
-                # normalize transcriptions
-                normalize = NormalizeText()
-                n_stText = normalize.normalize(stText)
-        
-                # calculate WERs
-                wer_st, ref = AsrEval().get_WER_REF(n_gtText, n_stText)
-                stwords = find_missed_words(ref)
-                missed_words.update(stwords)
-                logger.info("wer_st = " + wer_st)
-            
-                #self.RUNS_DF.loc[len(self.RUNS_DF.index)] = ['ST', str(key), wer_st, parseKeywords(str(stwords)), ""]
-                stwords_str = ", ".join(stwords)
-                self.RUNS_DF.loc[len(self.RUNS_DF.index)] = ['ST', str(key), wer_st, stwords_str, ""]
-            
-                logger.info("Standard Transcribe missed words: ")
-                logger.info(stwords)
-                #logger.info("\n")
-                
-            for clm_name in clm_modelnames:
-                my_uuid = master_uuid + "-" + clm_name + "-" + str(key)
-                if not self.ranBefore(clm_name, str(key)):
-                    #training_data_uri = "s3://" + self.bucket + "/" + self.data_prefix
-                    clmText, clmModelName = transcribe.get_clm_transcribe_text(s3media, self.bucket, self.out_prefix, my_uuid, \
-                                    clmModelName=clm_name, training_data_s3=None, role_arn=role_arn)
-                    normalize = NormalizeText()
-                    n_clmText = normalize.normalize(clmText)
-                    wer_clm, ref = AsrEval().get_WER_REF(n_gtText, n_clmText)
-                    clmwords = find_missed_words(ref)
-                    missed_words.update(clmwords)
-                    logger.info("wer_clm = " + wer_clm)
-                    logger.info("CLM missed words: ")
-                    logger.info(clmwords)
+        # all pending jobs are submitted up front, the pool keeps at most max_in_flight of them running
+        # jobs of a new CLM are added when it is trained
+        executor = ThreadPoolExecutor(max_workers=max(1, max_in_flight))
+        jobs_started = time.time()
+        try:
+            jobs = {} # future -> submitted job
+            st_pending = set() # folders whose ST job of this run is not finished yet
+            def submit(job):
+                future = executor.submit(self.runJob, transcribe, job, master_uuid, role_arn, time.time())
+                jobs[future] = job
+                if job["model"] == "ST": st_pending.add(job["folder"])
+                return future
+            for job in planned: submit(job)
             
-                    fixedwords = []
-                    stwords = self.get_ST_words(key)
-                    for word in stwords:
-                        if word not in clmwords: fixedwords.append(word)
-                    fixedwords = ", ".join(fixedwords)
-                    logger.info("Words fixed by CLM:")
-                    logger.info(fixedwords)
-                    clmwords_str = ", ".join(clmwords)
-                    self.RUNS_DF.loc[len(self.RUNS_DF.index)] = [clm_name, str(key), wer_clm, clmwords_str, fixedwords]
+            # jobs are evaluated and recorded as they complete; a CLM job is compared to the ST errors of its folder,
+            # so it waits for the ST job of the same run, if there is one
+            gt_texts = {}
+            leaderboard_interval = report_options.get("leaderboard_interval", 60)
+            leaderboard_saved = time.time()
+            deferred = {} # folder -> [(job, wer, words)] of CLM jobs waiting for the ST job of their folder
+            failed = []
+            pending = set(jobs) | set(training)
+            while pending or (staged and not staged.last_stage()):
+                if staged and not staged.last_stage() and pending.issubset(training):
+                    # all jobs of this stage are recorded: test the models and submit the jobs of the next stage
+                    staged.advance(self.getCLMNames(), self.modelWers)
+                    new_jobs = self.planJobs(staged.inputs(), staged.models(self.getCLMNames()))
+                    if new_jobs: logger.info("submitting " + str(len(new_jobs)) + " transcription jobs")
+                    for job in new_jobs: pending.add(submit(job))
+                    continue
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                recorded = 0
+                finished = []
+                for future in done:
+                    if future in training:
+                        new_jobs = self.modelTrained(training.pop(future), future, staged.inputs() if staged else inputs)
+                        if new_jobs: logger.info("submitting " + str(len(new_jobs)) + " transcription jobs")
+                        for job in new_jobs: pending.add(submit(job))
+                    else:
+                        finished.append((future, jobs.pop(future)))
+                # jobs that finished together are normalized in one batch
+                normalized = self.normalizeJobs(finished, gt_texts)
+                for future, job in finished:
+                    result = self.finishJob(job, normalized[future], gt_texts) if future in normalized else None
+                    if result is None: failed.append(job)
+                    else: missed_words.update(result[1])
+                    if job["model"] != "ST" and job["folder"] in st_pending:
+                        if result is not None: deferred.setdefault(job["folder"], []).append((job, ) + result)
+                        continue
+                    finished = [(job, ) + result] if result is not None else []
+                    if job["model"] == "ST":
+                        st_pending.discard(job["folder"])
+                        finished.extend(deferred.pop(job["folder"], []))
+                    for finished_job, wer, words in finished:
+                        self.recordJob(finished_job, wer, words)
+                        recorded += 1
+                # checkpoint: results are persisted as soon as they are recorded, the leaderboard at most every leaderboard_interval
+                if recorded:
+                    with METRICS.span("checkpoint"):
+                        self.runs.flush(master_uuid)
+                    if time.time() - leaderboard_saved >= leaderboard_interval:
+                        with METRICS.span("leaderboard"):
+                            self.saveLeaderboard(folders=False)
+                        leaderboard_saved = time.time()
+            if failed:
+                METRICS.count("failed_jobs", len(failed))
+                logger.warning(str(len(failed)) + " transcription jobs failed, they are run again by the next run or --resume " + master_uuid)
+        except BaseException:
+            # jobs waiting for Transcribe give up, running jobs are reattached by --resume
+            transcribe.stop()
+            executor.shutdown(wait=False, cancel_futures=True)
+            logger.info("run " + master_uuid + " interrupted, continue it with: python main.py --resume " + master_uuid)
+            raise
+        finally:
+            self.runs.flush(master_uuid)
+            try:
+                self.runs.compact_run(master_uuid) # one part per run instead of one per checkpoint
+            except Exception as e:
+                logger.warning("checkpoints of run " + master_uuid + " not compacted: " + str(e))
+            self.saveWordErrors(master_uuid)
+            if cache:
+                cache.save()
+                logger.info("transcription cache: " + str(cache.stats()))
+        executor.shutdown()
+        METRICS.observe("transcription_jobs", time.time() - jobs_started, jobs_started)
+        if staged and staged.dropped:
+            skipped = sum(1 for model in staged.dropped for entry in inputs if not self.ranBefore(model, entry["folder"]))
+            METRICS.count("staged_evaluation.dropped_models", len(staged.dropped))
+            METRICS.count("staged_evaluation.skipped_jobs", skipped)
+            logger.info("staged evaluation: " + str(skipped) + " transcription jobs of " + str(len(staged.dropped)) + " dropped models skipped")
+        if len(variants) > 1: self.saveSweep(master_uuid, variants, staged.dropped if staged else None)
                     
-        s = io.StringIO()
-        self.RUNS_DF.to_csv(s, index=False)
-        save_csv = s.getvalue()
-        saveTextAsFileinS3(save_csv, self.bucket, self.result_prefix + self.RUNS_FILE)
         if len(missed_words)>0:
-            save_missedwords = str(parseKeywords(', '.join(missed_words)))
-            update_missed_words(self.bucket, self.keywords_prefix + "learned_keywords.txt", save_missedwords)
+            with METRICS.span("keywords"):
+                tagger = make_tagger(**(keyword_options or {}))
+                pos_cache = POSCache(self.bucket, self.result_prefix + "pos_cache.json").load() if tagger.remote else None
+                save_missedwords = parseKeywords(missed_words, tagger, pos_cache)
+                if pos_cache: pos_cache.save()
+                update_missed_words(self.bucket, self.keywords_prefix + LEARNED_KEYWORDS, save_missedwords)
             
-        self.saveLeaderboard()
\ No newline at end of file
+        with METRICS.span("leaderboard"):
+            self.saveLeaderboard()
+        if report_options.get("enabled", True):
+            self.saveReport(master_uuid, aws_before, cache, report_options.get("prometheus_textfile"))
\ No newline at end of file
@@ -0,0 +1,137 @@
+# Append-only store of run results (one row per model and input folder)
+import json, csv, io, time
+from concurrent.futures import ThreadPoolExecutor
+from aws.clients import get_client
+from aws.s3 import listS3Files
+
+COLUMNS = ["model", "folder", "wer", "missed_words", "fixed_words"]
+
+# Returns a part file name that sorts in the order parts were written
+def part_name(run_id, seq):
+    return "part-" + time.strftime("%Y%m%dT%H%M%S", time.gmtime()) + "-" + run_id + "-" + str(seq).zfill(5) + ".jsonl"
+
+# Returns the sequence number in a part name, -1 for other names
+def part_seq(key):
+    last = key[:-len(".jsonl")].replace("-compacted", "").rsplit("-", 1)[-1]
+    return int(last) if last.isdigit() else -1
+
+# Reads rows of the legacy runs.csv format
+def read_legacy_csv(text):
+    rows = []
+    for record in csv.DictReader(io.StringIO(text)):
+        # pandas wrote missing values as empty strings
+        rows.append(dict((column, record.get(column) or None) for column in COLUMNS))
+    return rows
+
+# Class holding all past results in memory, indexed by (model, folder)
+# New rows are buffered and persisted as an extra JSONL part under prefix, existing parts are never rewritten
+# except by compact(), which merges all parts into one, and compact_run(), which merges the checkpoints of a run
+class RunStore:
+    def __init__(self, bucket, prefix, legacy_key=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.legacy_key = legacy_key
+        self.rows = []
+        self.index = {} # (model, folder) -> rows
+        self.models = {} # model name -> None, keeps first-seen order
+        self.pending = []
+        self.seq = 0
+        self.parts = {} # key -> rows of the parts loaded or written by this store
+
+    # loads all parts, migrating the legacy runs.csv the first time
+    def load(self):
+        keys = sorted(self.part_keys())
+        if len(keys) == 0 and self.legacy_key:
+            s3_client = get_client('s3')
+            try:
+                text = s3_client.get_object(Bucket=self.bucket, Key=self.legacy_key)["Body"].read().decode('utf-8')
+            except s3_client.exceptions.NoSuchKey:
+                text = None
+            if text:
+                for row in read_legacy_csv(text): self.append(row)
+                self.flush("migrated")
+                return self
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            for key, rows in zip(keys, executor.map(self.read_part, keys)):
+                self.parts[key] = [self.add(row) for row in rows]
+        # parts written by this store sort after the loaded ones, also within the same second
+        self.seq = max([part_seq(key) + 1 for key in keys] + [self.seq])
+        return self
+
+    def part_keys(self):
+        return [key for key in listS3Files(self.bucket, self.prefix) if key.endswith(".jsonl")]
+
+    def read_part(self, key):
+        body = get_client('s3').get_object(Bucket=self.bucket, Key=key)["Body"].read().decode('utf-8')
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+    # adds a row to the in-memory index only
+    def add(self, row):
+        if isinstance(row, (list, tuple)): row = dict(zip(COLUMNS, row))
+        row = dict((column, row.get(column)) for column in COLUMNS)
+        if row["folder"] is not None: row["folder"] = str(row["folder"]) # numerical folder names
+        self.rows.append(row)
+        self.index.setdefault((row["model"], row["folder"]), []).append(row)
+        self.models.setdefault(row["model"], None)
+        return row
+
+    # adds a row (dict or list in COLUMNS order) and buffers it for the next flush
+    def append(self, row):
+        self.pending.append(self.add(row))
+
+    # writes buffered rows as a new part, returns its key (None if nothing was buffered)
+    def flush(self, run_id):
+        if len(self.pending) == 0: return None
+        key = self.prefix + part_name(run_id, self.seq)
+        self.seq += 1
+        body = "".join(json.dumps(row) + "\n" for row in self.pending)
+        get_client('s3').put_object(Body=body, Bucket=self.bucket, Key=key)
+        self.parts[key] = self.pending
+        self.pending = []
+        return key
+
+    # merges the parts of a run (its checkpoints, also those of earlier sessions of a resumed run) into one part,
+    # so the store keeps one part per run; returns the key of the merged part (None if there was at most one)
+    def compact_run(self, run_id):
+        keys = sorted(key for key in self.parts if "-" + run_id + "-" in key.rsplit("/", 1)[-1])
+        if len(keys) <= 1: return None
+        return self.merge(keys, [row for key in keys for row in self.parts[key]])
+
+    # writes rows as one part named after the last of keys, then deletes the other keys
+    def merge(self, keys, rows):
+        # named after the last merged part so parts written later still sort after it
+        key = keys[-1][:-len(".jsonl")] + "-compacted.jsonl"
+        s3_client = get_client('s3')
+        s3_client.put_object(Body="".join(json.dumps(row) + "\n" for row in rows), Bucket=self.bucket, Key=key)
+        old = [k for k in keys if k != key]
+        for i in range(0, len(old), 1000):
+            s3_client.delete_objects(Bucket=self.bucket, Delete={"Objects": [{"Key": k} for k in old[i:i+1000]]})
+        for k in keys: self.parts.pop(k, None)
+        self.parts[key] = rows
+        return key
+
+    # merges all parts into a single part and deletes the merged ones
+    def compact(self):
+        keys = sorted(self.part_keys())
+        if len(keys) <= 1: return None
+        rows = []
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            for part in executor.map(self.read_part, keys): rows.extend(part)
+        return self.merge(keys, rows)
+
+    # True if a model was run against an input folder
+    def ran_before(self, model, folder):
+        return (model, folder) in self.index
+
+    # returns rows of a model on an input folder
+    def get(self, model, folder):
+        return self.index.get((model, folder), [])
+
+    # returns all model names, in the order they first appeared
+    def model_names(self):
+        return list(self.models)
+
+    # returns all rows as a pandas DataFrame
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame(self.rows, columns=COLUMNS)
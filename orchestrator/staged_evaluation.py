@@ -0,0 +1,118 @@
+# Staged evaluation: models are first transcribed on a stratified sample of the input folders, and models that are
+# significantly worse than ST or the best model on the folders so far are not transcribed on the remaining ones
+import hashlib, math, functools, logging
+from statistics import NormalDist
+
+logger = logging.getLogger()
+
+# Returns the inputs ordered so that every prefix is a stratified sample: inputs are split into strata of similar
+# media duration and taken from each in proportion to its size; the order within a stratum is a stable pseudo-random one
+def stratified_order(inputs, strata=3, seed="staged"):
+    by_size = sorted(inputs, key=lambda entry: (entry["size"], entry["folder"]))
+    groups = [by_size[i * len(by_size) // strata:(i + 1) * len(by_size) // strata] for i in range(strata)]
+    groups = [sorted(group, key=lambda entry: hashlib.sha1((seed + entry["folder"]).encode('utf-8')).hexdigest()) for group in groups if group]
+    taken = [0] * len(groups)
+    order = []
+    while len(order) < len(inputs):
+        # the stratum with the smallest share taken so far goes next
+        index = min((i for i in range(len(groups)) if taken[i] < len(groups[i])), key=lambda i: ((taken[i] + 1) / len(groups[i]), i))
+        order.append(groups[index][taken[index]])
+        taken[index] += 1
+    return order
+
+# Returns the regularized incomplete beta function I_x(a, b), by its continued fraction (modified Lentz's method)
+def incomplete_beta(x, a, b):
+    if x <= 0.0: return 0.0
+    if x >= 1.0: return 1.0
+    if x > (a + 1) / (a + b + 2): return 1.0 - incomplete_beta(1.0 - x, b, a) # the fraction converges fast on this side
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1.0 - x)) / a
+    tiny = 1e-300
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    fraction = d
+    for m in range(1, 1000):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)), -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            if abs(c) < tiny: c = tiny
+            fraction *= c * d
+        if abs(c * d - 1.0) < 1e-15: break
+    return front * fraction
+
+# Returns the cumulative distribution function of Student's t distribution with dof degrees of freedom at t
+def t_cdf(t, dof):
+    tail = 0.5 * incomplete_beta(dof / (dof + t * t), dof / 2.0, 0.5)
+    return 1.0 - tail if t > 0 else tail
+
+# Returns the p quantile of Student's t distribution with dof degrees of freedom, by bisection of t_cdf
+# (series approximations are too low at the few degrees of freedom of the first stages)
+@functools.lru_cache(maxsize=1024)
+def t_quantile(p, dof):
+    if p < 0.5: return -t_quantile(1.0 - p, dof)
+    low, high = 0.0, max(1.0, NormalDist().inv_cdf(p))
+    while t_cdf(high, dof) < p: high *= 2
+    for _ in range(200):
+        middle = (low + high) / 2
+        if t_cdf(middle, dof) < p: low = middle
+        else: high = middle
+        if high - low < 1e-12 * high: break
+    return high
+
+# Returns the lower bound of the one-sided 1 - alpha confidence interval of the mean of paired differences
+def lower_bound(differences, alpha):
+    n = len(differences)
+    mean = sum(differences) / n
+    if n < 2: return mean
+    sd = math.sqrt(sum((d - mean) ** 2 for d in differences) / (n - 1))
+    return mean - t_quantile(1 - alpha, n - 1) * sd / math.sqrt(n)
+
+# Class that decides which folders and models are transcribed in each stage of a run
+# stages are growing fractions of the folders (the last one is 1); after each stage, a model whose WER is significantly
+# higher than that of ST or of the best model (one-sided paired t-test over at least min_folders folders, by more than
+# margin) is dropped
+# alpha bounds the chance of dropping a model that is not worse, over the whole run (Bonferroni): it is split over the looks,
+# then over all the comparisons a look could make, each model against ST and against every other model; as the best model
+# is one of them, picking it from the same results does not make the test looser
+class StagedEvaluation:
+    def __init__(self, inputs, stages=(0.2, 0.5, 1.0), min_folders=5, alpha=0.05, margin=0.0, strata=3):
+        self.order = stratified_order(inputs, strata)
+        self.stages = sorted(set(list(stages) + [1.0]))
+        self.min_folders = min_folders
+        self.alpha = alpha / max(1, len(self.stages) - 1)
+        self.margin = margin
+        self.stage = 0
+        self.dropped = {} # model -> reason
+
+    # inputs of the folders of the current stage and all stages before it
+    def inputs(self):
+        return self.order[:int(math.ceil(self.stages[self.stage] * len(self.order)))]
+
+    def last_stage(self):
+        return self.stage == len(self.stages) - 1
+
+    # returns the models of clm_modelnames that are still evaluated
+    def models(self, clm_modelnames):
+        return [model for model in clm_modelnames if model not in self.dropped]
+
+    # tests the models on the folders evaluated so far and moves to the next stage
+    # wers(model) returns {folder: wer} of a model
+    def advance(self, clm_modelnames, wers):
+        folders = set(entry["folder"] for entry in self.inputs())
+        results = dict((model, dict((f, w) for f, w in wers(model).items() if f in folders)) for model in ["ST"] + self.models(clm_modelnames))
+        means = dict((model, sum(r.values()) / len(r)) for model, r in results.items() if model != "ST" and r)
+        best = min(means, key=means.get) if means else None
+        alpha = self.alpha / max(1, len(means) * len(means)) # each model against ST and the other len(means) - 1 models
+        for model in means:
+            for reference in ["ST", best]:
+                if reference == model: continue
+                common = sorted(set(results[model]) & set(results[reference]))
+                if len(common) < self.min_folders: continue
+                bound = lower_bound([results[model][f] - results[reference][f] for f in common], alpha)
+                if bound > self.margin:
+                    self.dropped[model] = "WER higher than " + reference + " by at least " + str(round(bound, 2)) + " over " + str(len(common)) + " folders"
+                    logger.info("staged evaluation: " + model + " dropped, " + self.dropped[model])
+                    break
+        self.stage += 1
+        logger.info("staged evaluation: stage " + str(self.stage + 1) + " of " + str(len(self.stages)) + ", " + \
+                    str(len(self.inputs())) + " of " + str(len(self.order)) + " folders")
@@ -0,0 +1,31 @@
+# Tests import the repository modules the way main.py does, from the repository root
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Returns the text of a file under tests/data
+def read_data(name):
+    with open(os.path.join(DATA, name), encoding="utf-8") as f:
+        return f.read()
+
+import pytest
+
+# S3 stand-in (see benchmarks/stand_ins.py) installed as the shared S3 client for the duration of a test
+@pytest.fixture
+def s3():
+    from aws import clients
+    from benchmarks import stand_ins
+    stand_in = stand_ins.S3StandIn()
+    clients.configure()
+    stand_ins.install(stand_in)
+    yield stand_in
+    clients.configure()
+
+# Transcribe stand-in with jobs that finish quickly, writing their outputs to the S3 stand-in
+@pytest.fixture
+def transcribe(s3):
+    from benchmarks import stand_ins
+    stand_in = stand_ins.TranscribeStandIn(s3, job_delay=0.05, model_delay=0.1)
+    stand_ins.install(stand_in)
+    yield stand_in
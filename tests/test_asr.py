@@ -0,0 +1,86 @@
+# Word error rate: the NumPy alignment against known edit distances and a plain dynamic program, and the asr-evaluation CLI
+import random, shutil
+import pytest
+from wer.asr import AsrEval, align_words, is_exact
+
+# plain O(n * m) word edit distance
+def edit_distance(ref, hyp):
+    prev = list(range(len(hyp) + 1))
+    for i in range(1, len(ref) + 1):
+        cur = [i] + [0] * len(hyp)
+        for j in range(1, len(hyp) + 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ref[i - 1] != hyp[j - 1]))
+        prev = cur
+    return prev[-1]
+
+def errors(alignment):
+    return sum(1 for op, r, h in alignment if op != "equal")
+
+@pytest.mark.parametrize("ref, hyp, distance", [
+    ("the cat sat", "the cat sat", 0),
+    ("the cat sat", "the cat", 1),
+    ("the cat sat", "a cat sat on", 2),
+    ("kitten sitting on the mat", "sitting kitten on mat", 3),
+    ("a b c d e f", "f e d c b a", 6),
+    ("", "a b", 2),
+    ("a b", "", 2),
+])
+def test_known_distances(ref, hyp, distance):
+    alignment = align_words(ref.split(), hyp.split())
+    assert errors(alignment) == distance
+    # the alignment spells out both texts
+    assert [r for op, r, h in alignment if r is not None] == ref.split()
+    assert [h for op, r, h in alignment if h is not None] == hyp.split()
+
+def random_pair(rng):
+    vocabulary = ["w" + str(i) for i in range(8)]
+    ref = [rng.choice(vocabulary) for _ in range(rng.randrange(0, 40))]
+    hyp = list(ref)
+    for _ in range(rng.randrange(0, 15)):
+        edit = rng.randrange(3)
+        position = rng.randrange(len(hyp) + 1)
+        if edit == 0: hyp.insert(position, rng.choice(vocabulary))
+        elif hyp and edit == 1: del hyp[min(position, len(hyp) - 1)]
+        elif hyp: hyp[min(position, len(hyp) - 1)] = rng.choice(vocabulary)
+    if rng.random() < 0.2: hyp = hyp[:len(hyp) // 3] # long deletions drift away from the diagonal
+    return ref, hyp
+
+def test_full_alignment_matches_dynamic_program():
+    rng = random.Random(1)
+    for _ in range(300):
+        ref, hyp = random_pair(rng)
+        assert errors(align_words(ref, hyp)) == edit_distance(ref, hyp)
+
+@pytest.mark.parametrize("band", [1, 2, 5])
+def test_banded_alignment_is_never_below_full(band):
+    rng = random.Random(2)
+    for _ in range(300):
+        ref, hyp = random_pair(rng)
+        banded = align_words(ref, hyp, band)
+        assert errors(banded) >= edit_distance(ref, hyp)
+        assert [r for op, r, h in banded if r is not None] == ref
+
+@pytest.mark.parametrize("band", [1, 2, 5])
+def test_evaluate_falls_back_to_full_alignment(band):
+    rng = random.Random(3)
+    for _ in range(300):
+        ref, hyp = random_pair(rng)
+        banded = align_words(ref, hyp, band)
+        if is_exact(banded, band): assert errors(banded) == edit_distance(ref, hyp)
+        result = AsrEval(band=band).evaluate(" ".join(ref), " ".join(hyp))
+        assert result.substitutions + result.deletions + result.insertions == edit_distance(ref, hyp)
+
+def test_evaluate_counts_and_case():
+    result = AsrEval().evaluate("The cat, sat on the mat.", "the bat sat on mat")
+    assert (result.substitutions, result.deletions, result.insertions) == (1, 1, 0)
+    assert result.wer_str() == "33.333"
+
+def test_empty_texts():
+    assert AsrEval().evaluate("a b c", "").wer == 100.0 # every reference word is deleted
+    assert AsrEval().evaluate("", "a b").wer == 0.0 # no reference words, reported as 0 like asr-evaluation
+
+@pytest.mark.skipif(shutil.which("wer") is None, reason="asr-evaluation is not installed")
+@pytest.mark.parametrize("gt, hyp", [("some ground truth input", "some hypothesis input"), ("a b c", ""),
+                                     ("The cat, sat on the mat.", "the bat sat on mat")])
+def test_native_matches_asr_evaluation(gt, hyp):
+    assert AsrEval().get_WER(gt, hyp)[0] == AsrEval(engine="subprocess").get_WER(gt, hyp)[0]
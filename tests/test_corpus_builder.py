@@ -0,0 +1,56 @@
+# Near-duplicate index and corpus building (CorpusBuilder) on an S3 stand-in
+import random
+from data_preparation.corpus_builder import MinHashIndex, CorpusBuilder
+from data_download.shards import ShardStore
+
+_rng = random.Random(42)
+VOCABULARY = ["".join(_rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(_rng.randint(3, 9))) for _ in range(2000)]
+
+def sentence(rng, n=20):
+    return [rng.choice(VOCABULARY) for _ in range(n)]
+
+def test_near_duplicates_are_found():
+    rng = random.Random(0)
+    index = MinHashIndex()
+    words = sentence(rng, 40)
+    assert not index.check_and_add(words, 0)
+    assert index.check_and_add(words[:-1] + ["other"], 1)
+    assert not index.check_and_add(sentence(rng, 40), 2)
+
+def test_removed_sentences_no_longer_match():
+    rng = random.Random(0)
+    index = MinHashIndex()
+    words = sentence(rng, 40)
+    index.check_and_add(words, 0)
+    index.remove(0)
+    assert not index.check_and_add(words, 1)
+    index.remove(1)
+    assert index.entries == {}
+    assert all(len(bucket) == 0 for bucket in index.buckets)
+
+def test_index_is_bounded():
+    rng = random.Random(0)
+    index = MinHashIndex(max_entries=50)
+    sentences = [sentence(rng) for _ in range(500)]
+    for key, words in enumerate(sentences): index.check_and_add(words, key)
+    assert list(index.entries) == list(range(450, 500))
+    keys = set()
+    for bucket in index.buckets:
+        for candidates in bucket.values(): keys.update(candidates if isinstance(candidates, set) else [candidates])
+    assert keys == set(range(450, 500))
+    assert not index.check_and_add(sentences[0], 500) # forgotten
+    assert index.check_and_add(sentences[499], 501)
+
+def test_build_keeps_the_index_to_the_sample(s3):
+    rng = random.Random(1)
+    store = ShardStore("bucket", "data/")
+    for page in range(20):
+        store.write("Keyword_" + str(page), "\n".join(" ".join(sentence(rng, 12)).capitalize() + "." for _ in range(50)))
+    store.commit()
+    builder = CorpusBuilder(max_bytes=20000, seed=1)
+    stats = builder.build("bucket", "data/", "corpus/")
+    assert stats["low_value"] == 0
+    assert stats["sentences"] == 1000 and stats["sampled_out"] > 0
+    assert stats["bytes"] <= 20000
+    corpus = b"".join(s3.get("bucket", key) for bucket, key in sorted(s3.objects) if key.startswith("corpus/"))
+    assert len(corpus.decode("utf-8").splitlines()) == stats["kept"]
@@ -0,0 +1,84 @@
+# Wikipedia downloads against the local stand-in: retries, the per-host limit and the reported causes of failures
+import threading
+import pytest
+from benchmarks.stand_ins import WikiStandIn
+from data_download.downloader import WikiDownloader, summarize
+
+@pytest.fixture
+def wiki():
+    server = WikiStandIn(paragraphs=3, words_per_paragraph=20)
+    yield server
+    server.close()
+
+# parse stage: one entry per paragraph
+def paragraphs(keyword, html):
+    return [part for part in html.split("<p>")[1:]]
+
+class Writes:
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, keyword, data):
+        with self.lock: self.data[keyword] = data
+
+def download(wiki, keywords, **options):
+    options.setdefault("backoff_base", 0.001)
+    downloader = WikiDownloader(base_url=wiki.base_url, **options)
+    writes = Writes()
+    try:
+        results = downloader.download(keywords, paragraphs, writes)
+    finally:
+        downloader.close()
+    return dict((result.keyword, result) for result in results), writes
+
+def test_downloads_parse_and_write(wiki):
+    results, writes = download(wiki, ["Cell_biology", "Mitochondrion", "Café"])
+    assert [result.status for result in results.values()] == ["ok"] * 3
+    assert sorted(writes.data) == ["Café", "Cell_biology", "Mitochondrion"]
+    assert all(len(data) == 3 for data in writes.data.values())
+    assert results["Café"].http_status == 200 and results["Café"].bytes > 0 and results["Café"].attempts == 1
+
+@pytest.mark.parametrize("statuses", [[429], [500, 502], [503, 504, 429], [0], [0, 503]])
+def test_throttling_server_errors_and_dropped_connections_are_retried(wiki, statuses):
+    wiki.fail("Cell_biology", statuses)
+    results, writes = download(wiki, ["Cell_biology", "Mitochondrion"], retries=3)
+    assert results["Cell_biology"].status == "ok"
+    assert results["Cell_biology"].attempts == len(statuses) + 1
+    assert results["Mitochondrion"].attempts == 1
+    assert "Cell_biology" in writes.data
+
+def test_keyword_failing_every_retry_reports_its_cause(wiki):
+    wiki.fail("Cell_biology", [503] * 10)
+    wiki.fail("Mitochondrion", [0] * 10)
+    results, writes = download(wiki, ["Cell_biology", "Mitochondrion", "Ribosome"], retries=2)
+    assert (results["Cell_biology"].status, results["Cell_biology"].error, results["Cell_biology"].attempts) == ("failed", "HTTP 503", 3)
+    assert results["Cell_biology"].http_status == 503
+    assert results["Mitochondrion"].status == "failed" and results["Mitochondrion"].attempts == 3
+    assert results["Mitochondrion"].error.startswith("RemoteDisconnected") # the connection error itself
+    assert results["Ribosome"].status == "ok"
+    assert sorted(writes.data) == ["Ribosome"]
+    assert summarize(results.values()) == "failed: 2, ok: 1"
+
+def test_missing_page_is_not_retried(wiki):
+    wiki.fail("No_such_page", [404])
+    results, writes = download(wiki, ["No_such_page"], retries=3)
+    assert (results["No_such_page"].status, results["No_such_page"].error, results["No_such_page"].attempts) == ("not_found", "HTTP 404", 1)
+
+def test_parse_and_write_errors_are_reported(wiki):
+    downloader = WikiDownloader(base_url=wiki.base_url)
+    def write(keyword, data):
+        if keyword == "Bad_write": raise IOError("disk full")
+    def parse(keyword, html):
+        if keyword == "Bad_parse": raise ValueError("no paragraphs")
+        return paragraphs(keyword, html)
+    results = downloader.download(["Bad_parse", "Bad_write", "Good"], parse, write)
+    downloader.close()
+    assert [(result.status, result.error) for result in results] == \
+        [("failed", "ValueError: no paragraphs"), ("failed", "OSError: disk full"), ("ok", None)]
+
+def test_per_host_limit(wiki):
+    wiki.latency = 0.05
+    results, writes = download(wiki, ["Keyword_" + str(i) for i in range(24)], max_workers=16, per_host_limit=3)
+    assert all(result.status == "ok" for result in results.values())
+    assert wiki.max_active == 3
@@ -0,0 +1,41 @@
+# Parity of the fast sentence extraction (html_extract) with get_data (BeautifulSoup) on Wikipedia markup
+import pytest
+from conftest import read_data
+from data_download import html_extract
+
+bs4 = pytest.importorskip("bs4")
+
+PAGE = read_data("wikipedia_page.html")
+
+def soup_paragraphs(html):
+    return [p.text for p in bs4.BeautifulSoup(html, "html.parser").find_all("p")]
+
+@pytest.fixture
+def streaming(monkeypatch):
+    monkeypatch.setattr(html_extract, "lxml", None)
+
+def test_streaming_paragraphs_match_beautifulsoup(streaming):
+    assert html_extract.paragraphs(PAGE) == soup_paragraphs(PAGE)
+
+def test_lxml_paragraphs_match_beautifulsoup():
+    pytest.importorskip("lxml.html")
+    assert html_extract.paragraphs(PAGE) == soup_paragraphs(PAGE)
+
+def test_sentences_match_get_data():
+    nltk = pytest.importorskip("nltk")
+    from data_preparation.nltk_resources import PATHS, punkt_resource
+    try:
+        nltk.data.find(PATHS[punkt_resource()])
+    except LookupError:
+        pytest.skip("NLTK punkt data is not installed")
+    from data_download.wiki_data import get_data
+    assert html_extract.extract_sentences(PAGE) == get_data(PAGE)
+
+def test_inline_styles_and_scripts_are_skipped(streaming):
+    html = '<p>The speed is <style>.mw-parser-output .nowrap{white-space:nowrap}</style><span class="nowrap">5 km</span> per hour.' \
+           '<script>var x = 1;</script></p><p>a<template><p>hidden</p></template>b</p>'
+    assert html_extract.paragraphs(html) == ["The speed is 5 km per hour.", "ab"]
+
+def test_unclosed_paragraph_ends_at_next_block(streaming):
+    html = "<p>Next para<div>Line</div>break here.<table><tr><td>In table.</td></tr></table><p>Last<br/>one"
+    assert html_extract.paragraphs(html) == ["Next para", "Lastone"]
@@ -0,0 +1,55 @@
+# Input folder listing and pairing (InputIndex) on an S3 stand-in
+import pytest
+from orchestrator import input_index
+from orchestrator.input_index import InputIndex
+
+PREFIX = "clm/input/"
+MANIFEST = "clm/result/input_manifest.json"
+
+def make_folders(s3, count, start=0):
+    for i in range(start, count):
+        folder = PREFIX + "folder-" + str(i) + "/"
+        s3.put("bucket", folder + "ground_truth.txt", "hello world " + str(i))
+        s3.put("bucket", folder + "audio.mp3", "hello world " + str(i))
+
+def scan():
+    return InputIndex("bucket", PREFIX, MANIFEST, max_workers=4).load().scan()
+
+def test_inputs_are_paired(s3):
+    make_folders(s3, 3)
+    s3.put("bucket", PREFIX + "two-media/gt.txt", "text")
+    s3.put("bucket", PREFIX + "two-media/a.wav", "text")
+    s3.put("bucket", PREFIX + "two-media/b.wav", "text")
+    s3.put("bucket", PREFIX + "no-media/gt.txt", "text")
+    s3.put("bucket", PREFIX + "stray.mp3", "text")
+    inputs = scan().inputs()
+    assert [entry["folder"] for entry in inputs] == ["folder-0", "folder-1", "folder-2", "two-media/a.wav", "two-media/b.wav"]
+    assert inputs[0] == {"folder": "folder-0", "media": PREFIX + "folder-0/audio.mp3", "gt_file": PREFIX + "folder-0/ground_truth.txt",
+                         "size": len("hello world 0")}
+
+def test_folders_are_listed_in_pages_not_one_call_per_folder(s3):
+    make_folders(s3, 300) # 600 objects, one page of the stand-in holds 1000 keys
+    before = s3.calls.get("ListObjectsV2", 0)
+    assert len(scan().inputs()) == 300
+    assert s3.calls["ListObjectsV2"] - before == 1
+
+def test_split_listing_finds_the_same_folders(s3, monkeypatch):
+    make_folders(s3, 50)
+    first = scan()
+    expected = first.inputs()
+    monkeypatch.setattr(input_index, "OBJECTS_PER_RANGE", 10)
+    index = scan()
+    assert len(index.split_keys()) == 3 # 4 ranges, at most max_workers
+    assert index.folders == first.folders
+    assert index.inputs() == expected
+    assert index.diff == {"added": [], "removed": [], "changed": []}
+
+def test_changes_are_detected(s3):
+    make_folders(s3, 5)
+    scan().inputs()
+    s3.put("bucket", PREFIX + "folder-1/audio.mp3", "a longer recording of hello world")
+    s3.delete_objects(Bucket="bucket", Delete={"Objects": [{"Key": PREFIX + "folder-3/audio.mp3"}, {"Key": PREFIX + "folder-3/ground_truth.txt"}]})
+    make_folders(s3, 7, start=5)
+    index = scan()
+    assert index.diff == {"added": ["folder-5", "folder-6"], "removed": ["folder-3"], "changed": ["folder-1"]}
+    assert [entry["folder"] for entry in index.inputs()] == ["folder-0", "folder-1", "folder-2", "folder-4", "folder-5", "folder-6"]
@@ -0,0 +1,80 @@
+# Job poller: grouped status listings, the describe fallback, stopping, and the poll intervals
+import pytest
+from transcribe.job_poller import JobPoller, PollerStopped, next_interval
+
+FAST = {"min_interval": 0.01, "max_interval": 0.05, "model_min_interval": 0.01, "model_max_interval": 0.05}
+
+def start_job(transcribe, name):
+    transcribe.start_transcription_job(TranscriptionJobName=name, LanguageCode="en-US", Media={"MediaFileUri": "s3://bucket/media.mp3"},
+                                       OutputBucketName="bucket", OutputKey="output/" + name + ".json")
+
+@pytest.fixture
+def media(s3):
+    s3.put("bucket", "media.mp3", "spoken words")
+
+def test_next_interval():
+    assert next_interval(0) == 5 # min_interval
+    assert next_interval(100) == 20 # a fifth of the elapsed time
+    assert next_interval(1000) == 60 # max_interval
+    assert next_interval(0, media_duration=100) == 50 # jobs take about half the media duration
+    assert next_interval(45, media_duration=100) == 5 # min_interval just before then
+    assert next_interval(0, media_duration=1000) == 60
+    assert next_interval(200, media_duration=100) == 40 # afterwards it grows with the elapsed time
+
+def test_jobs_of_a_run_are_polled_together(transcribe, media):
+    poller = JobPoller(transcribe, **FAST)
+    names = ["st-job-run1-" + str(i) for i in range(10)]
+    for name in names: start_job(transcribe, name)
+    start_job(transcribe, "st-job-run2-0")
+    futures = [poller.track_transcription_job(name, "run1") for name in names]
+    assert [future.result(5) for future in futures] == ["COMPLETED"] * 10
+    poller.stop()
+    # a listing covers all ten jobs; the job delay takes a handful of polls
+    assert poller.api_calls == transcribe.calls["ListTranscriptionJobs"] < 3 * 10
+    assert "GetTranscriptionJob" not in transcribe.calls
+
+def test_failed_jobs_resolve_with_their_status(transcribe, media):
+    transcribe.fail_rate = 1.0
+    poller = JobPoller(transcribe, **FAST)
+    start_job(transcribe, "st-job-run1-0")
+    assert poller.wait_transcription_job("st-job-run1-0", "run1") == "FAILED"
+    poller.stop()
+
+def test_language_models_are_listed(transcribe):
+    poller = JobPoller(transcribe, **FAST)
+    for name in ("clm-model-run1-a", "clm-model-run1-b"):
+        transcribe.create_language_model(LanguageCode="en-US", BaseModelName="WideBand", ModelName=name, InputDataConfig={"S3Uri": "s3://bucket/data/"})
+    futures = [poller.track_language_model(name, "run1") for name in ("clm-model-run1-a", "clm-model-run1-b")]
+    assert [future.result(5) for future in futures] == ["COMPLETED"] * 2
+    poller.stop()
+    assert transcribe.calls["ListLanguageModels"] > 0 and "DescribeLanguageModel" not in transcribe.calls
+
+def test_jobs_missing_from_listings_are_described(transcribe, media):
+    poller = JobPoller(transcribe, **FAST)
+    start_job(transcribe, "st-job-run1-0")
+    # the name filter does not match the job, so listings never show it
+    assert poller.wait_transcription_job("st-job-run1-0", "other-run") == "COMPLETED"
+    poller.stop()
+    assert transcribe.calls["ListTranscriptionJobs"] >= JobPoller.MAX_MISSING
+    assert transcribe.calls["GetTranscriptionJob"] >= 1
+
+def test_describe_errors_reach_the_waiter(transcribe):
+    poller = JobPoller(transcribe, **FAST)
+    future = poller.track_transcription_job("st-job-never-started", "run1")
+    with pytest.raises(Exception) as error:
+        future.result(5)
+    poller.stop()
+    assert type(error.value).__name__ == "BadRequestException"
+
+def test_stop_fails_waiters(transcribe, media):
+    transcribe.job_delay = 60
+    poller = JobPoller(transcribe, **FAST)
+    start_job(transcribe, "st-job-run1-0")
+    future = poller.track_transcription_job("st-job-run1-0", "run1")
+    poller.stop()
+    with pytest.raises(PollerStopped):
+        future.result(5)
+    with pytest.raises(PollerStopped): # jobs tracked later fail at once
+        poller.wait_transcription_job("st-job-run1-1", "run1")
+    poller.thread.join(5)
+    assert not poller.thread.is_alive()
@@ -0,0 +1,88 @@
+# Keyword extraction with Comprehend: packing words into documents by UTF-8 size, mapping tags back, the POS cache
+import json
+import pytest
+from benchmarks import stand_ins
+from keyword_extraction.keywords import chunk_words, tags_by_word, ComprehendTagger, KeywordExtractor, POSCache, \
+    MAX_DOCUMENT_BYTES, SEPARATOR
+
+WORDS = ["lecture", "café", "naïve résumé", "日本語", "Ångström", "mitochondria", "New York", "cat"] * 40
+
+# Comprehend stand-in that fails the documents at the given indexes of every batch, like ErrorList entries
+class FailingComprehend(stand_ins.ComprehendStandIn):
+    def __init__(self, failing=()):
+        stand_ins.ComprehendStandIn.__init__(self)
+        self.failing = failing
+
+    def batch_detect_syntax(self, TextList, LanguageCode):
+        response = stand_ins.ComprehendStandIn.batch_detect_syntax(self, TextList, LanguageCode)
+        response["ErrorList"] = [{"Index": i, "ErrorCode": "InternalServerException", "ErrorMessage": "failed"} for i in self.failing if i < len(TextList)]
+        response["ResultList"] = [result for result in response["ResultList"] if result["Index"] not in self.failing]
+        return response
+
+@pytest.fixture
+def comprehend(s3):
+    stand_in = FailingComprehend()
+    stand_ins.install(stand_in)
+    return stand_in
+
+@pytest.mark.parametrize("max_bytes", [20, 100, MAX_DOCUMENT_BYTES])
+def test_documents_fit_in_max_bytes_and_spans_point_at_words(max_bytes):
+    documents = chunk_words(WORDS, max_bytes)
+    assert [word for text, spans in documents for word, begin, end in spans] == WORDS
+    for text, spans in documents:
+        assert len(text.encode("utf-8")) <= max_bytes
+        assert text == SEPARATOR.join(word for word, begin, end in spans)
+        for word, begin, end in spans: assert text[begin:end] == word # character offsets, not bytes
+
+def test_document_at_the_byte_limit():
+    word = "é" * 10 # 20 bytes, 10 characters
+    fitting = [word] * 4 # 4 * 20 + 3 * 2 = 86 bytes
+    assert len(chunk_words(fitting, 86)) == 1
+    assert [len(spans) for text, spans in chunk_words(fitting, 85)] == [3, 1]
+    assert len(chunk_words(["a" * MAX_DOCUMENT_BYTES], MAX_DOCUMENT_BYTES)) == 1
+
+def test_words_longer_than_a_document_are_skipped():
+    assert chunk_words(["é" * 30, "short"], 50) == [("short", [("short", 0, 5)])]
+
+def test_tags_map_back_to_words():
+    text, spans = chunk_words(["New York", "café", "a"])[0]
+    tokens = stand_ins.ComprehendStandIn().batch_detect_syntax([text], "en")["ResultList"][0]["SyntaxTokens"]
+    assert tags_by_word(spans, tokens) == {"New York": [["New", "DET"], ["York", "NOUN"]], "café": [["café", "NOUN"]], "a": [["a", "DET"]]}
+    # tokens of Comprehend may come in any order
+    assert tags_by_word(spans, list(reversed(tokens))) == tags_by_word(spans, tokens)
+
+def test_tagger_batches_documents(comprehend):
+    words = sorted(set(WORDS)) + ["word" + str(i) for i in range(200)]
+    tags = ComprehendTagger(batch_size=3, max_document_bytes=100).tag(words)
+    assert sorted(tags) == sorted(words)
+    documents = len(chunk_words(words, 100))
+    assert comprehend.calls["BatchDetectSyntax"] == (documents + 2) // 3
+
+def test_failed_documents_are_not_cached(s3, comprehend):
+    comprehend.failing = (1, )
+    words = ["word" + str(i) for i in range(30)]
+    cache = POSCache("bucket", "result/pos_cache.json").load()
+    tagger = ComprehendTagger(batch_size=25, max_document_bytes=60)
+    failed = [word for word, begin, end in chunk_words(sorted(words), 60)[1][1]] # the extractor tags words in sorted order
+    keywords = KeywordExtractor(tagger, cache).extract(words)
+    assert keywords == set(words) - set(failed)
+    assert sorted(cache.tags) == sorted(set(words) - set(failed))
+    # the failed words are tagged again by the next run
+    comprehend.failing = ()
+    assert KeywordExtractor(tagger, cache).extract(words) == set(words)
+    assert sorted(cache.tags) == sorted(words)
+
+def test_pos_cache_round_trip(s3, comprehend):
+    words = ["lecture", "café", "cat", "日本語"]
+    cache = POSCache("bucket", "result/pos_cache.json").load()
+    assert KeywordExtractor(ComprehendTagger(), cache).extract(words) == {"lecture", "café"}
+    cache.save()
+    saved = json.loads(s3.get("bucket", "result/pos_cache.json"))
+    assert saved["café"] == [["café", "NOUN"]] and saved["cat"] == [["cat", "DET"]]
+    calls = comprehend.calls["BatchDetectSyntax"]
+    loaded = POSCache("bucket", "result/pos_cache.json").load()
+    assert KeywordExtractor(ComprehendTagger(), loaded).extract(words) == {"lecture", "café"}
+    assert comprehend.calls["BatchDetectSyntax"] == calls # all words came from the cache
+    puts = s3.calls["PutObject"]
+    loaded.save() # nothing new, nothing written
+    assert s3.calls["PutObject"] == puts
@@ -0,0 +1,73 @@
+# Leaderboard aggregates: the incremental path (add) against the bulk one (from_rows) and a direct computation
+import random, statistics
+import pytest
+from orchestrator.leaderboard import Leaderboard
+
+def make_rows(n=3000, seed=3):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        rows.append({"model": rng.choice(["ST", "clm-a", "clm-b", "clm-c"]), "folder": "folder-" + str(rng.randrange(40)),
+                     "wer": "%.2f" % rng.uniform(5, 30)})
+    rows.append({"model": "clm-d", "folder": None, "wer": None}) # a registered model without results
+    rows.append({"model": "clm-a", "folder": "folder-1", "wer": "-1"}) # a failed evaluation
+    return rows
+
+def incremental(rows):
+    leaderboard = Leaderboard()
+    for row in rows: leaderboard.add(row["model"], row["folder"], row["wer"])
+    return leaderboard
+
+def assert_same(a, b):
+    assert sorted(a.models) == sorted(b.models)
+    for model in a.models:
+        assert a.models[model].count == b.models[model].count
+        assert a.models[model].mean() == pytest.approx(b.models[model].mean())
+        assert a.models[model].sd() == pytest.approx(b.models[model].sd())
+        assert a.folder_wers(model) == pytest.approx(b.folder_wers(model))
+    assert sorted(a.deltas) == sorted(b.deltas)
+    for model in a.deltas:
+        assert a.deltas[model].count == b.deltas[model].count
+        assert a.deltas[model].mean() == pytest.approx(b.deltas[model].mean())
+        assert a.deltas[model].sd() == pytest.approx(b.deltas[model].sd())
+
+def test_add_matches_from_rows():
+    rows = make_rows()
+    assert_same(incremental(rows), Leaderboard.from_rows(rows))
+
+def test_add_matches_from_rows_when_st_comes_last():
+    # ST results recorded after the CLM results of their folders update the deltas of those models
+    rows = make_rows()
+    rows.sort(key=lambda row: row["model"] == "ST")
+    assert_same(incremental(rows), Leaderboard.from_rows(rows))
+
+def test_aggregates_match_direct_computation():
+    rows = make_rows()
+    leaderboard = Leaderboard.from_rows(rows)
+    valid = [row for row in rows if row["wer"] is not None and float(row["wer"]) >= 0.0]
+    cells = {}
+    for row in valid: cells.setdefault((row["model"], row["folder"]), []).append(float(row["wer"]))
+    for model in ["ST", "clm-a", "clm-b", "clm-c"]:
+        wers = [float(row["wer"]) for row in valid if row["model"] == model]
+        assert leaderboard.models[model].mean() == pytest.approx(statistics.mean(wers))
+        assert leaderboard.models[model].sd() == pytest.approx(statistics.stdev(wers))
+        if model == "ST": continue
+        deltas = [statistics.mean(wers) - statistics.mean(cells[("ST", folder)]) for (name, folder), wers in cells.items() \
+                  if name == model and ("ST", folder) in cells]
+        assert leaderboard.deltas[model].count == len(deltas)
+        assert leaderboard.deltas[model].mean() == pytest.approx(statistics.mean(deltas))
+    assert "clm-d" not in leaderboard.models
+
+def test_rendering():
+    rows = [{"model": "ST", "folder": "f" + str(i), "wer": str(20 + i)} for i in range(4)] + \
+           [{"model": "clm-a", "folder": "f" + str(i), "wer": str(18 + i)} for i in range(4)]
+    leaderboard = Leaderboard.from_rows(rows)
+    text = leaderboard.to_text({"clm-a"})
+    assert text.startswith("model-name: WER\n\nclm-a: 19.5 (95% CI ")
+    assert "vs ST -2.00 over 4 folders) (best of its sweep)" in text
+    assert "Standard Transcribe (ST): 21.5 (" in text
+    entries = leaderboard.to_dict({"clm-a"})["models"]
+    assert [entry["model"] for entry in entries] == ["clm-a", "ST"]
+    assert entries[0]["vs_st"]["delta"] == -2.0 and entries[0]["best_of_sweep"]
+    assert "folders" not in entries[0]
+    assert leaderboard.folders_dict()["clm-a"]["f1"] == {"wer": 19.0, "jobs": 1}
@@ -0,0 +1,46 @@
+# Local tagger: Penn Treebank tags mapped to the Comprehend keyword tags, and the choice of engine
+import pytest
+from keyword_extraction import local_tagger
+from keyword_extraction.keywords import make_tagger, ComprehendTagger, KeywordExtractor
+from keyword_extraction.local_tagger import LocalTagger
+
+# Returns True if the NLTK perceptron tagger data is installed
+def tagger_data_installed():
+    import nltk
+    from data_preparation.nltk_resources import PATHS, tagger_resource
+    try:
+        nltk.data.find(PATHS[tagger_resource()])
+        return True
+    except LookupError:
+        return False
+
+# perceptron tagger replacement returning fixed Penn Treebank tags
+class PennTags:
+    TAGS = {"cells": "NNS", "cell": "NN", "Paris": "NNP", "Americans": "NNPS", "quickly": "RB", "the": "DT"}
+
+    def tag_sents(self, sentences):
+        return [[(token, self.TAGS.get(token, "JJ")) for token in sentence] for sentence in sentences]
+
+def test_penn_tags_are_mapped(monkeypatch):
+    monkeypatch.setattr(local_tagger, "get_tagger", PennTags)
+    tags = LocalTagger(batch_size=2).tag(["cells", "cell", "Paris", "Americans", "quickly", "the cell"])
+    assert tags == {"cells": [["cells", "NOUN"]], "cell": [["cell", "NOUN"]], "Paris": [["Paris", "PROPN"]],
+                    "Americans": [["Americans", "PROPN"]], "quickly": [["quickly", "RB"]], "the cell": [["the", "DT"], ["cell", "NOUN"]]}
+    assert KeywordExtractor(LocalTagger()).extract(["cells", "Paris", "quickly", "the"]) == {"cells", "Paris"}
+
+@pytest.mark.skipif(not tagger_data_installed(), reason="NLTK perceptron tagger data is not installed")
+def test_perceptron_tags_nouns_and_proper_nouns():
+    tags = LocalTagger().tag(["mitochondria", "molecules", "Paris", "quickly"])
+    assert tags["mitochondria"][0][1] == "NOUN"
+    assert tags["molecules"][0][1] == "NOUN"
+    assert tags["Paris"][0][1] == "PROPN"
+    assert tags["quickly"][0][1] not in ("NOUN", "PROPN")
+
+def test_make_tagger_selects_the_engine():
+    assert isinstance(make_tagger(), ComprehendTagger)
+    comprehend = make_tagger("comprehend", comprehend={"batch_size": 10}, local={"batch_size": 5})
+    assert isinstance(comprehend, ComprehendTagger) and comprehend.batch_size == 10 and comprehend.remote
+    local = make_tagger("local", comprehend={"batch_size": 10}, local={"batch_size": 5})
+    assert isinstance(local, LocalTagger) and local.batch_size == 5 and not local.remote
+    with pytest.raises(ValueError):
+        make_tagger("other")
@@ -0,0 +1,39 @@
+# Text normalization: the single-pass rules and the deprecated helpers kept from before them
+import pytest
+from data_preparation import normalize_text as nt
+from data_preparation.normalize_text import NormalizeText
+
+def test_normalize_removes_brackets_fillers_punctuation_and_dashes():
+    assert NormalizeText().normalize("Um, the cow-calf (pair) [noise] is, uh; here.") == "the cow calf is here"
+
+def test_filler_words_only_match_whole_words():
+    assert NormalizeText().normalize("Ah, a summary ahead") == "a summary ahead"
+
+def test_domain_rules():
+    assert NormalizeText(filler_words=["like"], punctuation=",!", dashes="").normalize("like, wow-ok!") == "wow-ok"
+
+@pytest.mark.parametrize("name, text, expected", [
+    ("remove_paranthesis", "a (b) [c] d", "a   d"),
+    ("remove_extra_spaces", "  a   b ", "a b"),
+    ("remove_umuh_comma_dot", "Um, a b.", "a b"),
+    ("expand_dash", "cow-calf", "cow calf"),
+])
+def test_deprecated_helpers_keep_their_behavior(name, text, expected):
+    with pytest.warns(DeprecationWarning, match=name):
+        assert getattr(nt, name)(text) == expected
+
+TEXTS = ["Um, the cow-calf (pair) is here.", "Uh; [noise] a summary: ahead", "", "line one\nline (two\nthree) four — five"] * 25
+
+def test_normalize_many_matches_normalize():
+    normalizer = NormalizeText()
+    expected = [normalizer.normalize(text) for text in TEXTS]
+    assert normalizer.normalize_many(TEXTS) == expected
+    normalizer.PARALLEL_MIN_CHARS = 0 # on the process pool
+    assert normalizer.normalize_many(iter(TEXTS), workers=2) == expected
+
+def test_normalize_stream_gives_the_same_words():
+    normalizer = NormalizeText()
+    text = "\n".join(TEXTS)
+    lines = [line.encode("utf-8") for line in text.splitlines()] # like S3 body.iter_lines()
+    assert " ".join(normalizer.normalize_stream(lines)).split() == normalizer.normalize(text).split()
+    assert all(normalizer.normalize_stream(text.splitlines()))
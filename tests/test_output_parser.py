@@ -0,0 +1,49 @@
+# Streaming parser of Amazon Transcribe output JSON: every chunk size must give what json.loads gives
+import io, json
+import pytest
+from transcribe.output_parser import parse_output, read_output, word_from_item
+
+def output_document(items_first=False):
+    items = [{"start_time": "0.0", "end_time": "0.42", "alternatives": [{"confidence": "0.99", "content": "Café"}], "type": "pronunciation"},
+             {"alternatives": [{"confidence": "0.0", "content": ","}], "type": "punctuation"},
+             {"start_time": "0.5", "end_time": "1.25", "alternatives": [{"confidence": "", "content": "naïve"}], "type": "pronunciation"}]
+    results = {"transcripts": [{"transcript": "Café, naïve \"quoted\" back\\slash été 日本 [brackets] {braces}"}]}
+    if items_first: results = dict([("items", items)] + list(results.items()))
+    else: results["items"] = items
+    results["speaker_labels"] = {"speakers": 2, "segments": [{"start_time": "0.0", "speaker_label": "spk_0", "items": []}]}
+    return {"jobName": "job", "accountId": 123456789012, "results": results, "status": "COMPLETED", "ratio": -1.5e-3, "flag": None}
+
+def expected(document):
+    return document["results"]["transcripts"][0]["transcript"], [word_from_item(item) for item in document["results"]["items"]]
+
+@pytest.mark.parametrize("items_first", [False, True])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_every_chunk_size(items_first, indent):
+    document = output_document(items_first)
+    data = json.dumps(document, indent=indent, ensure_ascii=False).encode("utf-8")
+    transcript, words = expected(document)
+    # chunk sizes of 1 to 16 bytes split every token, escape and multi-byte character somewhere
+    for chunk_size in list(range(1, 17)) + [len(data) - 1, len(data), 64 * 1024]:
+        assert parse_output(io.BytesIO(data), chunk_size=chunk_size) == (transcript, None)
+        assert parse_output(io.BytesIO(data), include_items=True, chunk_size=chunk_size) == (transcript, words)
+
+def test_ascii_escaped_output():
+    document = output_document()
+    data = json.dumps(document).encode("utf-8") # non-ASCII characters as \u escapes
+    for chunk_size in (1, 5, 7):
+        assert parse_output(io.BytesIO(data), include_items=True, chunk_size=chunk_size) == expected(document)
+
+def test_stops_reading_after_the_transcript():
+    data = json.dumps({"results": {"transcripts": [{"transcript": "done"}], "items": []}}).encode("utf-8") + b" " * 100000
+    stream = io.BytesIO(data)
+    assert parse_output(stream, chunk_size=1024) == ("done", None)
+    assert stream.tell() < 2048
+
+def test_missing_transcripts():
+    with pytest.raises(ValueError):
+        parse_output(io.BytesIO(b'{"results": {"items": []}, "status": "FAILED"}'), chunk_size=3)
+
+def test_read_output_from_s3(s3):
+    document = output_document()
+    s3.put("bucket", "output/st-job.json", json.dumps(document).encode("utf-8"))
+    assert read_output("bucket", "output/st-job.json", include_items=True, chunk_size=10) == expected(document)
@@ -0,0 +1,95 @@
+# Transcription cache: claims of concurrent jobs on the same media, expiry, eviction and counters
+import json, threading, time
+from transcribe.result_cache import TranscriptionCache
+
+BUCKET = "bucket"
+INDEX = "output/transcription_cache.json"
+
+def test_media_key_follows_content_and_model(s3):
+    s3.put(BUCKET, "input/a/lecture.mp3", b"audio")
+    s3.put(BUCKET, "other/b/copy.mp3", b"audio")
+    s3.put(BUCKET, "input/c/other.mp3", b"other audio")
+    cache = TranscriptionCache(BUCKET, INDEX)
+    key = cache.media_key("s3://bucket/input/a/lecture.mp3", "ST", "en-US")
+    assert cache.media_key("s3://bucket/other/b/copy.mp3", "ST", "en-US") == key
+    assert cache.media_key("s3://bucket/input/c/other.mp3", "ST", "en-US") != key
+    assert cache.media_key("s3://bucket/input/a/lecture.mp3", "clm-model", "en-US") != key
+
+def test_claim_store_and_hit(s3):
+    cache = TranscriptionCache(BUCKET, INDEX)
+    assert cache.claim("k") is None # the caller owns the transcription
+    cache.store("k", BUCKET, "output/st.json")
+    assert cache.claim("k") == (BUCKET, "output/st.json")
+    assert cache.lookup("k") == (BUCKET, "output/st.json")
+    assert cache.stats() == {"hits": 2, "misses": 1, "entries": 1}
+    cache.save()
+    loaded = TranscriptionCache(BUCKET, INDEX).load()
+    assert loaded.lookup("k") == (BUCKET, "output/st.json")
+
+def test_load_without_index(s3):
+    assert TranscriptionCache(BUCKET, INDEX).load().stats() == {"hits": 0, "misses": 0, "entries": 0}
+
+# starts callers claiming a key in threads, returns their results (appended as they return) and threads
+def start_claims(cache, key, n):
+    results = []
+    def claim():
+        results.append(cache.claim(key))
+    threads = [threading.Thread(target=claim) for _ in range(n)]
+    for thread in threads: thread.start()
+    deadline = time.time() + 5
+    while cache.misses < n + 1 and time.time() < deadline: time.sleep(0.01) # all of them are waiting
+    return results, threads
+
+def test_waiters_get_the_stored_result(s3):
+    cache = TranscriptionCache(BUCKET, INDEX)
+    assert cache.claim("k") is None
+    results, threads = start_claims(cache, "k", 4)
+    assert results == []
+    cache.store("k", BUCKET, "output/st.json")
+    for thread in threads: thread.join(5)
+    assert results == [(BUCKET, "output/st.json")] * 4
+    assert cache.stats() == {"hits": 4, "misses": 1, "entries": 1}
+
+def test_release_makes_one_waiter_the_owner(s3):
+    cache = TranscriptionCache(BUCKET, INDEX)
+    assert cache.claim("k") is None
+    results, threads = start_claims(cache, "k", 4)
+    cache.release("k") # e.g. the transcription failed
+    deadline = time.time() + 5
+    while not results and time.time() < deadline: time.sleep(0.01)
+    time.sleep(0.1)
+    assert results == [None] # one new owner, the others still wait for it
+    cache.store("k", BUCKET, "output/st.json")
+    for thread in threads: thread.join(5)
+    assert sorted(results, key=str) == [(BUCKET, "output/st.json")] * 3 + [None]
+    assert cache.stats() == {"hits": 3, "misses": 2, "entries": 1} # one count per claim
+
+def test_invalidate_turns_the_hit_into_a_miss(s3):
+    cache = TranscriptionCache(BUCKET, INDEX)
+    cache.store("k", BUCKET, "output/deleted.json")
+    assert cache.claim("k") == (BUCKET, "output/deleted.json")
+    cache.invalidate("k") # the output JSON was deleted
+    assert cache.stats() == {"hits": 0, "misses": 1, "entries": 0}
+    assert cache.claim("k") is None
+
+def test_entries_expire_after_ttl(s3):
+    cache = TranscriptionCache(BUCKET, INDEX, ttl=3600)
+    cache.store("old", BUCKET, "output/old.json")
+    cache.store("new", BUCKET, "output/new.json")
+    cache.entries["old"]["created"] -= 7200
+    assert cache.lookup("old") is None
+    assert cache.lookup("new") == (BUCKET, "output/new.json")
+    cache.entries["new"]["created"] -= 7200
+    cache.save() # expired entries are not saved
+    assert json.loads(s3.get(BUCKET, INDEX)) == {}
+
+def test_least_recently_used_entries_are_evicted(s3):
+    cache = TranscriptionCache(BUCKET, INDEX, max_entries=2)
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.store(key, BUCKET, "output/" + key + ".json")
+        cache.entries[key]["used"] = 1000 + i
+    cache.lookup("a") # used now, "b" is the least recently used
+    cache.save()
+    assert sorted(json.loads(s3.get(BUCKET, INDEX))) == ["a", "c"]
+    loaded = TranscriptionCache(BUCKET, INDEX, max_entries=1).load()
+    assert list(loaded.entries) == ["a"]
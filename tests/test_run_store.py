@@ -0,0 +1,61 @@
+# Run results store: flush, load, compact_run and compact round trips against the S3 stand-in
+from orchestrator.run_store import RunStore, COLUMNS
+
+BUCKET = "bucket"
+PREFIX = "clm/result/runs/"
+
+def row(model, folder, wer):
+    return {"model": model, "folder": folder, "wer": wer, "missed_words": None, "fixed_words": None}
+
+def part_keys(s3):
+    return sorted(key for bucket, key in s3.objects if key.startswith(PREFIX))
+
+def test_flush_and_load(s3):
+    store = RunStore(BUCKET, PREFIX).load()
+    store.append(row("ST", "folder-1", 20.0))
+    store.append(["clm-a", "folder-1", 15.5, None, None]) # rows in COLUMNS order
+    assert store.flush("run1") is not None
+    assert store.flush("run1") is None # nothing buffered
+    store.append(row("ST", 2, 30.0)) # numerical folder names are kept as strings
+    store.flush("run1")
+    assert len(part_keys(s3)) == 2
+    loaded = RunStore(BUCKET, PREFIX).load()
+    assert loaded.rows == store.rows
+    assert loaded.model_names() == ["ST", "clm-a"]
+    assert loaded.ran_before("ST", "2") and not loaded.ran_before("clm-a", "2")
+    assert loaded.get("clm-a", "folder-1") == [row("clm-a", "folder-1", 15.5)]
+
+def test_compact_run_merges_only_the_parts_of_a_run(s3):
+    store = RunStore(BUCKET, PREFIX).load()
+    store.append(row("ST", "folder-0", 10.0))
+    other = store.flush("run0")
+    for i in range(3): # checkpoints of run1
+        store.append(row("ST", "folder-" + str(i), 20.0 + i))
+        store.flush("run1")
+    resumed = RunStore(BUCKET, PREFIX).load() # a resumed run1 adds more checkpoints
+    resumed.append(row("clm-a", "folder-1", 5.0))
+    resumed.flush("run1")
+    merged = resumed.compact_run("run1")
+    assert part_keys(s3) == sorted([other, merged])
+    assert resumed.compact_run("run1") is None # a single part is left as it is
+    assert RunStore(BUCKET, PREFIX).load().rows == resumed.rows # in the order the rows were written
+    # parts written after the merge still sort after it
+    resumed.append(row("clm-b", "folder-1", 4.0))
+    assert resumed.flush("run1") > merged
+
+def test_compact_merges_everything(s3):
+    store = RunStore(BUCKET, PREFIX).load()
+    for run in ("run1", "run2", "run3"):
+        store.append(row("ST", run, 1.0))
+        store.flush(run)
+    key = RunStore(BUCKET, PREFIX).compact()
+    assert part_keys(s3) == [key]
+    assert RunStore(BUCKET, PREFIX).load().rows == store.rows
+    assert RunStore(BUCKET, PREFIX).compact() is None
+
+def test_legacy_csv_is_migrated(s3):
+    s3.put(BUCKET, "clm/result/runs.csv", ",".join(COLUMNS) + "\nST,folder-1,20.0,,\nclm-a,,,,\n")
+    store = RunStore(BUCKET, PREFIX, legacy_key="clm/result/runs.csv").load()
+    assert store.rows == [row("ST", "folder-1", "20.0"), row("clm-a", None, None)]
+    assert len(part_keys(s3)) == 1
+    assert RunStore(BUCKET, PREFIX, legacy_key="clm/result/runs.csv").load().rows == store.rows
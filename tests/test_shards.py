@@ -0,0 +1,66 @@
+# Shard store of training text: commit() against the S3 stand-in, read back through a fresh store
+from data_download.shards import ShardStore, shard_index_key, write_shards
+
+BUCKET = "bucket"
+PREFIX = "clm/training_data/"
+
+def texts(n, version=0):
+    return dict(("keyword-" + str(i), "text of keyword " + str(i) + " version " + str(version) + " " + "é" * (i % 5)) for i in range(n))
+
+def stored_keys(s3):
+    return sorted(key for bucket, key in s3.objects if key.startswith(PREFIX))
+
+# writes texts and commits, then returns what a store loaded from S3 reads back
+def commit(s3, written, shard_size=200):
+    store = ShardStore(BUCKET, PREFIX, shard_size=shard_size, part_size=64).load()
+    for keyword, text in written.items(): store.write(keyword, text)
+    store.commit()
+    reloaded = ShardStore(BUCKET, PREFIX, shard_size=shard_size, part_size=64).load()
+    # every object under the prefix is a shard of the index, nothing replaced is left behind
+    assert stored_keys(s3) == sorted(reloaded.shards)
+    assert all(len(s3.get(BUCKET, key)) == size for key, size in reloaded.shards.items())
+    return dict(reloaded.iter_texts())
+
+def test_commit_round_trip(s3):
+    expected = texts(30)
+    assert commit(s3, expected) == expected
+    assert len(stored_keys(s3)) > 1 # several shards, some of them uploaded in parts
+
+def test_update_keeps_unchanged_keywords(s3):
+    expected = texts(30)
+    commit(s3, expected)
+    changed = dict((keyword, text) for keyword, text in texts(40, version=1).items() if keyword.endswith(("3", "7")) or keyword not in expected)
+    expected.update(changed)
+    assert commit(s3, changed) == expected
+
+def test_commit_without_changes_writes_nothing(s3):
+    commit(s3, texts(3), shard_size=10000)
+    objects = dict(s3.objects)
+    store = ShardStore(BUCKET, PREFIX, shard_size=10000).load()
+    store.commit()
+    assert s3.objects == objects
+
+def test_legacy_files_are_moved_into_shards(s3):
+    for keyword, text in texts(5).items(): s3.put(BUCKET, PREFIX + keyword + ".txt", text)
+    expected = texts(5)
+    expected["new"] = "new text"
+    assert commit(s3, {"new": "new text"}) == expected
+    assert not any(key.startswith(PREFIX + "keyword-") for key in stored_keys(s3))
+
+def test_orphan_shards_of_an_interrupted_update_are_deleted(s3):
+    commit(s3, texts(10))
+    interrupted = ShardStore(BUCKET, PREFIX, shard_size=200, part_size=64).load()
+    for keyword, text in texts(10, version=2).items(): interrupted.write(keyword, text)
+    interrupted._ShardStore__close_shard() # shard written, index never saved
+    assert commit(s3, {}) == texts(10)
+
+def test_index_sits_next_to_the_prefix(s3):
+    commit(s3, texts(2))
+    assert shard_index_key(PREFIX) == "clm/training_data_shards.json"
+    assert (BUCKET, shard_index_key(PREFIX)) in s3.objects
+
+def test_write_shards_deletes_stale_shards(s3):
+    write_shards(BUCKET, PREFIX, ["line " + str(i) for i in range(50)], shard_size=40, part_size=16)
+    keys = write_shards(BUCKET, PREFIX, ["line " + str(i) for i in range(5)], shard_size=40, part_size=16)
+    assert stored_keys(s3) == keys
+    assert b"".join(s3.get(BUCKET, key) for key in keys).decode("utf-8").splitlines() == ["line " + str(i) for i in range(5)]
@@ -0,0 +1,26 @@
+# Staged evaluation: the t quantile against tabulated values and the error rate of dropping models that are not worse
+import random
+import pytest
+from orchestrator.staged_evaluation import t_quantile, StagedEvaluation
+
+# (p, dof, quantile) from standard t tables
+TABLE = [(0.975, 1, 12.7062), (0.975, 2, 4.3027), (0.975, 4, 2.7764), (0.995, 2, 9.9248), (0.995, 4, 4.6041),
+         (0.999, 4, 7.1732), (0.9995, 5, 6.8688), (0.95, 30, 1.6973), (0.975, 120, 1.9799)]
+
+@pytest.mark.parametrize("p, dof, expected", TABLE)
+def test_t_quantile_matches_table(p, dof, expected):
+    assert t_quantile(p, dof) == pytest.approx(expected, abs=1e-4)
+    assert t_quantile(1 - p, dof) == pytest.approx(-expected, abs=1e-4)
+
+def test_models_no_worse_than_st_are_rarely_dropped():
+    rng = random.Random(5)
+    inputs = [{"folder": "folder-" + str(i), "size": 1000 * (i % 7)} for i in range(20)]
+    models = ["clm-" + str(i) for i in range(6)]
+    runs, dropped = 200, 0
+    for _ in range(runs):
+        evaluation = StagedEvaluation(inputs, stages=(0.3, 0.6, 1.0), min_folders=5, alpha=0.05)
+        wers = dict((model, dict((entry["folder"], rng.gauss(20, 3)) for entry in inputs)) for model in ["ST"] + models)
+        while not evaluation.last_stage(): evaluation.advance(models, lambda model: wers[model])
+        if evaluation.dropped: dropped += 1
+    # all models have the same WER distribution, so any drop is a false one; alpha bounds their rate over the whole run
+    assert dropped / runs <= 0.05
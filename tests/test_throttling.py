@@ -0,0 +1,105 @@
+# Rate limiting, retries of throttled calls and admission of transcription jobs, against the throttling stand-ins
+import threading, time
+import pytest
+from aws import clients, throttling
+from aws.throttling import ThrottledClient, TokenBucket, AdmissionQueue, backoff
+from benchmarks import stand_ins
+from transcribe.transcribe import Transcribe
+
+POLL_OPTIONS = {"min_interval": 0.02, "max_interval": 0.05}
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(throttling.time, "sleep", slept.append) # retries are not waited for, their delays are recorded
+    return slept
+
+@pytest.mark.parametrize("code", ["ThrottlingException", "LimitExceededException", "SlowDown"])
+def test_throttled_calls_are_retried(s3, sleeps, code):
+    s3.inject_throttling(0.5, code)
+    client = ThrottledClient(s3, "s3", retries=20)
+    for i in range(20): client.put_object(Body=b"x", Bucket="bucket", Key="key-" + str(i))
+    assert len([key for bucket, key in s3.objects]) == 20
+    assert s3.throttled["PutObject"] > 0
+    assert s3.calls["PutObject"] == 20 + s3.throttled["PutObject"]
+    assert len(sleeps) == s3.throttled["PutObject"]
+
+def test_gives_up_after_the_retries(s3, sleeps):
+    s3.inject_throttling(1.0)
+    client = ThrottledClient(s3, "s3", retries=3)
+    with pytest.raises(stand_ins.ClientError):
+        client.put_object(Body=b"x", Bucket="bucket", Key="key")
+    assert s3.calls["PutObject"] == 4 and len(sleeps) == 3
+
+def test_shared_clients_use_the_configured_retries(s3, sleeps, monkeypatch):
+    monkeypatch.setitem(clients.SETTINGS, "retries", 2)
+    clients.configure()
+    stand_ins.install(s3)
+    s3.inject_throttling(1.0, "SlowDown")
+    with pytest.raises(stand_ins.ClientError):
+        clients.get_client("s3").get_object(Bucket="bucket", Key="key")
+    assert s3.calls["GetObject"] == 3
+
+def test_other_errors_are_not_retried(s3, sleeps):
+    client = ThrottledClient(s3, "s3")
+    with pytest.raises(stand_ins.NoSuchKey):
+        client.get_object(Bucket="bucket", Key="missing")
+    assert s3.calls["GetObject"] == 1 and sleeps == []
+
+def test_backoff_is_capped(s3, sleeps, monkeypatch):
+    monkeypatch.setattr(throttling.random, "uniform", lambda low, high: high) # the longest wait of the full jitter
+    assert [backoff(attempt, 1.0, 10.0) for attempt in range(6)] == [1, 2, 4, 8, 10, 10]
+    s3.inject_throttling(1.0)
+    client = ThrottledClient(s3, "s3", retries=12, backoff_base=0.5, backoff_cap=3.0)
+    with pytest.raises(stand_ins.ClientError):
+        client.put_object(Body=b"x", Bucket="bucket", Key="key")
+    assert sleeps == [0.5, 1, 2] + [3.0] * 9
+
+def test_token_bucket_rate():
+    bucket = TokenBucket(100, burst=1)
+    start = time.monotonic()
+    for _ in range(21): bucket.acquire()
+    assert time.monotonic() - start >= 0.19 # 20 calls after the burst, at 100 per second
+
+def test_admission_queue_limit():
+    queue = AdmissionQueue("jobs", 2)
+    active, peak, lock = [0], [0], threading.Lock()
+    def job():
+        with queue:
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock: active[0] -= 1
+    threads = [threading.Thread(target=job) for _ in range(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join(5)
+    assert peak[0] == 2 and queue.active == 0
+
+def test_transcription_jobs_wait_for_admission(s3, transcribe, monkeypatch):
+    monkeypatch.setitem(clients.SETTINGS, "concurrency_limits", {"transcription_jobs": 2})
+    clients.configure()
+    stand_ins.install(s3, transcribe)
+    transcribe.job_limit = 2 # more jobs at the same time fail with LimitExceededException, like the account quota
+    for i in range(6): s3.put("bucket", "input/" + str(i) + ".mp3", "spoken words " + str(i))
+    client = Transcribe(name_filter="run", poll_options=POLL_OPTIONS)
+    texts = {}
+    def job(i):
+        texts[i] = client.get_standard_transcribe_text("s3://bucket/input/" + str(i) + ".mp3", "bucket", "output/", "run-" + str(i))
+    threads = [threading.Thread(target=job, args=(i, )) for i in range(6)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join(10)
+    client.stop()
+    assert len(texts) == 6
+    assert transcribe.calls["StartTranscriptionJob"] == 6 # no start was rejected and retried
+
+def test_conflict_means_already_started(s3, transcribe):
+    s3.put("bucket", "input/a.mp3", "spoken words")
+    # an earlier attempt of a retried call started the job already
+    transcribe.start_transcription_job(TranscriptionJobName="st-job-run-a", LanguageCode="en-US", Media={"MediaFileUri": "s3://bucket/input/a.mp3"},
+                                       OutputBucketName="bucket", OutputKey="output/st-run-a.json")
+    transcribe.st_error_rate = 0.0
+    client = Transcribe(name_filter="run", poll_options=POLL_OPTIONS)
+    assert client.get_standard_transcribe_text("s3://bucket/input/a.mp3", "bucket", "output/", "run-a") == "spoken words"
+    client.stop()
+    assert transcribe.calls["StartTranscriptionJob"] == 2 # the second start failed with ConflictException, the job was waited for
@@ -0,0 +1,106 @@
+# Incremental Wikipedia refresh: the keyword manifest, conditional GETs and rewriting only changed pages
+import json
+import pytest
+from benchmarks.stand_ins import WikiStandIn
+from data_download import wiki_data, html_extract
+from data_download.downloader import KeywordResult
+from data_download.manifest import KeywordManifest, manifest_key
+from data_download.shards import ShardStore
+from data_download.wiki_data import WikiData
+
+BUCKET = "bucket"
+KEYWORDS = "clm/keywords/"
+DATA = "clm/training_data/"
+
+@pytest.fixture
+def wiki(s3, monkeypatch):
+    # sentences are not what is tested here, paragraphs are parsed without the NLTK sentence tokenizer
+    monkeypatch.setattr(wiki_data, "parse_page", lambda keyword, html: html_extract.paragraphs(html))
+    server = WikiStandIn(paragraphs=3, words_per_paragraph=20)
+    yield server
+    server.close()
+
+def result(keyword, status, headers=None):
+    result = KeywordResult(keyword)
+    result.url, result.status, result.headers = "https://wiki/" + keyword, status, headers or {}
+    return result
+
+def test_needs_refresh():
+    manifest = KeywordManifest()
+    assert manifest.needs_refresh("Cell", 3600) # never fetched
+    manifest.record(result("Cell", "ok", {"etag": '"1"'}), "hash")
+    fetched = manifest.get("Cell")["fetched_at"]
+    assert not manifest.needs_refresh("Cell", 3600, now=fetched + 3599)
+    assert manifest.needs_refresh("Cell", 3600, now=fetched + 3600)
+    manifest.record(result("Gone", "failed"))
+    assert manifest.needs_refresh("Gone", 3600) # failed downloads are tried again on the next run
+
+def test_record_and_conditional_headers():
+    manifest = KeywordManifest()
+    manifest.record(result("Cell", "ok", {"etag": '"1"', "last-modified": "Mon, 01 Jan 2024 00:00:00 GMT"}), "hash-1")
+    assert manifest.conditional_headers("Cell") == {"If-None-Match": '"1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    manifest.record(result("Cell", "not_modified", {"etag": '"2"'})) # the stored copy and its ETag are still valid
+    assert manifest.get("Cell")["etag"] == '"1"' and manifest.unchanged("Cell", "hash-1")
+    manifest.record(result("Missing", "not_found"))
+    assert manifest.conditional_headers("Missing") == {} and manifest.conditional_headers("Unknown") == {}
+
+def run(s3, wiki, refresh_after):
+    data = WikiData(refresh_after=refresh_after, base_url=wiki.base_url, backoff_base=0.001)
+    results = data.download_data(BUCKET, DATA, KEYWORDS)
+    return data, dict((r.keyword, r.status) for r in results)
+
+def stored_texts():
+    return dict(ShardStore(BUCKET, DATA).load().iter_texts())
+
+def data_objects(s3):
+    return dict((key, body) for (bucket, key), body in s3.objects.items() if key.startswith(DATA))
+
+def test_first_run_with_an_empty_manifest(s3, wiki):
+    s3.put(BUCKET, KEYWORDS + "keywords.txt", "Cell biology, Mitochondrion\nRibosome")
+    s3.put(BUCKET, KEYWORDS + "learned_keywords.txt", "Ribosome, Enzyme")
+    data, statuses = run(s3, wiki, 3600)
+    assert statuses == {"Cell_biology": "ok", "Mitochondrion": "ok", "Ribosome": "ok", "Enzyme": "ok"} # requested once each
+    assert wiki.requests == 4
+    assert data.keywords_by_file == {"keywords.txt": ["Cell_biology", "Mitochondrion", "Ribosome"], "learned_keywords.txt": ["Ribosome", "Enzyme"]}
+    assert sorted(stored_texts()) == ["Cell_biology", "Enzyme", "Mitochondrion", "Ribosome"]
+    manifest = json.loads(s3.get(BUCKET, manifest_key(DATA)))["keywords"]
+    assert all(entry["status"] == "ok" and entry["etag"] and entry["sha256"] for entry in manifest.values())
+
+def test_recent_keywords_are_not_requested(s3, wiki):
+    s3.put(BUCKET, KEYWORDS + "keywords.txt", "Cell biology, Mitochondrion")
+    run(s3, wiki, 3600)
+    requests = wiki.requests
+    assert run(s3, wiki, 3600)[1] == {}
+    assert wiki.requests == requests
+    # a keyword learned since is downloaded on its own
+    s3.put(BUCKET, KEYWORDS + "learned_keywords.txt", "Ribosome")
+    assert run(s3, wiki, 3600)[1] == {"Ribosome": "ok"}
+    assert sorted(stored_texts()) == ["Cell_biology", "Mitochondrion", "Ribosome"]
+
+def test_unchanged_pages_answer_not_modified(s3, wiki):
+    s3.put(BUCKET, KEYWORDS + "keywords.txt", "Cell biology, Mitochondrion")
+    run(s3, wiki, 3600)
+    objects = data_objects(s3)
+    assert run(s3, wiki, 0)[1] == {"Cell_biology": "not_modified", "Mitochondrion": "not_modified"}
+    assert data_objects(s3) == objects # no shard was rewritten
+
+def test_only_changed_pages_are_rewritten(s3, wiki, monkeypatch):
+    s3.put(BUCKET, KEYWORDS + "keywords.txt", "Cell biology, Mitochondrion, Ribosome")
+    run(s3, wiki, 3600)
+    before = stored_texts()
+    page = wiki.page
+    monkeypatch.setattr(wiki, "page", lambda keyword: page(keyword).replace("</body>", "<p>A new paragraph.</p></body>") \
+                        if keyword == "Mitochondrion" else page(keyword))
+    # without its ETag the unchanged Ribosome page is downloaded again, its content hash shows it is the same
+    manifest = KeywordManifest.load(BUCKET, manifest_key(DATA))
+    manifest.entries["Ribosome"]["etag"] = None
+    manifest.save(BUCKET, manifest_key(DATA))
+    written = [] # keywords downloaded into new shards, before the commit moves the rest of their shards
+    commit = ShardStore.commit
+    monkeypatch.setattr(ShardStore, "commit", lambda self: written.extend(self.updates) or commit(self))
+    statuses = run(s3, wiki, 0)[1]
+    assert statuses == {"Cell_biology": "not_modified", "Mitochondrion": "ok", "Ribosome": "unchanged"}
+    assert written == ["Mitochondrion"]
+    after = stored_texts()
+    assert after["Mitochondrion"] == before["Mitochondrion"] + "\nA new paragraph."
+    assert after["Cell_biology"] == before["Cell_biology"] and after["Ribosome"] == before["Ribosome"]
@@ -0,0 +1,188 @@
+# Shared status tracking for Amazon Transcribe jobs and custom language models
+import threading, time, logging
+from concurrent.futures import Future
+from metrics.metrics import METRICS
+
+logger = logging.getLogger()
+
+TERMINAL_STATUSES = ("COMPLETED", "FAILED")
+
+# Jobs usually finish in a fraction of the media duration, so the first poll waits for about that long
+EXPECTED_RTF = 0.5
+
+# Returns seconds to wait before the next status check of a job
+# Before the expected completion time we wait until then, afterwards the interval grows with elapsed time
+def next_interval(elapsed, media_duration=None, min_interval=5, max_interval=60, growth=0.2):
+    interval = elapsed * growth
+    if media_duration:
+        expected = media_duration * EXPECTED_RTF
+        if elapsed < expected: interval = expected - elapsed
+    return min(max(interval, min_interval), max_interval)
+
+# Raised to callers waiting on a job when the poller is stopped, e.g. when a run is interrupted
+class PollerStopped(Exception):
+    pass
+
+# Status of a single tracked job or model
+class TrackedJob:
+    def __init__(self, name, kind, name_filter, media_duration, min_interval, max_interval):
+        self.name = name
+        self.kind = kind
+        self.name_filter = name_filter
+        self.media_duration = media_duration
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.started = time.time()
+        self.next_poll = self.started + next_interval(0, media_duration, min_interval, max_interval)
+        self.status = None
+        self.queued = None # seconds until the job left the QUEUED status, when it was seen queued
+        self.missing = 0
+        self.future = Future()
+
+    # schedules the next status check of this job
+    def reschedule(self, now):
+        self.next_poll = now + next_interval(now - self.started, self.media_duration, self.min_interval, self.max_interval)
+
+# Class that polls many jobs at once with list calls filtered by a shared name prefix (e.g. the master uuid)
+# and wakes up waiting callers through futures
+class JobPoller:
+    # a job missing from this many listings in a row is checked with a direct describe call
+    MAX_MISSING = 3
+
+    def __init__(self, client, min_interval=5, max_interval=60, model_min_interval=60, model_max_interval=300):
+        self.client = client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.model_min_interval = model_min_interval
+        self.model_max_interval = model_max_interval
+        self.jobs = {}
+        self.api_calls = 0
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+    # starts tracking a transcription job, returns a future with its final status
+    def track_transcription_job(self, job_name, name_filter=None, media_duration=None):
+        return self.__track(job_name, "job", name_filter, media_duration, self.min_interval, self.max_interval)
+
+    # starts tracking a custom language model, returns a future with its final status
+    def track_language_model(self, model_name, name_filter=None):
+        return self.__track(model_name, "model", name_filter, None, self.model_min_interval, self.model_max_interval)
+
+    # blocks until a transcription job is finished and returns its final status
+    def wait_transcription_job(self, job_name, name_filter=None, media_duration=None):
+        return self.track_transcription_job(job_name, name_filter, media_duration).result()
+
+    # blocks until a custom language model is finished and returns its final status
+    def wait_language_model(self, model_name, name_filter=None):
+        return self.track_language_model(model_name, name_filter).result()
+
+    # stops the polling thread; callers waiting on jobs still tracked, or tracked later, get PollerStopped
+    # the jobs themselves keep running in Transcribe and are reattached by --resume
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            tracked = list(self.jobs.values())
+            self.jobs = {}
+            self.condition.notify_all()
+        for job in tracked:
+            job.future.set_exception(PollerStopped(job.name))
+
+    def __track(self, name, kind, name_filter, media_duration, min_interval, max_interval):
+        with self.condition:
+            if self.stopped:
+                future = Future()
+                future.set_exception(PollerStopped(name))
+                return future
+            key = (kind, name)
+            if key not in self.jobs:
+                self.jobs[key] = TrackedJob(name, kind, name_filter or name, media_duration, min_interval, max_interval)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.__loop, name="job-poller", daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+            return self.jobs[key].future
+
+    # polling loop, runs on its own thread
+    def __loop(self):
+        while True:
+            with self.condition:
+                while not self.stopped:
+                    now = time.time()
+                    due = [job for job in self.jobs.values() if job.next_poll <= now]
+                    if due: break
+                    wait = min([job.next_poll for job in self.jobs.values()], default=now + self.max_interval) - now
+                    self.condition.wait(timeout=wait)
+                if self.stopped: return
+                # one list call covers every tracked job sharing the filter of a due job
+                groups = set((job.kind, job.name_filter) for job in due)
+            for kind, name_filter in groups:
+                try:
+                    statuses = self.list_statuses(kind, name_filter)
+                except Exception as e:
+                    logger.warning("status listing for " + name_filter + " failed: " + str(e))
+                    statuses = None
+                self.__update(kind, name_filter, statuses)
+
+    # returns {name: status} for all jobs ("job") or models ("model") matching a name filter
+    def list_statuses(self, kind, name_filter):
+        statuses = {}
+        kwargs = {}
+        while True:
+            self.api_calls += 1
+            if kind == "job":
+                response = self.client.list_transcription_jobs(JobNameContains=name_filter, MaxResults=100, **kwargs)
+                for summary in response.get("TranscriptionJobSummaries", []):
+                    statuses[summary["TranscriptionJobName"]] = summary["TranscriptionJobStatus"]
+            else:
+                response = self.client.list_language_models(NameContains=name_filter, MaxResults=100, **kwargs)
+                for model in response.get("Models", []):
+                    statuses[model["ModelName"]] = model["ModelStatus"]
+            if not response.get("NextToken"): break
+            kwargs["NextToken"] = response["NextToken"]
+        return statuses
+
+    # returns the status of a single job or model with a describe call
+    def __describe_status(self, job):
+        self.api_calls += 1
+        if job.kind == "job":
+            response = self.client.get_transcription_job(TranscriptionJobName=job.name)
+            return response["TranscriptionJob"]["TranscriptionJobStatus"]
+        response = self.client.describe_language_model(ModelName=job.name)
+        return response["LanguageModel"]["ModelStatus"]
+
+    # applies listed statuses to tracked jobs and resolves the finished ones
+    def __update(self, kind, name_filter, statuses):
+        with self.condition:
+            group = [job for job in self.jobs.values() if job.kind == kind and job.name_filter == name_filter]
+        now = time.time()
+        for job in group:
+            status = statuses.get(job.name) if statuses is not None else None
+            if status is None:
+                # newly started jobs can take a moment to show up in listings
+                job.missing += 1
+                if job.missing >= self.MAX_MISSING:
+                    try:
+                        status = self.__describe_status(job)
+                    except Exception as e:
+                        if self.__untrack(job): job.future.set_exception(e)
+                        continue
+            if status is not None:
+                job.missing = 0
+                if status != job.status: logger.info(job.name + ": " + status)
+                if job.status == "QUEUED" and status != "QUEUED":
+                    # time spent in the Transcribe queue, measured to the first poll that saw the job leave it
+                    job.queued = now - job.started
+                    METRICS.observe("transcribe_queue", job.queued, job.started, job=job.name)
+                job.status = status
+            if job.status in TERMINAL_STATUSES:
+                if not self.__untrack(job): continue
+                METRICS.observe("transcribe_" + job.kind + "_wait", now - job.started, job.started, job=job.name)
+                job.future.set_result(job.status)
+            else:
+                job.reschedule(now)
+
+    # stops tracking a finished job, False if stop() already resolved it
+    def __untrack(self, job):
+        with self.condition:
+            return self.jobs.pop((job.kind, job.name), None) is not None
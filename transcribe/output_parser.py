@@ -0,0 +1,150 @@
+# Streaming extraction of transcripts (and optionally word timings) from Amazon Transcribe output JSON
+# The document is read in chunks and only the values we need are decoded, without building the full object tree
+import json, re, codecs
+from concurrent.futures import ThreadPoolExecutor
+from aws.clients import get_client
+
+CHUNK_SIZE = 64 * 1024
+STRING_END = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+SCALAR_END = re.compile(r'[\s,}\]]')
+WHITESPACE = re.compile(r'\s*')
+TRANSCRIPTS_PATH = ("results", "transcripts")
+ITEMS_PATH = ("results", "items")
+
+# Raised internally when the buffer ends in the middle of a token
+class _NeedMoreData(Exception):
+    pass
+
+# Class that walks a JSON document chunk by chunk, keeping only a stack of the keys leading to the current value
+class TranscribeOutputParser:
+    def __init__(self, include_items=False):
+        self.include_items = include_items
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.stack = [] # [kind, key]: kind "o" (object, key is the current key) or "a" (array)
+        self.expect_key = False
+        self.transcripts = None
+        self.items = [] if include_items else None
+        self.items_done = False
+
+    # True once everything asked for was read, the rest of the document can be skipped
+    def done(self):
+        if self.transcripts is None: return False
+        return not self.include_items or self.items_done
+
+    def path(self):
+        return tuple(entry[1] for entry in self.stack if entry[0] == "o")
+
+    # adds decoded text and parses as far as possible
+    def feed(self, text):
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        try:
+            while not self.done():
+                self.__step()
+        except _NeedMoreData:
+            pass
+
+    def __step(self):
+        buffer = self.buffer
+        self.pos = WHITESPACE.match(buffer, self.pos).end()
+        if self.pos >= len(buffer): raise _NeedMoreData()
+        c = buffer[self.pos]
+        top = self.stack[-1] if self.stack else None
+        in_value = top is None or (top[0] == "o" and not self.expect_key) or (top[0] == "a" and c not in "],")
+        if in_value and c not in ":,}]" and self.__capture():
+            return
+        if c == "{":
+            self.stack.append(["o", None])
+            self.expect_key = True
+            self.pos += 1
+        elif c == "[":
+            self.stack.append(["a", None])
+            self.expect_key = False
+            self.pos += 1
+        elif c in "}]":
+            entry = self.stack.pop()
+            if entry[0] == "a" and self.include_items and self.path() == ITEMS_PATH: self.items_done = True
+            self.expect_key = False
+            self.pos += 1
+        elif c == ",":
+            self.expect_key = top is not None and top[0] == "o"
+            self.pos += 1
+        elif c == ":":
+            self.expect_key = False
+            self.pos += 1
+        elif c == '"':
+            match = STRING_END.match(buffer, self.pos + 1)
+            if match is None: raise _NeedMoreData()
+            if self.expect_key:
+                top[1] = json.loads(buffer[self.pos:match.end()])
+            self.pos = match.end()
+        else: # number, true, false or null
+            match = SCALAR_END.search(buffer, self.pos)
+            if match is None: raise _NeedMoreData()
+            self.pos = match.start()
+
+    # decodes a value we are interested in, returns True if it was consumed
+    def __capture(self):
+        top = self.stack[-1] if self.stack else None
+        path = self.path()
+        wanted_transcripts = self.transcripts is None and top is not None and top[0] == "o" and path == TRANSCRIPTS_PATH
+        wanted_item = self.include_items and top is not None and top[0] == "a" and path == ITEMS_PATH
+        if not (wanted_transcripts or wanted_item): return False
+        try:
+            value, end = self.decoder.raw_decode(self.buffer, self.pos)
+        except json.JSONDecodeError:
+            raise _NeedMoreData()
+        if end == len(self.buffer) and not isinstance(value, (dict, list, str)):
+            raise _NeedMoreData() # a number could continue in the next chunk
+        self.pos = end
+        if wanted_transcripts:
+            self.transcripts = value
+        else:
+            self.items.append(word_from_item(value))
+        return True
+
+    def transcript(self):
+        if not self.transcripts: return None
+        return self.transcripts[0]["transcript"]
+
+# Returns a compact word entry from an output item
+def word_from_item(item):
+    best = item.get("alternatives", [{}])[0]
+    confidence = best.get("confidence")
+    return {
+        "content": best.get("content"),
+        "confidence": float(confidence) if confidence not in (None, "") else None,
+        "start_time": float(item["start_time"]) if "start_time" in item else None,
+        "end_time": float(item["end_time"]) if "end_time" in item else None,
+        "type": item.get("type")
+    }
+
+# Parses an output JSON from a file-like object (e.g. an S3 streaming body) in chunks
+# returns (transcript, words); words is None unless include_items, then a list of
+# {"content", "confidence", "start_time", "end_time", "type"}
+def parse_output(stream, include_items=False, chunk_size=CHUNK_SIZE):
+    parser = TranscribeOutputParser(include_items)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while not parser.done():
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            parser.feed(decoder.decode(b"", final=True))
+            break
+        parser.feed(decoder.decode(chunk))
+    if parser.transcripts is None: raise ValueError("no results.transcripts in Transcribe output")
+    return parser.transcript(), parser.items
+
+# Reads an output JSON from S3, only as far as needed
+def read_output(bucket, key, include_items=False, chunk_size=CHUNK_SIZE):
+    body = get_client('s3').get_object(Bucket=bucket, Key=key)["Body"]
+    try:
+        return parse_output(body, include_items, chunk_size)
+    finally:
+        body.close() # stops the download when the rest of the document is not needed
+
+# Reads many output JSONs concurrently, returns their (transcript, words) in the order of locations
+def read_outputs(locations, include_items=False, max_workers=16):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda location: read_output(location[0], location[1], include_items), locations))
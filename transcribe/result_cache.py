@@ -0,0 +1,121 @@
+# Content-addressed cache of transcription outputs, keyed by media content and transcription settings
+import json, time, hashlib, threading, logging
+from concurrent.futures import Future
+from aws.clients import get_client
+
+logger = logging.getLogger()
+
+# Splits an s3://bucket/key uri
+def split_s3_uri(uri):
+    bucket, key = uri[len("s3://"):].split("/", 1)
+    return bucket, key
+
+# Class that maps (media ETag and size, model, language, settings) to the S3 location of an output JSON,
+# so the same audio under another folder or prefix is not transcribed again
+# Entries expire after ttl seconds; beyond max_entries the least recently used ones are evicted
+# A media file being transcribed is claimed, so concurrent jobs on the same media wait for it instead of starting their own
+class TranscriptionCache:
+    def __init__(self, bucket, key, ttl=None, max_entries=None):
+        self.bucket = bucket
+        self.key = key
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.inflight = {} # cache key -> Future of its owner, resolved when it stores a result or releases its claim
+
+    # loads the cache index from S3, an empty cache if there is none yet
+    def load(self):
+        s3_client = get_client('s3')
+        try:
+            body = s3_client.get_object(Bucket=self.bucket, Key=self.key)["Body"].read()
+            self.entries = json.loads(body.decode('utf-8'))
+        except s3_client.exceptions.NoSuchKey:
+            self.entries = {}
+        self.evict()
+        return self
+
+    def save(self):
+        self.evict()
+        with self.lock:
+            body = json.dumps(self.entries, separators=(",", ":"))
+        get_client('s3').put_object(Body=body, Bucket=self.bucket, Key=self.key)
+
+    # returns the cache key of a media file transcribed with a model ("ST" for standard Transcribe)
+    def media_key(self, mediaS3, model, language, settings=None):
+        bucket, key = split_s3_uri(mediaS3)
+        head = get_client('s3').head_object(Bucket=bucket, Key=key)
+        content = {"etag": head["ETag"], "size": head["ContentLength"], "model": model, "language": language, "settings": settings or {}}
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    # returns (bucket, key) of a cached output JSON, None on a miss
+    def lookup(self, cache_key):
+        with self.lock:
+            return self.__lookup(cache_key)
+
+    def __lookup(self, cache_key):
+        entry = self.entries.get(cache_key)
+        if entry is not None and self.ttl is not None and time.time() - entry["created"] > self.ttl:
+            del self.entries[cache_key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry["used"] = time.time()
+        return entry["bucket"], entry["key"]
+
+    # like lookup, but on a miss the caller owns the transcription of the media and must call store() or release();
+    # if another caller already owns it, waits for its result; if it released its claim, one of the waiting callers
+    # becomes the owner and the others keep waiting
+    def claim(self, cache_key):
+        waited = False
+        while True:
+            with self.lock:
+                if waited: self.misses -= 1 # a claim is counted once, by its last lookup
+                location = self.__lookup(cache_key)
+                if location: return location
+                waiter = self.inflight.get(cache_key)
+                if waiter is None:
+                    self.inflight[cache_key] = Future()
+                    return None
+            waiter.result()
+            waited = True
+
+    # records where the output JSON of a transcription is stored
+    def store(self, cache_key, bucket, key):
+        now = time.time()
+        with self.lock:
+            self.entries[cache_key] = {"bucket": bucket, "key": key, "created": now, "used": now}
+            waiter = self.inflight.pop(cache_key, None)
+        if waiter: waiter.set_result((bucket, key))
+
+    # gives up a claim without a result, e.g. when the transcription failed
+    def release(self, cache_key):
+        with self.lock:
+            waiter = self.inflight.pop(cache_key, None)
+        if waiter: waiter.set_result(None)
+
+    # forgets an entry, e.g. when its output JSON was deleted; the lookup is counted as a miss
+    def invalidate(self, cache_key):
+        with self.lock:
+            if self.entries.pop(cache_key, None) is not None:
+                self.hits -= 1
+                self.misses += 1
+
+    # drops expired entries and the least recently used ones beyond max_entries
+    def evict(self):
+        with self.lock:
+            if self.ttl is not None:
+                now = time.time()
+                for cache_key in [k for k, e in self.entries.items() if now - e["created"] > self.ttl]:
+                    del self.entries[cache_key]
+            if self.max_entries is not None and len(self.entries) > self.max_entries:
+                by_use = sorted(self.entries, key=lambda k: self.entries[k]["used"])
+                for cache_key in by_use[:len(self.entries) - self.max_entries]:
+                    del self.entries[cache_key]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
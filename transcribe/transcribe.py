@@ -1,61 +1,114 @@
 # all transcribe functions
-import boto3, uuid, json, time
+import uuid, time, threading, logging
+from concurrent.futures import Future
+from aws.clients import get_client, get_admission
+from transcribe.job_poller import JobPoller, PollerStopped
+from transcribe.output_parser import read_output
+
+logger = logging.getLogger()
 
 # reads Amazon Transcribe output (json file) from an S3 bucket location and returns transcription
+# The body is streamed and parsing stops after the transcript, so large outputs with word items are not loaded whole
 def getTranscribe(outBucket, outKey):
-    my_session = boto3.session.Session()
-    my_region = my_session.region_name
-    
-    s3client = boto3.client(
-        's3',
-        region_name = my_region
-    )
-    #Create a file object using the bucket and object key. 
-    fileobj = s3client.get_object(
-        Bucket=outBucket,
-        Key=outKey
-        ) 
-    # open the file object and read it into the variable filedata. 
-    filedata = fileobj['Body'].read()
-    # file data will be a binary stream.  We have to decode it 
-    contents = filedata.decode('utf-8') 
-    # Once decoded, you can treat the file as plain text if appropriate 
-    return json.loads(contents)["results"]["transcripts"][0]['transcript']
+    return read_output(outBucket, outKey)[0]
 
+# Raised when a transcription job ends FAILED
+class TranscriptionJobFailed(Exception):
+    pass
 
+
+# name_filter is a name part shared by all jobs of a run (e.g. the master uuid), used to poll their status together
+# With resume, jobs and models that already exist under their deterministic names are reattached instead of started again
+# cache is an optional TranscriptionCache, media already transcribed with the same model is then not transcribed again
+# poll_options (min_interval, max_interval, ...) are passed to the JobPoller created when no poller is given
 class Transcribe:
-    def __init__(self):
+    def __init__(self, name_filter=None, poller=None, resume=False, cache=None, poll_options=None):
         self.clm_model_name = None
+        # boto3 clients are thread-safe, so one client is shared by all concurrent transcription jobs
+        self.client = get_client('transcribe')
+        self.name_filter = name_filter
+        self.poller = poller if poller else JobPoller(self.client, **(poll_options or {}))
+        self.resume = resume
+        self.existing = {} # kind -> {name: status} of jobs and models found when resuming
+        self.existing_lock = threading.Lock()
+        self.cache = cache
+        # jobs wait here so that at most AWS['concurrency_limits']['transcription_jobs'] (config.py) run at the same time
+        self.admission = get_admission("transcription_jobs")
+
+    # Stops waiting for jobs, e.g. when a run is interrupted: waiting callers get PollerStopped and no new job is started
+    def stop(self):
+        self.poller.stop()
+
+    # Waits in the admission queue, then starts a job (unless it exists already) and waits until it is finished
+    # Raises TranscriptionJobFailed if the job failed
+    def __run_job(self, jobName, status, start, *args, media_duration=None):
+        with self.admission:
+            if self.poller.stopped: raise PollerStopped(jobName)
+            if not status: self.__start(start, jobName, *args)
+            status = self.poller.wait_transcription_job(jobName, self.name_filter, media_duration)
+        if status != "COMPLETED":
+            try:
+                reason = self.client.get_transcription_job(TranscriptionJobName=jobName)["TranscriptionJob"].get("FailureReason")
+            except Exception:
+                reason = None
+            raise TranscriptionJobFailed(jobName + " " + status.lower() + (": " + reason if reason else ""))
+        return status
+
+    # Returns the cached transcription of a media file (None on a miss) and its cache key
+    def __cached(self, mediaS3, model, langCode='en-US'):
+        if self.cache is None: return None, None
+        cache_key = self.cache.media_key(mediaS3, model, langCode)
+        location = self.cache.claim(cache_key)
+        if location:
+            try:
+                return getTranscribe(*location), None
+            except get_client('s3').exceptions.NoSuchKey: # output JSON was deleted
+                self.cache.invalidate(cache_key)
+        return None, cache_key
+
+    # Returns the status of an existing job ("job") or model ("model") when resuming, None if it has to be started
+    # All statuses of the run are listed once; a failed job is deleted so it can be started again under its name
+    def __existing_status(self, kind, name):
+        if not self.resume: return None
+        with self.existing_lock:
+            if kind not in self.existing:
+                self.existing[kind] = self.poller.list_statuses(kind, self.name_filter or name)
+        status = self.existing[kind].get(name)
+        if status == "FAILED":
+            if kind == "job":
+                self.client.delete_transcription_job(TranscriptionJobName=name)
+            else:
+                self.client.delete_language_model(ModelName=name)
+            return None
+        if status: logger.info("resuming " + name + ": " + status)
+        return status
         
-    # Trains a custom language model
-    def __train_clm(self, training_data_s3, role_arn, uuid):
-        client = boto3.client('transcribe')
-        my_uuid = uuid #str(uuid.uuid4())
-        model_name = 'clm-model-' + my_uuid
-        self.clm_model_name = model_name
+    # Starts a job with start(*args); a conflict means an earlier attempt of a retried call already started it
+    def __start(self, start, jobName, *args):
+        try:
+            start(*args)
+        except self.client.exceptions.ConflictException:
+            logger.info(jobName + " already started")
+
+    # Trains a custom language model on base_model ("WideBand" or "NarrowBand"), optionally with tuning data
+    def __train_clm(self, model_name, training_data_s3, role_arn, base_model='WideBand', tuning_data_s3=None):
+        client = self.client
+        input_data_config = {
+            'S3Uri': training_data_s3, # location of training data
+            'DataAccessRoleArn': role_arn #IAM execution role
+        }
+        if tuning_data_s3: input_data_config['TuningDataS3Uri'] = tuning_data_s3 # optional tuning data
         response = client.create_language_model(
             LanguageCode='en-US',
-            BaseModelName='WideBand',
+            BaseModelName=base_model,
             ModelName=model_name, # give a unique name to your model
-            InputDataConfig={
-                'S3Uri': training_data_s3, # location of training data
-                #'TuningDataS3Uri': 's3://sample-bucket-1/tune', #optional tuning data
-                'DataAccessRoleArn': role_arn #IAM execution role
-            }
+            InputDataConfig=input_data_config
     )
         
-    # Checks training status
-    def __check_clm_status(self):
-        client = boto3.client('transcribe')
-        status = client.describe_language_model(
-            ModelName=self.clm_model_name
-        )
-        return status["LanguageModel"]['ModelStatus']
-    
     # Method to call Transcribe's custom language model (CLM), when a trained custom language model is already available
     def __clmTranscribe(self, mediaS3, outBucket, outKey, jobName, clmModelName, langCode='en-US'):
         # Start transcription
-        client = boto3.client('transcribe')
+        client = self.client
         response = client.start_transcription_job(
             TranscriptionJobName = jobName,
             LanguageCode = langCode, #'en-US'
@@ -71,7 +124,7 @@ class Transcribe:
         
     # Method to call the standard Transcribe service
     def __standardTranscribe(self, mediaS3, outBucket, outKey, jobName, langCode='en-US'):
-        client = boto3.client('transcribe')
+        client = self.client
         # Start transcription
         response = client.start_transcription_job(
             TranscriptionJobName = jobName,
@@ -84,57 +137,76 @@ class Transcribe:
     )
         
     # Given a media file (mp3, mp4), runs Amazon Transcribe and returns transcription text
-    def get_standard_transcribe_text(self, mediaS3, outBucket, outPrefix, uuid):
-        client = boto3.client('transcribe')
-        # run standard transcription
-        my_uuid = uuid
-        jobName = "st-job-" + my_uuid
-        if outPrefix[-1]!="/": outPrefix = outPrefix + "/"
-        outKey = outPrefix + "st-" + my_uuid + ".json"
-        self.__standardTranscribe(mediaS3, outBucket, outKey, jobName)
+    # media_duration (seconds) is optional and only used to decide when to check the job status
+    def get_standard_transcribe_text(self, mediaS3, outBucket, outPrefix, uuid, media_duration=None):
+        text, cache_key = self.__cached(mediaS3, "ST")
+        if text is not None: return text
+        try:
+            # run standard transcription
+            my_uuid = uuid
+            jobName = "st-job-" + my_uuid
+            if outPrefix[-1]!="/": outPrefix = outPrefix + "/"
+            outKey = outPrefix + "st-" + my_uuid + ".json"
+            status = self.__existing_status("job", jobName)
+            if status != "COMPLETED":
+                status = self.__run_job(jobName, status, self.__standardTranscribe, mediaS3, outBucket, outKey, jobName, \
+                                        media_duration=media_duration)
         
-        # return standard transcription text
-        status = client.get_transcription_job(TranscriptionJobName = jobName)['TranscriptionJob']['TranscriptionJobStatus']
-        print(status)
-        while status != "COMPLETED" and status != "FAILED":
-            time.sleep(60)
-            status = client.get_transcription_job(TranscriptionJobName = jobName)['TranscriptionJob']['TranscriptionJobStatus']
-            print(status)
-        return getTranscribe(outBucket, outKey)
+            # return standard transcription text
+            logger.debug(jobName + ": " + status)
+            text = getTranscribe(outBucket, outKey)
+            if cache_key: self.cache.store(cache_key, outBucket, outKey)
+            return text
+        except BaseException:
+            if cache_key: self.cache.release(cache_key) # lets jobs waiting on the same media transcribe it themselves
+            raise
     
+    # Starts training a CLM named model_name and returns a future with its final status, without waiting for it
+    # Models of a run share the name filter, so all models trained at the same time are tracked with one list call
+    def start_clm_training(self, model_name, training_data_s3, role_arn, base_model='WideBand', tuning_data_s3=None):
+        status = self.__existing_status("model", model_name)
+        if not status: self.__start(self.__train_clm, model_name, model_name, training_data_s3, role_arn, base_model, tuning_data_s3)
+        if status == "COMPLETED":
+            future = Future()
+            future.set_result(status)
+            return future
+        return self.poller.track_language_model(model_name, self.name_filter)
+
     # Train a CLM Model
     def train_clm(self, training_data_s3, role_arn, uuid):
-        self.__train_clm(training_data_s3, role_arn, uuid)
-        status = self.__check_clm_status()
-        while status != "COMPLETED" and status != "FAILED":
-            time.sleep(90)
-            status = self.__check_clm_status()
-            print(status)
+        self.clm_model_name = 'clm-model-' + uuid
+        status = self.start_clm_training(self.clm_model_name, training_data_s3, role_arn).result()
+        logger.info(self.clm_model_name + ": " + status)
         clmModelName = self.clm_model_name
         return clmModelName
         
     # Given a media file (mp3, mp4), runs a custom language model (CLM) and returns transcription text
     # If clmModelName is None, it will first train a CLM model using the training_data_s3 location and then runs it
-    def get_clm_transcribe_text(self, mediaS3, outBucket, outPrefix, uuid, clmModelName=None, training_data_s3=None, role_arn=None):
-        client = boto3.client('transcribe')
+    def get_clm_transcribe_text(self, mediaS3, outBucket, outPrefix, uuid, clmModelName=None, training_data_s3=None, role_arn=None, media_duration=None):
         # build CLM model if needed
         if not clmModelName: # if clmModelName is None
             clmModelName = self.train_clm(training_data_s3, role_arn, uuid)
-        # run CLM transcription
-        my_uuid = uuid
-        jobName = "clm-job-" + my_uuid
-        if outPrefix[-1]!="/": outPrefix = outPrefix + "/"
-        outKey = outPrefix + "clm-" + my_uuid + ".json"
-        self.__clmTranscribe(mediaS3, outBucket, outKey, jobName, clmModelName)
+        text, cache_key = self.__cached(mediaS3, clmModelName)
+        if text is not None: return text, clmModelName
+        try:
+            # run CLM transcription
+            my_uuid = uuid
+            jobName = "clm-job-" + my_uuid
+            if outPrefix[-1]!="/": outPrefix = outPrefix + "/"
+            outKey = outPrefix + "clm-" + my_uuid + ".json"
+            status = self.__existing_status("job", jobName)
+            if status != "COMPLETED":
+                status = self.__run_job(jobName, status, self.__clmTranscribe, mediaS3, outBucket, outKey, jobName, clmModelName, \
+                                        media_duration=media_duration)
         
-        # return CLM transcroption text
-        status = client.get_transcription_job(TranscriptionJobName = jobName)['TranscriptionJob']['TranscriptionJobStatus']
-        print(status)
-        while status != "COMPLETED" and status != "FAILED":
-            time.sleep(60)
-            status = client.get_transcription_job(TranscriptionJobName = jobName)['TranscriptionJob']['TranscriptionJobStatus']
-            print(status)
-        return getTranscribe(outBucket, outKey), clmModelName
+            # return CLM transcroption text
+            logger.debug(jobName + ": " + status)
+            text = getTranscribe(outBucket, outKey)
+            if cache_key: self.cache.store(cache_key, outBucket, outKey)
+            return text, clmModelName
+        except BaseException:
+            if cache_key: self.cache.release(cache_key) # lets jobs waiting on the same media transcribe it themselves
+            raise
     
     
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
-# Word Error Rate (WER) calculation using asr-evaluation
-import subprocess
+# Word Error Rate (WER) calculation, natively or using asr-evaluation
+import subprocess, tempfile
 import uuid, os
+import numpy as np
 
 # writes texts to a file
 def write_to_file(fn, text):
@@ -24,34 +25,175 @@ def readTextFromFile(fn):
     f.close()
     return text
     
-# Class to calculate word error rate (WER) using open source package asr-evaluation
+# Alignment operations stored in the traceback matrix
+DIAG, DEL, INS = 0, 1, 2
+# Large enough to never be chosen, small enough to not overflow when incremented
+INF = np.iinfo(np.int32).max // 2
+
+# Tokens used by asr-evaluation to mark errors, as they appear in its captured stdout
+BTOKEN, ETOKEN = "\\x1b[31m", "\\x1b[0m"
+
+# Result of a word-level evaluation
+# alignment is a list of (op, ref_word, hyp_word) with op one of "equal", "sub", "del", "ins"
+class WerResult:
+    def __init__(self, alignment, ref_count):
+        self.alignment = alignment
+        self.ref_count = ref_count
+        self.substitutions = sum(1 for op, r, h in alignment if op == "sub")
+        self.deletions = sum(1 for op, r, h in alignment if op == "del")
+        self.insertions = sum(1 for op, r, h in alignment if op == "ins")
+        self.errors = self.substitutions + self.deletions + self.insertions
+        self.wer = 100.0 * self.errors / ref_count if ref_count > 0 else 0.0
+
+    # WER as formatted by asr-evaluation (percent with 3 decimals)
+    def wer_str(self):
+        return "{:.3f}".format(self.wer)
+
+    # reference line with errors marked like asr-evaluation's "REF:" output
+    def ref_str(self):
+        tokens = []
+        for op, r, h in self.alignment:
+            if op == "equal":
+                tokens.append(r)
+            elif op == "del":
+                tokens.append(BTOKEN + r.upper() + ETOKEN)
+            elif op == "ins":
+                tokens.append(BTOKEN + "*" * len(h) + ETOKEN)
+            else:
+                tokens.append(BTOKEN + r.upper().ljust(len(h)) + ETOKEN)
+        return " ".join(tokens)
+
+# Word-level edit distance alignment of two token lists
+# Each DP row is computed with NumPy: substitutions and deletions come from the previous row,
+# insertions (a left-to-right dependency) are resolved with a running minimum.
+# With band set, only cells within band words of the diagonal are computed (an upper bound on the distance).
+def align_words(ref, hyp, band=None):
+    vocab = {}
+    r = np.array([vocab.setdefault(w, len(vocab)) for w in ref], dtype=np.int32)
+    h = np.array([vocab.setdefault(w, len(vocab)) for w in hyp], dtype=np.int32)
+    n, m = len(r), len(h)
+    if band is not None and n > 0:
+        band = max(band, m // n + 1) # neighbouring rows must overlap
+    cols = np.arange(m + 1, dtype=np.int32)
+    prev = cols.copy() # row 0, only insertions
+    rows = []
+    for i in range(1, n + 1):
+        if band is None:
+            lo, hi = 0, m
+        else:
+            center = i * m // n
+            lo, hi = max(0, center - band), min(m, center + band)
+        t = prev[lo:hi + 1] + 1
+        ops = np.full(hi - lo + 1, DEL, dtype=np.uint8)
+        s = max(lo, 1)
+        if s <= hi:
+            sub = prev[s - 1:hi] + (h[s - 1:hi] != r[i - 1])
+            better = sub <= t[s - lo:]
+            t[s - lo:] = np.where(better, sub, t[s - lo:])
+            ops[s - lo:][better] = DIAG
+        k = cols[lo:hi + 1]
+        best = np.minimum.accumulate(t - k) + k
+        ops[best < t] = INS
+        cur = np.full(m + 1, INF, dtype=np.int32)
+        cur[lo:hi + 1] = best
+        rows.append((lo, ops))
+        prev = cur
+
+    alignment = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        if i == 0:
+            op = INS
+        else:
+            lo, ops = rows[i - 1]
+            op = ops[j - lo]
+        if op == DIAG:
+            i, j = i - 1, j - 1
+            alignment.append(("equal" if r[i] == h[j] else "sub", ref[i], hyp[j]))
+        elif op == DEL:
+            i -= 1
+            alignment.append(("del", ref[i], None))
+        else:
+            j -= 1
+            alignment.append(("ins", None, hyp[j]))
+    alignment.reverse()
+    return alignment
+
+# True if a banded alignment is also a minimal one: a path that leaves the band strays more than band words from the
+# diagonal, so it costs at least 2 * band - |m - n| edits and cannot beat an alignment with fewer errors
+def is_exact(alignment, band):
+    n = sum(1 for op, r, h in alignment if r is not None)
+    m = sum(1 for op, r, h in alignment if h is not None)
+    if n == 0: return True
+    band = max(band, m // n + 1) # as widened by align_words
+    return sum(1 for op, r, h in alignment if op != "equal") < 2 * band - abs(m - n)
+
+# Class to calculate word error rate (WER)
+# engine "native" aligns words in-process, "subprocess" runs the asr-evaluation "wer" command (kept for cross-checking)
+# The native alignment keeps one traceback byte per computed cell: with band it computes (2 * band + 1) cells per
+# reference word (about 18 MB for 9k words with the default band, per evaluation running at the same time) and falls back
+# to the full n x m alignment (about 80 MB for 9k x 9k words) only when the banded one may not be minimal;
+# band=None always aligns in full
+DEFAULT_BAND = 1000
+
 class AsrEval:
-    # Token used by asr-evaluation
-    def get_missed_words(ref):
-        TOKEN = "\x1b[31m"
-        
+    def __init__(self, engine="native", band=DEFAULT_BAND):
+        self.engine = engine
+        self.band = band
+
     # calculate WER based on ground-truth and actual transcription text file names
     def get_WER_FN(self, gtFN, transcribeFN):
         gt_text = readTextFromFile(gtFN)
         transcribe_text = readTextFromFile(transcribeFN)
         
         return self.get_WER_REF(gt_text, transcribe_text)
+
+    # evaluates a transcription against ground truth, case-insensitive like wer "-a"
+    # returns a WerResult with WER, substitution/insertion/deletion counts and the word alignment
+    def evaluate(self, gt_text, transcribe_text):
+        gt_words = removePunctAndLB(gt_text).lower().split()
+        tr_words = removePunctAndLB(transcribe_text).lower().split()
+        alignment = align_words(gt_words, tr_words, self.band)
+        if self.band is not None and not is_exact(alignment, self.band):
+            alignment = align_words(gt_words, tr_words)
+        return WerResult(alignment, len(gt_words))
     
     # calculate WER based on ground-truth and actual transcription texts arguments
     # returns WER and sentences along with errors
-    # wer "-a" makes is case-insensitive
-    # wer "-i" prints all individual sentences and their errors
     def get_WER_REF(self, gt_text, transcribe_text):
+        if self.engine == "subprocess":
+            return self.get_WER_REF_subprocess(gt_text, transcribe_text)
+        result = self.evaluate(gt_text, transcribe_text)
+        return result.wer_str(), result.ref_str()
+    
+    # calculate WER based on ground-truth and actual transcription texts arguments
+    # returns WER and sentences
+    def get_WER(self, gt_text, transcribe_text):
+        if self.engine == "subprocess":
+            return self.get_WER_subprocess(gt_text, transcribe_text)
+        result = self.evaluate(gt_text, transcribe_text)
+        return result.wer_str(), result.ref_str()
+
+    # runs the asr-evaluation "wer" command on texts written to a private temporary directory
+    # each text is written as one line, so an empty transcription is an empty sentence (100% WER) and not a missing one (0%)
+    def __run_wer(self, gt_text, transcribe_text, args):
         gt_text = removePunctAndLB(gt_text)
         transcribe_text = removePunctAndLB(transcribe_text)
-        gtFN = "gt.txt"
-        write_to_file(gtFN, gt_text)
-        
-        transcribeFN = "tr.txt"
-        write_to_file(transcribeFN, transcribe_text)
-        
-        result = subprocess.run(["wer", "-a", "-i", gtFN, transcribeFN], stdout=subprocess.PIPE)
-        out = str(result.stdout)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gtFN = os.path.join(tmpdir, "gt.txt")
+            write_to_file(gtFN, gt_text + "\n")
+            
+            transcribeFN = os.path.join(tmpdir, "tr.txt")
+            write_to_file(transcribeFN, transcribe_text + "\n")
+            
+            result = subprocess.run(["wer"] + args + [gtFN, transcribeFN], stdout=subprocess.PIPE)
+        return str(result.stdout)
+    
+    # asr-evaluation version of get_WER_REF
+    # wer "-a" makes is case-insensitive
+    # wer "-i" prints all individual sentences and their errors
+    def get_WER_REF_subprocess(self, gt_text, transcribe_text):
+        out = self.__run_wer(gt_text, transcribe_text, ["-a", "-i"])
 
         start = out.find("WER:")
         end = out.find("%",start)
@@ -60,26 +202,12 @@ class AsrEval:
         start = out.find("REF")
         end = out.find("HYP",start)
         ref = out[start+4:end].strip()
-        
-        os.remove(gtFN)
-        os.remove(transcribeFN)
         return wer.strip(), ref
     
-    # calculate WER based on ground-truth and actual transcription texts arguments
-    # returns WER and sentences
+    # asr-evaluation version of get_WER
     # wer "-a" makes is case-insensitive
-    def get_WER(self, gt_text, transcribe_text):
-        gt_text = removePunctAndLB(gt_text)
-        transcribe_text = removePunctAndLB(transcribe_text)
-        
-        gtFN = "gt.txt"
-        write_to_file(gtFN, gt_text)
-        
-        transcribeFN = "tr.txt"
-        write_to_file(transcribeFN, transcribe_text)
-        
-        result = subprocess.run(["wer", "-a", gtFN, transcribeFN], stdout=subprocess.PIPE)
-        out = str(result.stdout)
+    def get_WER_subprocess(self, gt_text, transcribe_text):
+        out = self.__run_wer(gt_text, transcribe_text, ["-a"])
 
         start = out.find("WER")
         end = out.find("%",start)
@@ -88,9 +216,6 @@ class AsrEval:
         start = out.find("REF")
         end = out.find("HYP",start)
         ref = out[start+4:end].strip()
-        
-        os.remove(gtFN)
-        os.remove(transcribeFN)
         return wer.strip(), ref
         
 if __name__ == "__main__":
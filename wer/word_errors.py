@@ -0,0 +1,92 @@
+# Per-word error analytics computed from a word alignment (see AsrEval.evaluate)
+import threading
+from data_preparation.nltk_resources import ensure
+
+_stopwords = None
+_stopwords_lock = threading.Lock()
+
+# Returns English stopwords as a frozenset, loaded once
+def get_stopwords():
+    global _stopwords
+    with _stopwords_lock:
+        if _stopwords is None:
+            from nltk.corpus import stopwords
+            ensure("stopwords")
+            _stopwords = frozenset(stopwords.words('english'))
+        return _stopwords
+
+# Cleans a word, returns None for words that can't be keywords
+def clean(text):
+    text = text.strip()
+    if "*" in text: return None
+    if text.endswith("."): return None
+    if text.endswith(","): return None
+    if len(text)<3: return None
+    return text.lower()
+
+# Class holding error counts per word: how often it was substituted ("sub"), deleted ("del")
+# or inserted ("ins"), and the reference positions where that happened
+# Substitutions and deletions are counted on the reference word, insertions on the hypothesis word
+class WordErrors:
+    TYPES = ("sub", "del", "ins")
+
+    def __init__(self, counts=None):
+        self.counts = counts or {}
+
+    # builds word errors from an alignment, a list of (op, ref_word, hyp_word)
+    @classmethod
+    def from_alignment(cls, alignment):
+        errors = cls()
+        position = 0
+        for op, ref_word, hyp_word in alignment:
+            if op == "ins":
+                errors.add(hyp_word, op, position)
+            else:
+                if op != "equal": errors.add(ref_word, op, position)
+                position += 1
+        return errors
+
+    # builds word errors from a list of missed words, e.g. the missed_words of a past run
+    @classmethod
+    def from_missed_words(cls, words):
+        errors = cls()
+        for word in words:
+            errors.add(word, "sub", None)
+        return errors
+
+    def add(self, word, error_type, position):
+        word = word.lower()
+        if word not in self.counts:
+            self.counts[word] = {"sub": 0, "del": 0, "ins": 0, "positions": []}
+        entry = self.counts[word]
+        entry[error_type] += 1
+        if position is not None: entry["positions"].append(position)
+
+    # number of times the reference word was not recognized (substituted or deleted)
+    def missed_count(self, word):
+        entry = self.counts.get(word.lower())
+        if entry is None: return 0
+        return entry["sub"] + entry["del"]
+
+    # reference words that were not recognized, cleaned and without stopwords, most missed first
+    def missed_words(self):
+        stop = get_stopwords()
+        words = {}
+        for word in self.counts:
+            count = self.missed_count(word)
+            cleaned = clean(word)
+            if count > 0 and cleaned and cleaned not in stop:
+                words[cleaned] = words.get(cleaned, 0) + count
+        return [word for word, count in sorted(words.items(), key=lambda x: (-x[1], x[0]))]
+
+    # words missed by this transcription that other (e.g. a CLM transcription of the same media) did not miss
+    def fixed_by(self, other):
+        return [word for word in self.missed_words() if other.missed_count(word) == 0]
+
+    # compact form for JSON artifacts: {word: [sub, del, ins, positions]}
+    def to_dict(self):
+        return dict((word, [e["sub"], e["del"], e["ins"], e["positions"]]) for word, e in self.counts.items())
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(dict((word, {"sub": v[0], "del": v[1], "ins": v[2], "positions": v[3]}) for word, v in data.items()))